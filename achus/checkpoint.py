@@ -0,0 +1,129 @@
+import cPickle
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+from oslo.config import cfg
+
+opts = [
+    cfg.StrOpt('run_dir',
+               default=None,
+               help='Directory where the metrics gathered and the pages '
+                    'rendered by each report run are kept, so that failed '
+                    'runs can be resumed (if not set, nothing is kept).'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts)
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+def _digest(value):
+    if isinstance(value, unicode):
+        value = value.encode("utf-8")
+    return hashlib.sha1(value).hexdigest()
+
+
+class Checkpoint(object):
+    """Completed work of a report run.
+
+    Every item (a metric result, a rendered page) is pickled into its own
+    file of the run directory as soon as it is done, written to a
+    temporary file first so that a crash never leaves a truncated item
+    behind.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    @classmethod
+    def for_report(cls, definition, resume=False):
+        """Returns the checkpoint of a report definition.
+
+        The run directory, under 'run_dir', is named after a hash of the
+        definition, so changing the definition starts a new run. Unless
+        resuming, the items of a previous run are discarded.
+        """
+        key = _digest(json.dumps(definition, sort_keys=True, default=str))
+        path = os.path.join(CONF.run_dir, key)
+        if not resume and os.path.isdir(path):
+            shutil.rmtree(path)
+        logger.debug("Report run directory: '%s'" % path)
+        return cls(path)
+
+    def child(self, name):
+        """Returns a checkpoint nested into this one (e.g. for documents)."""
+        return Checkpoint(os.path.join(self.path, _digest(name)))
+
+    def _file(self, kind, name):
+        return os.path.join(self.path, "%s-%s" % (kind, _digest(name)))
+
+    def get(self, kind, name):
+        """Returns a saved item, or None if it was not done."""
+        try:
+            with open(self._file(kind, name), "rb") as f:
+                return cPickle.load(f)
+        except IOError:
+            return None
+
+    def save(self, kind, name, value):
+        path = self._file(kind, name)
+        tmp = "%s.tmp" % path
+        with open(tmp, "wb") as f:
+            cPickle.dump(value, f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, path)
+
+    def discard(self, kind, name):
+        """Removes a saved item, if any."""
+        try:
+            os.unlink(self._file(kind, name))
+        except OSError:
+            pass
+
+    def get_metric(self, title):
+        return self.get("metric", title)
+
+    def save_metric(self, title, metric):
+        self.save("metric", title, metric)
+
+    def get_page(self, title):
+        return self.get("page", title)
+
+    def save_page(self, title, page):
+        self.save("page", title, page)
+
+    def is_done(self):
+        """Whether the run completed and its output files still exist."""
+        filenames = self.get("run", "done")
+        return (filenames is not None and
+                all(os.path.exists(f) for f in filenames))
+
+    def done(self, filenames):
+        """Marks the run as completed, producing 'filenames'."""
+        self.save("run", "done", filenames)
+
+
+class MemoryCheckpoint(Checkpoint):
+    """Same as Checkpoint, but the items are only kept in memory."""
+
+    def __init__(self):
+        self.path = None
+        self.items = {}
+
+    def child(self, name):
+        return MemoryCheckpoint()
+
+    def get(self, kind, name):
+        return self.items.get((kind, name))
+
+    def save(self, kind, name, value):
+        self.items[(kind, name)] = value
+
+    def discard(self, kind, name):
+        self.items.pop((kind, name), None)
@@ -0,0 +1,84 @@
+import sys
+
+from oslo.config import cfg
+
+import achus.collector.gridengine
+import achus.config
+import achus.explain
+import achus.reporter
+
+CONF = cfg.CONF
+
+
+def do_check():
+    """Reports missing columns and recommended indexes on ge_jobs."""
+    collector = achus.collector.gridengine.GECollector()
+
+    columns = collector.get_columns()
+    needed = set(c for idx in (collector.RECOMMENDED_INDEXES.values() +
+                               collector.UNIQUE_INDEXES.values())
+                 for c in idx)
+    missing = sorted(needed.difference(columns))
+    if missing:
+        print("Missing columns in ge_jobs: %s" % ", ".join(missing))
+
+    print("Existing indexes:")
+    for name, idx_columns in sorted(collector.get_indexes().iteritems()):
+        print("  %s (%s)" % (name, ", ".join(idx_columns)))
+
+    missing_indexes = collector.get_missing_indexes()
+    if missing_indexes:
+        print("Missing recommended indexes (use 'create-indexes'):")
+        for name, idx_columns in sorted(missing_indexes.iteritems()):
+            print("  %s (%s)" % (name, ", ".join(idx_columns)))
+    else:
+        print("All recommended indexes are present.")
+
+
+def do_explain():
+    """Runs EXPLAIN on the queries generated by the report definition."""
+    report = achus.reporter.Report()
+    if achus.explain.print_plans(achus.explain.get_plans(report)):
+        return 1
+
+
+def do_create_indexes():
+    """Creates the recommended indexes that are missing."""
+    collector = achus.collector.gridengine.GECollector()
+    missing_indexes = collector.get_missing_indexes()
+    if not missing_indexes:
+        print("All recommended indexes are present.")
+    for name, columns in sorted(missing_indexes.iteritems()):
+        print("Creating index %s (%s)" % (name, ", ".join(columns)))
+        collector.create_index(name, columns)
+
+
+def add_command_parsers(subparsers):
+    parser = subparsers.add_parser("check",
+                                   help="Inspect the accounting schema.")
+    parser.set_defaults(func=do_check)
+
+    parser = subparsers.add_parser("explain",
+                                   help="EXPLAIN the report queries.")
+    parser.set_defaults(func=do_explain)
+
+    parser = subparsers.add_parser("create-indexes",
+                                   help="Create the recommended indexes.")
+    parser.set_defaults(func=do_create_indexes)
+
+
+command_opt = cfg.SubCommandOpt("command",
+                                title="Commands",
+                                help="Available commands",
+                                handler=add_command_parsers)
+
+CONF.register_cli_opt(command_opt)
+
+
+def main():
+    achus.config.parse_args(sys.argv)
+    return CONF.command.func()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,21 @@
+import sys
+
+from oslo.config import cfg
+
+import achus.config
+import achus.loader
+
+CONF = cfg.CONF
+
+
+def main():
+    achus.config.parse_args(sys.argv)
+    loader = achus.loader.AccountingLoader()
+    try:
+        loader.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
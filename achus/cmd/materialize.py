@@ -0,0 +1,35 @@
+import os
+import sys
+
+from oslo.config import cfg
+
+import achus.config
+import achus.materialize
+
+cli_opts = [
+    cfg.BoolOpt('once',
+                default=False,
+                help='Materialize the last period closed and exit, instead '
+                     'of waiting for each period to close.'),
+]
+
+CONF = cfg.CONF
+CONF.register_cli_opts(cli_opts)
+
+
+def main():
+    achus.config.parse_args(sys.argv)
+    os.nice(CONF.materialize.niceness)
+    materializer = achus.materialize.Materializer()
+    if CONF.once:
+        if materializer.materialize(*materializer.last_closed()):
+            return 1
+        return
+    try:
+        materializer.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,17 +3,65 @@ import sys
 from oslo.config import cfg
 
 import achus.config
+import achus.explain
 import achus.reporter
+import achus.watch
+
+cli_opts = [
+    cfg.BoolOpt('explain',
+                default=False,
+                help='Do not run the report, print the SQL statements it '
+                     'would run with their execution plans and costs.'),
+    cfg.BoolOpt('resume',
+                default=False,
+                help='Resume the last run of the report definition, '
+                     'skipping the metrics and pages already done (needs '
+                     'run_dir).'),
+    cfg.BoolOpt('preview',
+                default=False,
+                help='Quickly run the report on a sample of the jobs (see '
+                     'the sample_rate option), with approximate results.'),
+    cfg.BoolOpt('watch',
+                default=False,
+                help='Keep the report of the running period up to date, '
+                     'refreshing it every interval seconds of the [watch] '
+                     'section with the jobs ended since.'),
+]
 
 CONF = cfg.CONF
+CONF.register_cli_opts(cli_opts)
+CONF.import_opt('sample_rate', 'achus.collector.gridengine',
+                group="gecollector")
+CONF.import_opt('run_dir', 'achus.checkpoint')
+
+# Sample rate of the previews if 'sample_rate' is not set
+PREVIEW_SAMPLE_RATE = 100
 
 
 def main():
     achus.config.parse_args(sys.argv)
-    report = achus.reporter.Report()
+    if CONF.preview:
+        if CONF.gecollector.sample_rate <= 1:
+            CONF.set_override("sample_rate", PREVIEW_SAMPLE_RATE,
+                              group="gecollector")
+        # Approximate results must not be resumed by full runs
+        CONF.set_override("run_dir", None)
+    if CONF.watch:
+        try:
+            achus.watch.Watcher().run_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+    report = achus.reporter.Report(resume=CONF.resume)
+    if CONF.explain:
+        if achus.explain.print_plans(achus.explain.get_plans(report)):
+            return 1
+        return
     report.collect()
     report.generate()
+    if report.failures:
+        return 1
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
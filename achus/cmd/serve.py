@@ -0,0 +1,23 @@
+import sys
+
+from oslo.config import cfg
+
+import achus.config
+import achus.service
+
+CONF = cfg.CONF
+
+
+def main():
+    achus.config.parse_args(sys.argv)
+    server = achus.service.ReportServer(achus.service.ReportService())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
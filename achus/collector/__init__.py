@@ -1,10 +1,15 @@
+import datetime
 import functools
+import heapq
 import logging
+import math
 
 from oslo.config import cfg
 
 from achus import exception
 from achus import loadables
+from achus import result
+from achus import utils
 
 opts = [
     cfg.StrOpt('collector_group_by',
@@ -19,7 +24,42 @@ logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
+class Approximate(dict):
+    """Timelines estimated from a sample of the jobs.
+
+    Same as the 'sample_rate' and 'errors' of 'result.MetricResult', used
+    by the metrics whose values are not numbers.
+    """
+
+    def __init__(self, values, errors=None, sample_rate=None):
+        super(Approximate, self).__init__(values)
+        self.errors = errors or {}
+        self.sample_rate = sample_rate
+
+
 class BaseCollector(object):
+    # Keyword arguments passed as they are to the metric functions
+    OPTIONS = ["top", "percentile", "resolution", "fan_out"]
+
+    # Options only taken by some of the metrics: 'percentile' (0-100, 50 by
+    # default) by the distribution metrics, 'resolution' (see RESOLUTIONS)
+    # by the timelines
+    METRIC_OPTIONS = {
+        "percentile": ["wait_time", "runtime"],
+        "resolution": ["occupancy"],
+    }
+
+    # 'fan_out' is taken by all the metrics: it is the field (one of the
+    # FIELD_MAPPING keys) the results are grouped by as well, so that they
+    # are returned keyed by (fan_out value, group_by value) tuples
+
+    # Bucket sizes of the timelines, in seconds
+    RESOLUTIONS = {
+        "minute": 60,
+        "hour": 3600,
+        "day": 86400,
+    }
+
     def _expand_wildcards(self, value_list):
         """Expand wildcards.
 
@@ -130,6 +170,86 @@ class BaseCollector(object):
         r_negate.sort()
         return r, r_negate
 
+    def _sum_by_key(self, keys, values):
+        """Adds up the values sharing the same key into a MetricResult.
+
+        'keys' and 'values' are columns of the same length, as returned
+        by the backend queries.
+        """
+        return result.MetricResult.from_columns(keys, values)
+
+    def _efficiency(self, keys, cpu, wall_clock):
+        """Computes the efficiency (in %) from CPU and WALLCLOCK sums.
+
+        Fallback for backends that cannot compute the ratio by themselves.
+        'cpu' and 'wall_clock' are columns of raw sums (in the same units)
+        aligned with 'keys'. Groups with no WALLCLOCK time get a 0
+        efficiency. No rounding is done, that is up to the renderers.
+        """
+        if not len(keys) == len(cpu) == len(wall_clock):
+            raise exception.CannotComputeEfficiency()
+        return self._sum_by_key(keys, cpu).ratio(
+            self._sum_by_key(keys, wall_clock), 100)
+
+    def _occupancy(self, rows, start, end, step):
+        """Computes the number of busy slots over time (sweep line).
+
+        'rows' is an iterable of (key, start, end, slots) tuples, with the
+        times in epoch seconds, ordered by start time. The time window
+        ['start', 'end') is split into buckets of 'step' seconds, and the
+        result is a dict with the average busy slots of each bucket, by
+        key, as a list of (bucket start, value) pairs.
+
+        Jobs are swept in start order, keeping the ones still running in
+        a heap by end time, so only the running jobs are held in memory.
+        """
+        n = int(math.ceil((end - start) / float(step)))
+        areas = {}
+        running = {}
+
+        def _advance(key, t):
+            """Accumulates the busy slots of 'key' up to time 't'."""
+            busy, t0, heap = running[key]
+            area = areas[key]
+            i = int((t0 - start) // step)
+            while t0 < t:
+                edge = min(start + (i + 1) * step, t)
+                area[i] += busy * (edge - t0)
+                t0 = edge
+                i += 1
+            running[key][1] = t
+
+        def _release(key, t):
+            """Ends the jobs of 'key' finishing not later than 't'."""
+            heap = running[key][2]
+            while heap and heap[0][0] <= t:
+                job_end, slots = heapq.heappop(heap)
+                _advance(key, job_end)
+                running[key][0] -= slots
+
+        for key, job_start, job_end, slots in rows:
+            job_start = max(job_start, start)
+            job_end = min(job_end, end)
+            if job_end <= job_start or not slots:
+                continue
+            if key not in running:
+                running[key] = [0, job_start, []]
+                areas[key] = [0.0] * n
+            _release(key, job_start)
+            _advance(key, job_start)
+            running[key][0] += slots
+            heapq.heappush(running[key][2], (job_end, slots))
+
+        d = {}
+        for key in running:
+            _release(key, end)
+            d[key] = [
+                (utils.format_time(datetime.datetime.fromtimestamp(
+                    start + i * step)),
+                 area / min(step, end - start - i * step))
+                for i, area in enumerate(areas[key])]
+        return d
+
     def _format_conditions(self, **kw):
         raise NotImplementedError
 
@@ -139,12 +259,25 @@ class BaseCollector(object):
     def get_efficiency(self, **kw):
         raise NotImplementedError
 
+    def get_wait_time(self, **kw):
+        raise NotImplementedError
+
+    def get_runtime(self, **kw):
+        raise NotImplementedError
+
+    def get_occupancy(self, **kw):
+        raise NotImplementedError
+
+    def get_statements(self, metric, group_by, **kw):
+        raise NotImplementedError
+
     def group(func):
         """Decorator to organize args and kwargs.
 
         Mandatory arguments will be passed as arguments while
         the optional ones as keyword arguments.
             'group_by': mandatory
+            OPTIONS: as keyword arguments.
             rest of kw: under 'conditions' kw.
         """
         @functools.wraps(func)
@@ -161,6 +294,12 @@ class BaseCollector(object):
             # keyword arguments
             d_kwargs["conditions"] = {}
             for k, v in kw.iteritems():
+                if k == "fan_out" and v:
+                    d_kwargs[k] = self.FIELD_MAPPING[v]
+                    continue
+                if k in self.OPTIONS:
+                    d_kwargs[k] = v
+                    continue
                 try:
                     d_kwargs["conditions"].update({self.FIELD_MAPPING[k]: v})
                 except KeyError:
@@ -176,15 +315,49 @@ class BaseCollector(object):
             return output
         return _group
 
+    def _metric_options(self, metric, kw):
+        """Drops the METRIC_OPTIONS not taken by the metric from 'kw'."""
+        for option, metrics in self.METRIC_OPTIONS.iteritems():
+            if metric not in metrics:
+                kw.pop(option, None)
+
     @group
     def get(self, metric, group_by, **kw):
         METRICS = {
             "cpu": self.get_cpu_time,
             "wallclock": self.get_wall_clock,
             "efficiency": self.get_efficiency,
+            "wait_time": self.get_wait_time,
+            "runtime": self.get_runtime,
+            "occupancy": self.get_occupancy,
         }
+        self._metric_options(metric, kw)
         return METRICS[metric](group_by, **kw)
 
+    def source(self):
+        """Returns what identifies the data the results come from.
+
+        Results of the same call from other sources (e.g. other databases)
+        are other results, see compare.PeriodStore. None if the collector
+        has a single source.
+        """
+        return None
+
+    def get_async(self, pool, metric, group_by, **kw):
+        """Non-blocking variant of 'get'.
+
+        Schedules the call in 'pool' (a 'multiprocessing.pool.ThreadPool')
+        and returns an 'AsyncResult', whose 'get' method waits for the
+        result. Collectors with non-blocking backends can override it.
+        """
+        return pool.apply_async(self.get, (metric, group_by), kw)
+
+    @group
+    def statements(self, metric, group_by, **kw):
+        """Returns the backend queries that 'get' would perform."""
+        self._metric_options(metric, kw)
+        return self.get_statements(metric, group_by, **kw)
+
 
 class CollectorHandler(loadables.BaseLoader):
     def __init__(self):
@@ -0,0 +1,363 @@
+import array
+import collections
+import cPickle
+import datetime
+import itertools
+import logging
+import os
+import re
+import threading
+
+from oslo.config import cfg
+
+from achus import collector
+import achus.collector.gridengine
+from achus import exception
+from achus import result
+from achus import utils
+
+opts = [
+    cfg.StrOpt('cube_file',
+               default=None,
+               help='File where the cube is saved once built, and loaded '
+                    'from afterwards (if not set, the cube is only kept '
+                    'in memory).'),
+    cfg.StrOpt('start_time',
+               default=None,
+               help='Start of the time window of the cube (if not set, '
+                    'the one of the first metric requested).'),
+    cfg.StrOpt('end_time',
+               default=None,
+               help='End of the time window of the cube (if not set, the '
+                    'one of the first metric requested).'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts, group="cube")
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Cubes built or loaded by this process, see CubeCollector._get_cube
+_CUBES = []
+_CUBES_LOCK = threading.Lock()
+
+
+class Cube(object):
+    """Accounting sums by group, project, slots and (end) day.
+
+    The cube is stored by columns: every dimension as an 'array("i")' of
+    codes into its list of values, and every measure as an 'array("d")'.
+    It is built with a single GROUP BY query, so it is small enough to be
+    sliced in memory instead of querying the database again.
+    """
+
+    DIMENSIONS = ["group", "project", "slots", "day"]
+    MEASURES = ["cpu_time", "wall_clock", "jobs"]
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.values = dict((d, []) for d in self.DIMENSIONS)
+        self.codes = dict((d, array.array("i")) for d in self.DIMENSIONS)
+        self.measures = dict((m, array.array("d")) for m in self.MEASURES)
+        # Code of each of the dimension values
+        self._index = dict((d, {}) for d in self.DIMENSIONS)
+
+    def __len__(self):
+        return len(self.measures["jobs"])
+
+    def covers(self, start, end):
+        """Whether the time window is inside the one of the cube."""
+        return self.start <= start and end <= self.end
+
+    def append(self, dimensions, measures):
+        """Adds a cell, given its dimension values and measures."""
+        for d, value in itertools.izip(self.DIMENSIONS, dimensions):
+            values = self.values[d]
+            index = self._index[d]
+            if value not in index:
+                index[value] = len(values)
+                values.append(value)
+            self.codes[d].append(index[value])
+        for m, value in itertools.izip(self.MEASURES, measures):
+            self.measures[m].append(value)
+
+    @classmethod
+    def build(cls, start, end, ge_collector=None):
+        """Builds the cube of a time window from the accounting database.
+
+        Jobs are assigned to the day they ended in. The cube is saved and
+        reused by later runs, so it is always built from all the jobs,
+        even if 'sample_rate' is set (e.g. by --preview).
+        """
+        if ge_collector is None:
+            ge_collector = achus.collector.gridengine.GECollector()
+            ge_collector.sampling = False
+        cube = cls(start, end)
+        res = ge_collector.query(cls.MEASURES,
+                                 ["ge_group", "ge_project", "ge_slots",
+                                  "DATE(ge_end_time)"],
+                                 conditions={"ge_start_time": start,
+                                             "ge_end_time": end})
+        groups, projects, slots, days = res.keys
+        for i, dims in enumerate(itertools.izip(groups, projects, slots,
+                                                days)):
+            group, project, slot, day = dims
+            cube.append((group, project, slot, str(day)[:10]),
+                        [col[i] for col in res.sums])
+        logger.debug("Built cube for %s - %s with %s cells"
+                     % (start, end, len(cube)))
+        return cube
+
+    def save(self, path):
+        tmp = "%s.tmp" % path
+        with open(tmp, "wb") as f:
+            cPickle.dump((self.start, self.end, self.values, self.codes,
+                          self.measures), f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            start, end, values, codes, measures = cPickle.load(f)
+        cube = cls(start, end)
+        cube.values, cube.codes, cube.measures = values, codes, measures
+        for d, dimension_values in values.iteritems():
+            cube._index[d] = dict((v, i)
+                                  for i, v in enumerate(dimension_values))
+        return cube
+
+
+class CubeCollector(collector.BaseCollector):
+    """Answers the metrics by slicing an in-memory cube.
+
+    The cube (see Cube) is built once from the GridEngine accounting
+    database and then every metric whose time window is inside the one of
+    the cube is computed from it, with the same wildcard rules as the SQL
+    collector, without querying the database. As the cube is summed by
+    day, time windows are rounded to whole days of the jobs' end time.
+    Only the cpu, wallclock and efficiency metrics are supported.
+    """
+
+    FIELD_MAPPING = {
+        "group": "group",
+        "project": "project",
+        "start_time": "start_time",
+        "end_time": "end_time",
+    }
+
+    def source(self):
+        """Returns the database the cubes are built from."""
+        ge_collector = achus.collector.gridengine.GECollector()
+        ge_collector.sampling = False
+        return ge_collector.source()
+
+    def _get_cube(self, start, end):
+        """Returns a cube covering the time window, building it if needed.
+
+        The cube is built for the window set in the options, if any, and
+        CubeWindowExceeded is raised if it does not cover the one given.
+        """
+        if not (start and end):
+            raise exception.UnboundedTimeWindow(metric="cube")
+        start = utils.format_time(utils.parse_time(start))
+        end = utils.format_time(utils.parse_time(end))
+
+        with _CUBES_LOCK:
+            for cube in _CUBES:
+                if cube.covers(start, end):
+                    return cube
+
+            cube_start = utils.format_time(utils.parse_time(
+                CONF.cube.start_time or start))
+            cube_end = utils.format_time(utils.parse_time(
+                CONF.cube.end_time or end))
+            if not (cube_start <= start and end <= cube_end):
+                raise exception.CubeWindowExceeded(start=start, end=end,
+                                                   cube_start=cube_start,
+                                                   cube_end=cube_end)
+
+            cube = None
+            path = CONF.cube.cube_file
+            if path and os.path.exists(path):
+                cube = Cube.load(path)
+                if not cube.covers(start, end):
+                    cube = None
+            if cube is None:
+                cube = Cube.build(cube_start, cube_end)
+                if path:
+                    cube.save(path)
+            _CUBES.append(cube)
+            return cube
+
+    def _matcher(self, value):
+        """Returns the (match, leftover) predicates of a wildcard list.
+
+        Same rules as the SQL conditions built by '_format_wildcard': a
+        value matches if any of the rules does, and goes to the leftover
+        (if '**' is given) if any of the negated rules does.
+        """
+        do_proportion, d = self._expand_wildcards(
+            value if isinstance(value, list) else [value])
+
+        def _like(patterns):
+            return [re.compile("^%s$" % ".*".join(re.escape(i)
+                                                  for i in p.split("*")),
+                               re.DOTALL)
+                    for p in patterns]
+
+        rules = []
+        for mtype, mset in d.iteritems():
+            if mtype == "IN":
+                rules.append((lambda s: lambda v: v in s)(mset))
+            elif mtype == "NOT IN":
+                rules.append((lambda s: lambda v: v not in s)(mset))
+            elif mtype == "CONTAINS":
+                rules.extend((lambda r: lambda v: bool(r.match(v)))(r)
+                             for r in _like(mset))
+            else:
+                rules.extend((lambda r: lambda v: not r.match(v))(r)
+                             for r in _like(mset))
+
+        def _match(v):
+            return any(rule(v) for rule in rules)
+
+        def _leftover(v):
+            return any(not rule(v) for rule in rules)
+
+        return _match, _leftover if do_proportion else None
+
+    def _days(self, cube, start, end):
+        """Returns the codes of the cube days inside the time window."""
+        first = utils.parse_time(start).date() if start else None
+        last = None
+        if end:
+            last = (utils.parse_time(end) -
+                    datetime.timedelta(seconds=1)).date()
+        return set(i for i, day in enumerate(cube.values["day"])
+                   if (first is None or day >= first.isoformat()) and
+                   (last is None or day <= last.isoformat()))
+
+    def _slice(self, group_by, conditions, fan_out=None):
+        """Adds up the cube measures by 'group_by' value.
+
+        Returns a dict with a [cpu_time, wall_clock, jobs] list by key,
+        or by (fan_out value, key) if 'fan_out' is given.
+        """
+        conditions = dict(conditions or {})
+        start = conditions.pop("start_time", None)
+        end = conditions.pop("end_time", None)
+        cube = self._get_cube(start, end)
+
+        # Allowed codes of each filtered dimension, plus leftover codes
+        days = self._days(cube, start, end)
+        allowed = {}
+        leftover = {}
+        for dimension, value in conditions.iteritems():
+            match, left = self._matcher(value)
+            values = cube.values[dimension]
+            allowed[dimension] = set(i for i, v in enumerate(values)
+                                     if match(v))
+            if left:
+                leftover[dimension] = set(i for i, v in enumerate(values)
+                                          if left(v))
+
+        keys = cube.values[group_by]
+        key_codes = cube.codes[group_by]
+        filters = [(cube.codes[d], codes) for d, codes in allowed.items()]
+        left_filters = [(cube.codes[d], codes)
+                        for d, codes in leftover.items()]
+        measures = [cube.measures[m] for m in Cube.MEASURES]
+
+        day_codes = cube.codes["day"]
+        if fan_out:
+            fans = cube.values[fan_out]
+            fan_codes = cube.codes[fan_out]
+
+        d = {}
+        for i in xrange(len(cube)):
+            if day_codes[i] not in days:
+                continue
+            if all(col[i] in codes for col, codes in filters):
+                key = keys[key_codes[i]]
+            elif any(col[i] in codes for col, codes in left_filters):
+                key = "leftover"
+            else:
+                continue
+            if fan_out:
+                key = (fans[fan_codes[i]], key)
+            sums = d.get(key)
+            if sums is None:
+                sums = d[key] = [0.0] * len(measures)
+            for j, col in enumerate(measures):
+                sums[j] += col[i]
+        return d
+
+    def _fold_top(self, d, top, measure, fan_out=None):
+        """Keeps the 'top' keys with the highest 'measure' (see _slice).
+
+        If 'fan_out' is given, the top keys of each of its values are kept.
+        """
+        if top and fan_out:
+            by_fan = collections.defaultdict(dict)
+            for (fan, key), sums in d.iteritems():
+                by_fan[fan][key] = sums
+            result = {}
+            for fan, fan_d in by_fan.iteritems():
+                for key, sums in self._fold_top(fan_d, top,
+                                                measure).iteritems():
+                    result[(fan, key)] = sums
+            return result
+        if not top or len(d) <= top:
+            return d
+        items = sorted(d.iteritems(), key=lambda i: i[1][measure],
+                       reverse=True)
+        result = dict(items[:top])
+        others = [0.0] * len(Cube.MEASURES)
+        for _, sums in items[top:]:
+            others = [a + b for a, b in zip(others, sums)]
+        result["others"] = others
+        return result
+
+    def get_cpu_time(self, group_by, conditions=None, top=None,
+                     fan_out=None):
+        """Computes the CPU time grouped by 'group_by' in hours."""
+        d = self._fold_top(self._slice(group_by, conditions, fan_out), top,
+                           0, fan_out)
+        return result.MetricResult((k, utils.to_hours(v[0], ndigits=None))
+                                   for k, v in d.iteritems())
+
+    def get_wall_clock(self, group_by, conditions=None, top=None,
+                       fan_out=None):
+        """Computes the WALLCLOCK time grouped by 'group_by' in hours."""
+        d = self._fold_top(self._slice(group_by, conditions, fan_out), top,
+                           1, fan_out)
+        return result.MetricResult((k, utils.to_hours(v[1], ndigits=None))
+                                   for k, v in d.iteritems())
+
+    def get_efficiency(self, group_by, conditions=None, top=None,
+                       fan_out=None):
+        """Computes the efficiency (in %) grouped by 'group_by'."""
+        d = self._fold_top(self._slice(group_by, conditions, fan_out), top,
+                           0, fan_out)
+        keys = d.keys()
+        return self._efficiency(keys,
+                                [d[k][0] for k in keys],
+                                [d[k][1] for k in keys])
+
+    def _unsupported(self, metric):
+        raise exception.UnsupportedMetric(metric=metric,
+                                          collector=type(self).__name__)
+
+    def get_wait_time(self, group_by, **kw):
+        """Not supported, the cube does not keep per job values."""
+        self._unsupported("wait_time")
+
+    def get_runtime(self, group_by, **kw):
+        """Not supported, the cube does not keep per job values."""
+        self._unsupported("runtime")
+
+    def get_occupancy(self, group_by, **kw):
+        """Not supported, the cube does not keep the jobs' start time."""
+        self._unsupported("occupancy")
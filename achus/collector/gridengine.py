@@ -1,18 +1,34 @@
+import array
+import collections
 import contextlib
+import copy
+import functools
+import itertools
+import json
 import logging
+import math
+import multiprocessing.pool
+import sqlite3
+import threading
+import time
 
 import _mysql_exceptions
 import MySQLdb as mdb
+import MySQLdb.cursors
 from oslo.config import cfg
 
 from achus import collector
 from achus import exception
+import achus.pool
+from achus import result
+from achus import sketch
 from achus import utils
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-opts = [
+# Connection options, also used by each of the 'clusters' sections
+db_opts = [
     cfg.StrOpt('host',
                default='localhost',
                help='MySQL host where GE accounting database is located.'),
@@ -28,11 +44,88 @@ opts = [
     cfg.StrOpt('dbname',
                default='ge_accounting',
                help='Name of the accounting database.'),
+    cfg.StrOpt('driver',
+               default='mysql',
+               help='Database driver, mysql or sqlite (then dbname is the '
+                    'path of the database file).'),
+    cfg.ListOpt('replicas',
+                default=[],
+                help='Read replicas of the database, as host[:port] (the '
+                     'port defaults to the one of the primary host).'),
+]
+
+opts = [
+    cfg.ListOpt('clusters',
+                default=[],
+                help='Sections holding the connection options of each of '
+                     'the clusters whose results are merged (if empty, '
+                     'the connection options of this section are used).'),
+    cfg.BoolOpt('cluster_breakdown',
+                default=False,
+                help='Keep the results of each cluster apart, prefixing '
+                     'the keys with the cluster name.'),
+    cfg.IntOpt('replica_min_age',
+               default=3600,
+               help='Queries whose time window ended more than these '
+                    'seconds ago are sent to the replicas, the rest to the '
+                    'primary host.'),
+    cfg.StrOpt('replica_balancing',
+               default='round-robin',
+               help='How queries are spread over the replicas, '
+                    'round-robin or least-latency.'),
+    cfg.IntOpt('query_timeout',
+               default=0,
+               help='Seconds the queries of a collector call may run on a '
+                    'database before being cancelled (0 disables it).'),
+    cfg.IntOpt('max_estimated_rows',
+               default=0,
+               help='Refuse to run queries that, according to EXPLAIN, '
+                    'would examine more rows than this (0 disables it).'),
+    cfg.FloatOpt('sketch_accuracy',
+                 default=0.01,
+                 help='Relative accuracy of the percentiles of the '
+                      'distribution metrics (wait_time, runtime).'),
+    cfg.IntOpt('pool_size',
+               default=0,
+               help='Number of idle connections kept open for reuse (0 '
+                    'disables connection pooling).'),
+    cfg.IntOpt('fetch_size',
+               default=10000,
+               help='Number of rows fetched from the cursor at once.'),
+    cfg.StrOpt('window_chunk',
+               default=None,
+               help='Split the time window of the queries into chunks of '
+                    'this size (day, week, month or year).'),
+    cfg.IntOpt('max_workers',
+               default=1,
+               help='Maximum number of chunks being queried at the same '
+                    'time (at least one per cluster).'),
+    cfg.IntOpt('sample_rate',
+               default=0,
+               help='Only query 1 of every these many jobs (by job '
+                    'number), scaling the sums accordingly; the results '
+                    'are approximate (0 disables sampling).'),
 ]
 
 CONF = cfg.CONF
+CONF.register_opts(db_opts, group="gecollector")
 CONF.register_opts(opts, group="gecollector")
 
+# Query results by columns: 'keys' holds a tuple per group by field and 'sums'
+# an array("d") per aggregated field, all of them with the same length.
+Columns = collections.namedtuple("Columns", ["keys", "sums"])
+
+# Connection pools, by connection parameters
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+# Replica balancing state, by (host, port): round-robin counters (by
+# replica list), query latencies and time of the last failure.
+_REPLICAS_LOCK = threading.Lock()
+_ROUND_ROBIN = collections.defaultdict(itertools.count)
+_LATENCIES = {}
+_FAILURES = {}
+
 
 class GECollector(collector.BaseCollector):
     """Retrieves accounting data from a GridEngine system through SQL."""
@@ -48,39 +141,139 @@ class GECollector(collector.BaseCollector):
         "cpu_time": "ge_cpu",
         "start_time": "ge_start_time",
         "end_time": "ge_end_time",
+        # Only the jobs ended after it, for incremental refreshes
+        "end_time_after": "ge_end_time_after",
         "group": "ge_group",
         "project": "ge_project",
     }
 
-    def _format_result(self, *args):
-        """Transforms 'v' value to float needed to render the graph."""
-        import decimal
-        l = []
-        for arg in args:
-            l_sub = []
-            for i in arg:
-                if type(i) in [decimal.Decimal, long, int, float]:
-                    i = float(i)
-                l_sub.append(i)
-            l.append(l_sub)
-        return l
+    # Aggregated expressions, in seconds (efficiency in %)
+    AGGREGATES = {
+        "cpu_time": "SUM(ge_cpu)",
+        "wall_clock": "SUM(ge_ru_wallclock*ge_slots)",
+        "efficiency": "100*SUM(ge_cpu)/SUM(ge_ru_wallclock*ge_slots)",
+        "jobs": "COUNT(*)",
+        # Sums of squares, for the error bounds of the sampled sums
+        "cpu_time_squares": "SUM(ge_cpu*ge_cpu)",
+        "wall_clock_squares": "SUM((ge_ru_wallclock*ge_slots)*"
+                              "(ge_ru_wallclock*ge_slots))",
+    }
+
+    # Aggregates scaled by the sample rate when sampling
+    SCALED_AGGREGATES = ["cpu_time", "wall_clock", "jobs"]
+
+    # Whether 'sample_rate' applies to the queries of the collector
+    sampling = True
+
+    # (name, options) of the databases queried, if not the configured
+    # ones (see 'by_target')
+    targets = None
+
+    # Standard score of the confidence level of the error bounds (95%)
+    CONFIDENCE_Z = 1.96
+
+    # Per job values (in seconds) of the distribution metrics, by driver
+    DISTRIBUTIONS = {
+        "wait_time": {
+            "mysql": "TIMESTAMPDIFF(SECOND,ge_submission_time,ge_start_time)",
+            "sqlite": "(strftime('%s',ge_start_time)-"
+                      "strftime('%s',ge_submission_time))",
+        },
+        "runtime": {
+            "mysql": "ge_ru_wallclock",
+            "sqlite": "ge_ru_wallclock",
+        },
+    }
+
+    # Aggregate used to compute each of the metrics
+    METRIC_AGGREGATES = {
+        "cpu": "cpu_time",
+        "wallclock": "wall_clock",
+        "efficiency": "efficiency",
+    }
+
+    # Covering indexes for the queries above: the time range (or group)
+    # used to filter first, then the rest of the columns being read.
+    RECOMMENDED_INDEXES = {
+        "achus_end_time": ["ge_end_time", "ge_group", "ge_project",
+                           "ge_slots", "ge_cpu", "ge_ru_wallclock",
+                           "ge_start_time", "ge_submission_time",
+                           "ge_job_number"],
+        "achus_group": ["ge_group", "ge_end_time", "ge_slots", "ge_cpu",
+                        "ge_ru_wallclock", "ge_start_time",
+                        "ge_submission_time", "ge_job_number"],
+    }
+
+    # Unique keys of the accounting table, identifying each job record
+    # (job numbers wrap around, and every task of an array or parallel
+    # job, or every run of a rescheduled one, has its own record).
+    UNIQUE_INDEXES = {
+        "achus_job": ["ge_job_number", "ge_task_number", "ge_pe_taskid",
+                      "ge_submission_time", "ge_start_time"],
+    }
+
+    # Seconds a replica is avoided after failing
+    FAILOVER_BACKOFF = 60
+
+    # Weight of the last query in the replica latency average
+    LATENCY_WEIGHT = 0.3
+
+    # MySQL errors raised when a statement is killed or times out
+    # (ER_QUERY_INTERRUPTED, ER_QUERY_TIMEOUT)
+    TIMEOUT_ERRORS = (1317, 3024)
+
+    # MySQL errors raised when the server cannot be reached or the
+    # connection is lost (CR_CONNECTION_ERROR, CR_CONN_HOST_ERROR,
+    # CR_SERVER_GONE_ERROR, CR_SERVER_LOST), the only ones failed over
+    CONNECTION_ERRORS = (2002, 2003, 2006, 2013)
+
+    def _fetch_columns(self, curs, n_keys):
+        """Reads the cursor in batches, returning its contents by columns.
+
+        The first 'n_keys' columns of the result are the group keys and are
+        returned as tuples, while the remaining ones are the sums, returned
+        as 'array("d")' (NULL sums are converted to 0).
+        """
+        n_sums = len(curs.description) - n_keys
+        keys = [[] for _ in xrange(n_keys)]
+        sums = [array.array("d") for _ in xrange(n_sums)]
+        while True:
+            rows = curs.fetchmany(CONF.gecollector.fetch_size)
+            if not rows:
+                break
+            columns = zip(*rows)
+            for col, batch in itertools.izip(keys, columns[:n_keys]):
+                col.extend(batch)
+            for col, batch in itertools.izip(sums, columns[n_keys:]):
+                col.extend([0.0 if v is None else float(v) for v in batch])
+        return Columns([tuple(col) for col in keys], sums)
 
     def _format_conditions(self, **kw):
         """Adds the given conditions (default+requested) to the SQL query."""
         CONDITION_OPERATORS = {
-            "ge_start_time": ">=",
-            "ge_end_time": "<=",
+            "ge_start_time": ("ge_start_time", ">="),
+            "ge_end_time": ("ge_end_time", "<="),
+            # Exclusive bounds, used when splitting the time window and
+            # looking for the jobs running in it
+            "ge_end_time_after": ("ge_end_time", ">"),
+            "ge_start_time_before": ("ge_start_time", "<"),
         }
 
         condition_list = [cond for cond in self.DEFAULT_CONDITIONS]
+        if self._sample_rate():
+            # Deterministic sample, the same jobs on every run
+            condition_list.append("MOD(ge_job_number,%d)=0"
+                                  % self._sample_rate())
         condition_wildcard_list = []
 
-        for k, v in kw.iteritems():
+        for k, v in sorted(kw.iteritems()):
             logger.debug("Analysing condition (%s, %s)" % (k, v))
             if k in CONDITION_OPERATORS.keys():
                 logger.debug(("Condition '%s' not going through wilcard "
                               "expansion" % k))
-                aux = "%s %s '%s'" % (k, CONDITION_OPERATORS[k], v)
+                if v:
+                    aux = "%s %s '%s'" % (CONDITION_OPERATORS[k] + (v,))
+                    condition_list.append(aux)
             else:
                 logger.debug(("Condition '%s' going through wildcard "
                               "expansion" % k))
@@ -107,111 +300,1018 @@ class GECollector(collector.BaseCollector):
 
         return l
 
-    def query(self, parameter, group_by, conditions=None):
+    def _get_targets(self):
+        """Returns the (name, options) of the databases to be queried.
+
+        The name is None when a single database (the one defined in the
+        'gecollector' section) is used.
+        """
+        if self.targets is not None:
+            return self.targets
+        if not CONF.gecollector.clusters:
+            return [(None, CONF.gecollector)]
+
+        l = []
+        for name in CONF.gecollector.clusters:
+            CONF.register_opts(db_opts, group=name)
+            l.append((name, CONF[name]))
+        return l
+
+    def by_target(self):
+        """Returns a (name, options, collector) for each of the databases.
+
+        Each of the collectors is a copy of this one only querying that
+        database.
+        """
+        l = []
+        for name, target in self._get_targets():
+            c = copy.copy(self)
+            c.targets = [(name, target)]
+            l.append((name, target, c))
+        return l
+
+    def _connect(self, target=None, host=None):
+        """Opens a new connection to the accounting database.
+
+        target: connection options, defaults to the 'gecollector' ones.
+        host: (host, port) to connect to instead of the primary one.
+        """
+        target = target or CONF.gecollector
+        host, port = host or (target.host, target.port)
+        if target.driver == "sqlite":
+            try:
+                conn = sqlite3.connect(target.dbname,
+                                       check_same_thread=False)
+            except sqlite3.Error as e:
+                raise exception.SQLiteBackendException(message=str(e))
+            # Math functions used by Sketch.bucket_sql, missing in SQLite
+            conn.create_function("LN", 1, math.log)
+            conn.create_function("CEIL", 1,
+                                 lambda x: int(math.ceil(x)))
+            # Used by the sampling condition
+            conn.create_function("MOD", 2, lambda x, y: x % y)
+            return conn
+
+        try:
+            return mdb.connect(host,
+                               target.user,
+                               target.password,
+                               target.dbname,
+                               port)
+        except _mysql_exceptions.OperationalError as e:
+            raise exception.MySQLBackendUnavailable(message=str(e))
+
+    @contextlib.contextmanager
+    def _connection(self, target=None, host=None):
+        """Yields a connection, taken from a pool if 'pool_size' is set."""
+        target = target or CONF.gecollector
+        host = host or (target.host, target.port)
+        if not CONF.gecollector.pool_size:
+            conn = self._connect(target, host)
+            with contextlib.closing(conn):
+                yield conn
+            return
+
+        key = (target.driver,
+               host,
+               target.user,
+               target.dbname)
+        with _POOLS_LOCK:
+            if key not in _POOLS:
+                _POOLS[key] = achus.pool.ConnectionPool(
+                    lambda: self._connect(target, host),
+                    CONF.gecollector.pool_size)
+            pool = _POOLS[key]
+        with pool.connection() as conn:
+            yield conn
+
+    @contextlib.contextmanager
+    def _backend_errors(self):
+        """Raises the driver errors inside as BackendException.
+
+        MySQL CONNECTION_ERRORS are raised as MySQLBackendUnavailable.
+        """
+        try:
+            yield
+        except sqlite3.Error as e:
+            raise exception.SQLiteBackendException(message=str(e))
+        except _mysql_exceptions.Error as e:
+            if (isinstance(e, _mysql_exceptions.OperationalError) and
+                    e.args and e.args[0] in self.CONNECTION_ERRORS):
+                raise exception.MySQLBackendUnavailable(message=str(e))
+            raise exception.MySQLBackendException(message=str(e))
+
+    def _is_historical(self, conditions):
+        """Whether the time window ended more than 'replica_min_age' ago."""
+        end = (conditions or {}).get("ge_end_time")
+        if not end:
+            return False
+        age = time.time() - time.mktime(utils.parse_time(end).timetuple())
+        return age > CONF.gecollector.replica_min_age
+
+    def _get_hosts(self, target, conditions):
+        """Returns the (host, port) to query, in order of preference.
+
+        Historical time windows are sent to the replicas (balanced as set
+        in 'replica_balancing'), falling back to the primary host if all
+        of them fail. The rest of the queries only go to the primary host.
+        """
+        primary = (target.host, target.port)
+        if (target.driver == "sqlite" or not target.replicas or
+                not self._is_historical(conditions)):
+            return [primary]
+
+        replicas = []
+        for replica in target.replicas:
+            host, _, port = replica.partition(":")
+            replicas.append((host, int(port) if port else target.port))
+
+        now = time.time()
+        with _REPLICAS_LOCK:
+            if CONF.gecollector.replica_balancing == "least-latency":
+                # Replicas not queried yet go first, to measure them
+                replicas.sort(key=lambda h: _LATENCIES.get(h, 0.0))
+            else:
+                i = next(_ROUND_ROBIN[tuple(replicas)]) % len(replicas)
+                replicas = replicas[i:] + replicas[:i]
+            # Replicas that failed recently go last
+            replicas.sort(key=lambda h: (now - _FAILURES.get(h, 0) <
+                                         self.FAILOVER_BACKOFF))
+        return replicas + [primary]
+
+    def _record_latency(self, host, latency=None):
+        """Records the latency of a query, or a failure if it is None."""
+        with _REPLICAS_LOCK:
+            if latency is None:
+                _FAILURES[host] = time.time()
+                _LATENCIES.pop(host, None)
+            elif host in _LATENCIES:
+                _LATENCIES[host] += (self.LATENCY_WEIGHT *
+                                     (latency - _LATENCIES[host]))
+            else:
+                _LATENCIES[host] = latency
+
+    def _build_queries(self, parameter, group_by, conditions=None,
+                       top=None, target=None):
+        """Builds the SQL commands needed to compute the parameter requested.
+
+        Returns a list of (cmd, cmd_negate, cmd_total) tuples, where
+        'cmd_negate' is the command that computes the proportion leftover
+        (None if there is no proportion requested) and 'cmd_total' the one
+        that computes the grand total needed for the 'others' sums (None
+        unless 'top' is requested). See 'query' for the arguments, the
+        commands are built for the driver of 'target' ('gecollector' by
+        default).
+        """
+        target = target or CONF.gecollector
+        # Columns depending on the driver, e.g. the sketch buckets
+        group_by = [g(target) if callable(g) else g for g in group_by]
+        if not isinstance(parameter, list):
+            parameter = [parameter]
+        aggregates = [self.AGGREGATES[p] for p in parameter]
+
+        select = "SELECT"
+        if CONF.gecollector.query_timeout and target.driver == "mysql":
+            # Server side budget, the client side one is in '_time_budget'
+            select = ("SELECT /*+ MAX_EXECUTION_TIME(%d) */"
+                      % (CONF.gecollector.query_timeout * 1000))
+
+        queries = []
+        for c in self._format_conditions(**(conditions or {})):
+            # If list -> contains negation (aka proportion)
+            if isinstance(c, list):
+                cond, cond_negate = c
+            else:
+                cond, cond_negate = (c, '')
+
+            cmd = ("%s %s FROM ge_jobs %s GROUP BY %s"
+                   % (select,
+                      ','.join(group_by + aggregates),
+                      cond,
+                      ','.join(group_by)))
+
+            cmd_total = None
+            if top:
+                # Order by the first aggregate
+                cmd = ("%s ORDER BY %s DESC LIMIT %d"
+                       % (cmd, len(group_by) + 1, top))
+                cmd_total = ("%s %s FROM ge_jobs %s"
+                             % (select, ','.join(aggregates), cond))
+
+            cmd_negate = None
+            if cond_negate:
+                cmd_negate = ("%s %s FROM ge_jobs %s"
+                              % (select,
+                                 ','.join(group_by[1:] + aggregates),
+                                 cond_negate))
+                if group_by[1:]:
+                    cmd_negate = ' '.join([cmd_negate,
+                                           "GROUP BY",
+                                           ','.join(group_by[1:])])
+            queries.append((cmd, cmd_negate, cmd_total))
+        return queries
+
+    def _split_window(self, conditions):
+        """Splits the time window of the conditions into chunks.
+
+        Returns a list of conditions, one for each of the sub-windows of
+        'window_chunk' size, partitioned by 'ge_end_time' so that every job
+        is counted exactly once. If splitting is disabled or the window is
+        not bounded, the conditions are returned as the only item. Chunks
+        ending before 'ge_end_time_after', if given, are left out.
+        """
+        conditions = conditions or {}
+        start = conditions.get("ge_start_time")
+        end = conditions.get("ge_end_time")
+        if not (CONF.gecollector.window_chunk and start and end):
+            return [conditions]
+
+        after = conditions.get("ge_end_time_after")
+        if after:
+            after = utils.parse_time(after)
+        bounds = utils.split_window(utils.parse_time(start),
+                                    utils.parse_time(end),
+                                    CONF.gecollector.window_chunk)
+        l = []
+        for i, (lower, upper) in enumerate(zip(bounds, bounds[1:])):
+            if after and upper <= after:
+                continue
+            d = dict(conditions)
+            d["ge_end_time"] = utils.format_time(upper)
+            if i and not (after and after > lower):
+                d["ge_end_time_after"] = utils.format_time(lower)
+            l.append(d)
+        logger.debug("Time window split into %s chunks" % len(l))
+        return l
+
+    def _get_tasks(self, conditions):
+        """Returns the (target name, target, conditions) to be queried.
+
+        There is a task for each of the chunks of the time window in each
+        of the databases being queried.
+        """
+        return [(name, target, chunk)
+                for name, target in self._get_targets()
+                for chunk in self._split_window(conditions)]
+
+    def _map_tasks(self, func, tasks):
+        """Runs func(name, target, conditions) for each of the tasks.
+
+        Up to 'max_workers' tasks (and at least one per cluster) are run
+        at the same time. Returns the results in the order of the tasks.
+        """
+        if len(tasks) == 1:
+            return [func(*tasks[0])]
+
+        workers = max(CONF.gecollector.max_workers,
+                      len(self._get_targets()))
+        pool = multiprocessing.pool.ThreadPool(min(workers, len(tasks)))
+        try:
+            return pool.map(lambda task: func(*task), tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _merge_columns(self, parts):
+        """Merges several query results, adding up the sums by key."""
+        index = {}
+        keys = []
+        sums = [array.array("d") for _ in parts[0].sums]
+        for part in parts:
+            for i, key in enumerate(itertools.izip(*part.keys)):
+                j = index.get(key)
+                if j is None:
+                    index[key] = len(keys)
+                    keys.append(key)
+                    for col, part_col in itertools.izip(sums, part.sums):
+                        col.append(part_col[i])
+                else:
+                    for col, part_col in itertools.izip(sums, part.sums):
+                        col[j] += part_col[i]
+        key_columns = zip(*keys) or [() for _ in parts[0].keys]
+        return Columns([tuple(col) for col in key_columns], sums)
+
+    def _append_others(self, res, others):
+        """Appends the 'others' sums to a query result."""
+        keys = [res.keys[0] + ("others",)] + [k + (None,)
+                                              for k in res.keys[1:]]
+        sums = []
+        for col, value in itertools.izip(res.sums, others):
+            col = array.array("d", col)
+            col.append(value)
+            sums.append(col)
+        return Columns(keys, sums)
+
+    def _fold_top(self, res, top):
+        """Keeps the 'top' keys with the highest first sum.
+
+        The sums of the rest of the keys are added up under 'others'.
+        """
+        n = len(res.sums[0])
+        if n <= top:
+            return res
+        order = sorted(xrange(n), key=res.sums[0].__getitem__, reverse=True)
+        head, tail = order[:top], order[top:]
+        head_res = Columns([tuple(col[i] for i in head) for col in res.keys],
+                           [array.array("d", [col[i] for i in head])
+                            for col in res.sums])
+        return self._append_others(head_res,
+                                   [sum(col[i] for i in tail)
+                                    for col in res.sums])
+
+    def _fold_top_fan_out(self, res, top):
+        """Keeps the 'top' keys of each of the fan-out values.
+
+        'res' is grouped by (key, fan-out value), see '_query_metric'.
+        """
+        rows = collections.defaultdict(list)
+        for i, fan in enumerate(res.keys[1]):
+            rows[fan].append(i)
+        keys = []
+        fans = []
+        sums = [array.array("d") for _ in res.sums]
+        for fan, l in rows.iteritems():
+            l.sort(key=res.sums[0].__getitem__, reverse=True)
+            for i in l[:top]:
+                keys.append(res.keys[0][i])
+                fans.append(fan)
+                for col, res_col in itertools.izip(sums, res.sums):
+                    col.append(res_col[i])
+            if len(l) > top:
+                keys.append("others")
+                fans.append(fan)
+                for col, res_col in itertools.izip(sums, res.sums):
+                    col.append(sum(res_col[i] for i in l[top:]))
+        return Columns([tuple(keys), tuple(fans)], sums)
+
+    def query(self, parameter, group_by, conditions=None, top=None):
         """Performs a SQL query based on the parameter requested.
 
+        If 'window_chunk' is set, the time window is split and each of the
+        chunks queried separately (up to 'max_workers' at the same time),
+        merging the partial sums afterwards. Only additive aggregates can
+        be split. Likewise, if several 'clusters' are defined, all of them
+        are queried at the same time and their sums merged (prefixing the
+        first key with the cluster name if 'cluster_breakdown' is set).
+
+        If 'top' is set, only the 'top' keys with the highest (first) sum
+        are returned, plus an 'others' key holding the rest of the sums.
+        As with the split windows, only additive aggregates can be used.
+
+        If 'sample_rate' is set, only a sample of the jobs is queried, and
+        the SCALED_AGGREGATES sums are multiplied by the rate.
+
+        'parameter': name (or list of names) of the AGGREGATES to compute,
+                     each of them will be returned as a column of sums.
         'group_by': in case of multiple group, the order of this string
                     is important for the rest of the code flow. The first
                     element must always be (group, project) and then the
-                    rest (e.g. "ge_group,ge_slots")
+                    rest (e.g. "ge_group,ge_slots"). Columns depending on
+                    the driver are given as functions of the target.
+        """
+        tasks = self._get_tasks(conditions)
+        if len(tasks) == 1:
+            name, target, chunk = tasks[0]
+            res = self._query(parameter, group_by, conditions=chunk,
+                              top=top, target=target)
+            return self._scale(parameter, res)
+
+        def _run(name, target, chunk):
+            res = self._query(parameter, group_by, conditions=chunk,
+                              target=target)
+            if name and CONF.gecollector.cluster_breakdown:
+                keys = tuple("%s/%s" % (name, k) for k in res.keys[0])
+                res = Columns([keys] + res.keys[1:], res.sums)
+            return res
+
+        res = self._merge_columns(self._map_tasks(_run, tasks))
+        if top:
+            res = self._fold_top(res, top)
+        return self._scale(parameter, res)
+
+    def source(self):
+        """Returns the databases queried and how their results are built.
+
+        Only the options that change the results are returned: the
+        (name, driver, host, port, dbname) of each of the databases, whether
+        the results are broken down by cluster and the 'sample_rate'.
+        """
+        targets = [(name, target.driver, target.host, target.port,
+                    target.dbname)
+                   for name, target in self._get_targets()]
+        return [targets, CONF.gecollector.cluster_breakdown,
+                self._sample_rate()]
+
+    def _sample_rate(self):
+        """Returns the 'sample_rate' if sampling, None otherwise."""
+        if self.sampling and CONF.gecollector.sample_rate > 1:
+            return CONF.gecollector.sample_rate
+        return None
+
+    def _scale(self, parameter, res):
+        """Scales the SCALED_AGGREGATES sums of a sampled query result."""
+        rate = self._sample_rate()
+        if not rate:
+            return res
+        if not isinstance(parameter, list):
+            parameter = [parameter]
+        for p, col in itertools.izip(parameter, res.sums):
+            if p in self.SCALED_AGGREGATES:
+                for i in xrange(len(col)):
+                    col[i] *= rate
+        return res
+
+    def _query(self, parameter, group_by, conditions=None, top=None,
+               target=None):
+        """Runs the SQL queries for the parameter requested (see 'query').
+
+        The queries are sent to the first of the hosts given by
+        '_get_hosts' that can be reached (see '_on_hosts').
+        """
+        target = target or CONF.gecollector
+        queries = self._build_queries(parameter, group_by, conditions,
+                                      top=top, target=target)
+        return self._on_hosts(target, conditions,
+                              lambda conn: self._run_queries(
+                                  conn, queries, group_by, target))
+
+    def _on_hosts(self, target, conditions, func):
+        """Calls 'func' with a connection, returning its result.
+
+        The connection is opened to the first of the hosts given by
+        '_get_hosts' that can be reached, and 'func' is run within its
+        time budget. Other errors (e.g. in the SQL) are raised right away,
+        without trying the rest.
+        """
+        hosts = self._get_hosts(target, conditions)
+        for i, host in enumerate(hosts):
+            start = time.time()
+            try:
+                with self._backend_errors():
+                    with self._connection(target, host) as conn:
+                        with self._time_budget(conn, target, host):
+                            res = func(conn)
+            except exception.MySQLBackendUnavailable as e:
+                if i == len(hosts) - 1:
+                    raise
+                logger.warning("Query to %s:%s failed, trying next host: %s"
+                               % (host + (e,)))
+                self._record_latency(host)
+                continue
+            if len(hosts) > 1:
+                self._record_latency(host, time.time() - start)
+            return res
+
+    def _cancel(self, conn, target, host):
+        """Cancels the statement running on a connection.
+
+        MySQL statements are killed from a new connection, SQLite ones are
+        interrupted.
         """
+        if target.driver == "sqlite":
+            conn.interrupt()
+            return
+
         try:
-            conn = mdb.connect(CONF.gecollector.host,
-                               CONF.gecollector.user,
-                               CONF.gecollector.password,
-                               CONF.gecollector.dbname,
-                               CONF.gecollector.port)
-        except _mysql_exceptions.OperationalError as e:
-            raise exception.MySQLBackendException(message=str(e))
+            with contextlib.closing(self._connect(target, host)) as killer:
+                killer.cursor().execute("KILL QUERY %d" % conn.thread_id())
+        except Exception:
+            logger.exception("Cannot cancel query on %s:%s" % host)
+
+    @contextlib.contextmanager
+    def _time_budget(self, conn, target, host):
+        """Cancels the queries run inside after 'query_timeout' seconds.
+
+        Errors caused by the cancellation (or by the server side limit)
+        are raised as QueryTimeout, so that they are not retried on other
+        hosts.
+        """
+        timeout = CONF.gecollector.query_timeout
+        if not timeout:
+            yield
+            return
+
+        cancelled = threading.Event()
+
+        def _cancel():
+            cancelled.set()
+            logger.warning("Cancelling query on %s:%s, time budget of %s "
+                           "seconds exceeded" % (host + (timeout,)))
+            self._cancel(conn, target, host)
+
+        timer = threading.Timer(timeout, _cancel)
+        timer.start()
+        try:
+            yield
+        except (sqlite3.OperationalError,
+                _mysql_exceptions.OperationalError) as e:
+            if (cancelled.is_set() or
+                    (e.args and e.args[0] in self.TIMEOUT_ERRORS)):
+                raise exception.QueryTimeout(timeout=timeout)
+            raise
+        finally:
+            timer.cancel()
+
+    def _check_cost(self, curs, cmd, target=None):
+        """Raises QueryTooExpensive if EXPLAIN estimates too many rows.
+
+        Only MySQL estimates are taken into account, 'target' being the
+        connection options of the cursor ('gecollector' by default).
+        """
+        target = target or CONF.gecollector
+        max_rows = CONF.gecollector.max_estimated_rows
+        if not max_rows or target.driver != "mysql":
+            return
+
+        curs.execute("EXPLAIN %s" % cmd)
+        columns = [d[0] for d in curs.description]
+        rows = sum(row[columns.index("rows")] or 0
+                   for row in curs.fetchall())
+        logger.debug("Estimated rows: %s" % rows)
+        if rows > max_rows:
+            raise exception.QueryTooExpensive(rows=rows, max_rows=max_rows,
+                                              cmd=cmd)
+
+    def _run_queries(self, conn, queries, group_by, target=None):
+        """Runs the queries built by '_build_queries' on a connection.
+
+        target: connection options of the connection.
+        """
+        curs = conn.cursor()
+        for cmd, cmd_negate, cmd_total in queries:
+            self._check_cost(curs, cmd, target)
+            logger.debug("MySQL command: `%s`" % cmd)
+            curs.execute(cmd)
+            res = self._fetch_columns(curs, len(group_by))
+            logger.debug("MySQL query result: %s rows" % len(res.sums[0]))
+
+            if cmd_total:
+                logger.debug("Total MySQL command: `%s`" % cmd_total)
+                curs.execute(cmd_total)
+                total = self._fetch_columns(curs, 0)
+                others = [t[0] - sum(col) if t else 0.0
+                          for t, col in itertools.izip(total.sums,
+                                                       res.sums)]
+                if any(others):
+                    res = self._append_others(res, others)
+
+            if cmd_negate:
+                logger.debug("Proportion MySQL command: `%s`" % cmd_negate)
+                curs.execute(cmd_negate)
+                leftover = self._fetch_columns(curs, len(group_by) - 1)
+                logger.debug("Proportion leftover: %s" % (leftover,))
+                n = len(leftover.sums[0])
+                res = Columns(
+                    [res.keys[0] + ("leftover",) * n] +
+                    [k + lo for k, lo in zip(res.keys[1:], leftover.keys)],
+                    [s + lo for s, lo in zip(res.sums, leftover.sums)])
+
+        return res
+
+    def get_statements(self, metric, group_by, conditions=None, top=None,
+                       fan_out=None, percentile=None, resolution=None):
+        """Returns the SQL commands that 'get' would run for the metric.
+
+        Neither the percentile of the distribution metrics nor the
+        resolution of the timelines change them, they are computed from
+        the rows returned afterwards.
+        """
+        if metric == "occupancy":
+            _, _, running = self._running_conditions(conditions)
+            return [self._build_timeline_query(group_by, running,
+                                               fan_out=fan_out)]
+
+        tasks = self._get_tasks(conditions)
+        group_by = [group_by]
+        if fan_out:
+            group_by.append(fan_out)
+        if metric in self.DISTRIBUTIONS:
+            parameter = "jobs"
+            group_by.append(functools.partial(self._bucket_sql, metric))
+            top = None
+        else:
+            parameter = self.METRIC_AGGREGATES[metric]
+        if metric in ("cpu", "wallclock") and self._sample_rate():
+            parameter = [parameter, "%s_squares" % parameter]
+        if metric == "efficiency":
+            parameter = self._efficiency_parameter(conditions, top)
+        l = []
+        for _, target, chunk in tasks:
+            queries = self._build_queries(parameter,
+                                          group_by,
+                                          conditions=chunk,
+                                          top=top if len(tasks) == 1 and
+                                          not fan_out else None,
+                                          target=target)
+            for cmd in [cmd for q in queries for cmd in q if cmd]:
+                if cmd not in l:
+                    l.append(cmd)
+        return l
+
+    def explain(self, cmd, target=None):
+        """Returns the MySQL execution plan of a command, one dict per row.
+
+        target: connection options of the database ('gecollector' by
+                default).
+        """
+        with self._connection(target) as conn:
+            curs = conn.cursor(MySQLdb.cursors.DictCursor)
+            curs.execute("EXPLAIN %s" % cmd)
+            return list(curs.fetchall())
+
+    def explain_cost(self, cmd, target=None):
+        """Returns the optimizer cost of a command (None if unknown).
 
-        with contextlib.closing(conn):
+        The cost is only reported by MySQL >= 5.6 (EXPLAIN FORMAT=JSON).
+        target: connection options of the database ('gecollector' by
+                default).
+        """
+        with self._connection(target) as conn:
             curs = conn.cursor()
-            l = self._format_conditions(**conditions)
+            try:
+                curs.execute("EXPLAIN FORMAT=JSON %s" % cmd)
+                plan = json.loads(curs.fetchone()[0])
+                return float(plan["query_block"]["cost_info"]["query_cost"])
+            except (_mysql_exceptions.Error, KeyError, TypeError,
+                    ValueError):
+                logger.debug("Cannot get the cost of `%s`" % cmd)
+                return None
 
-            for c in l:
-                # If list -> contains negation (aka proportion)
-                if isinstance(c, list):
-                    cond, cond_negate = c
-                else:
-                    cond, cond_negate = (c, '')
+    def get_columns(self):
+        """Returns the names of the columns of the accounting table."""
+        with self._connection() as conn:
+            curs = conn.cursor()
+            curs.execute("SHOW COLUMNS FROM ge_jobs")
+            return [row[0] for row in curs.fetchall()]
 
-                cmd = ("SELECT %s, SUM(%s) FROM ge_jobs %s GROUP BY %s"
-                       % (','.join(group_by),
-                          self.FIELD_MAPPING[parameter],
-                          cond,
-                          ','.join(group_by)))
-                logger.debug("MySQL command: `%s`" % cmd)
-                curs.execute(cmd)
-                res = self._format_result(*curs.fetchall())
-                logger.debug("MySQL query (formatted) result: %s" % res)
-
-                if cond_negate:
-                    cmd = ("SELECT %s, SUM(%s) FROM ge_jobs %s"
-                           % (','.join(group_by[1:]),
-                              self.FIELD_MAPPING[parameter],
-                              cond_negate))
-                    if group_by[1:]:
-                        cmd = ' '.join([' '.join([cmd, "GROUP BY "])]
-                                       + group_by[1:])
-                    logger.debug("Proportion MySQL command: `%s`" % cmd)
-                    curs.execute(cmd)
-                    aux = [("leftover",) + r for r in curs.fetchall()]
-                    leftover = self._format_result(*aux)
-                    logger.debug("Proportion leftover: %s" % leftover)
-                    res.extend(leftover)
+    def get_indexes(self):
+        """Returns the indexes of the accounting table.
 
-            return res
+        The result is a dict with the index name as key and the list of
+        columns (in index order) as value.
+        """
+        with self._connection() as conn:
+            curs = conn.cursor(MySQLdb.cursors.DictCursor)
+            curs.execute("SHOW INDEX FROM ge_jobs")
+            rows = sorted(curs.fetchall(),
+                          key=lambda r: (r["Key_name"], r["Seq_in_index"]))
+        d = {}
+        for row in rows:
+            d.setdefault(row["Key_name"], []).append(row["Column_name"])
+        return d
 
-    def get_cpu_time(self, group_by, conditions=None):
-        """Computes the CPU time grouped by 'ge_group' in hours.
+    def get_missing_indexes(self):
+        """Returns the RECOMMENDED_INDEXES not covered by existing ones.
 
-        conditions: extra conditions to be added to the SQL query.
+        An existing index covers a recommended one if the recommended
+        columns are a prefix of the existing index columns. UNIQUE_INDEXES
+        are only covered by an index with the same columns.
         """
+        existing = self.get_indexes().values()
         d = {}
-        for item in self.query("cpu_time",
-                               [group_by],
-                               conditions=conditions):
-            index, values = item
-            cpu_time = utils.to_hours(values)
+        for name, columns in self.RECOMMENDED_INDEXES.iteritems():
+            if not any(idx[:len(columns)] == columns for idx in existing):
+                d[name] = columns
+        for name, columns in self.UNIQUE_INDEXES.iteritems():
+            if columns not in existing:
+                d[name] = columns
+        return d
+
+    def create_index(self, name, columns):
+        """Creates an index on the accounting table.
+
+        The index is unique if it is one of the UNIQUE_INDEXES.
+        """
+        cmd = ("CREATE %sINDEX %s ON ge_jobs (%s)"
+               % ("UNIQUE " if name in self.UNIQUE_INDEXES else "",
+                  name, ", ".join(columns)))
+        logger.info("Creating index: `%s`" % cmd)
+        with self._connection() as conn:
+            curs = conn.cursor()
+            curs.execute(cmd)
+
+    def insert_jobs(self, columns, rows, batch_size=5000, target=None):
+        """Inserts job records into the accounting table.
+
+        All the rows are inserted in a single transaction, sending up to
+        'batch_size' of them in each (multi-row) INSERT. Records already
+        in the table (see UNIQUE_INDEXES) are ignored. Returns the number
+        of rows inserted.
+        target: connection options of the database ('gecollector' by
+                default).
+        """
+        target = target or CONF.gecollector
+        if target.driver == "sqlite":
+            cmd, mark = "INSERT OR IGNORE", "?"
+        else:
+            cmd, mark = "INSERT IGNORE", "%s"
+        cmd = ("%s INTO ge_jobs (%s) VALUES (%s)"
+               % (cmd, ",".join(columns), ",".join([mark] * len(columns))))
+
+        inserted = 0
+        with self._connection(target) as conn:
+            curs = conn.cursor()
             try:
-                d[index] += cpu_time
-            except KeyError:
-                d[index] = cpu_time
+                for i in xrange(0, len(rows), batch_size):
+                    curs.executemany(cmd, rows[i:i + batch_size])
+                    inserted += curs.rowcount
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return inserted
+
+    def _query_metric(self, parameter, group_by, conditions=None, top=None,
+                      fan_out=None):
+        """Runs 'query' grouped by 'group_by' and, if given, 'fan_out'.
+
+        Returns the result and its keys: the 'group_by' values, or the
+        (fan_out value, group_by value) tuples. The fan-out column goes
+        last, so the proportion leftover is computed for each of its
+        values, and so are the 'top' keys.
+        """
+        if not fan_out:
+            res = self.query(parameter, [group_by], conditions=conditions,
+                             top=top)
+            return res, res.keys[0]
+
+        res = self.query(parameter, [group_by, fan_out],
+                         conditions=conditions)
+        if top:
+            res = self._fold_top_fan_out(res, top)
+        return res, zip(res.keys[1], res.keys[0])
+
+    def _get_hours(self, aggregate, group_by, conditions=None, top=None,
+                   fan_out=None):
+        """Retrieves the sums of a time aggregate, in hours, by key.
+
+        When sampling, the result gets the 'sample_rate' and the error
+        bounds: the sums of squares of the sample give the variance of the
+        scaled sums, N(N-1)*SUM(x*x) for a 1 in N sample.
+        """
+        parameter = [aggregate]
+        rate = self._sample_rate()
+        if rate:
+            parameter.append("%s_squares" % aggregate)
+        res, keys = self._query_metric(parameter, group_by,
+                                       conditions=conditions, top=top,
+                                       fan_out=fan_out)
+        d = self._sum_by_key(keys, res.sums[0]).scaled(1 / 3600.0)
+        if not rate:
+            return d
+
+        d.sample_rate = rate
+        d.errors = self._sum_by_key(keys, res.sums[1]).apply(
+            lambda v: utils.to_hours(self.CONFIDENCE_Z *
+                                     math.sqrt(rate * (rate - 1) * v),
+                                     ndigits=None))
         return d
 
-    def get_wall_clock(self, group_by, conditions=None):
+    def get_cpu_time(self, group_by, conditions=None, top=None,
+                     fan_out=None):
+        """Computes the CPU time grouped by 'ge_group' in hours.
+
+        conditions: extra conditions to be added to the SQL query.
+        top: only return the 'top' groups (plus 'others').
+        fan_out: also group by this column (see '_query_metric').
+        """
+        return self._get_hours("cpu_time", group_by, conditions=conditions,
+                               top=top, fan_out=fan_out)
+
+    def get_wall_clock(self, group_by, conditions=None, top=None,
+                       fan_out=None):
         """Retrieves the WALLCLOCK time grouped by 'ge_group' in hours.
 
         Number of slots being used must be taken into account.
         conditions: extra conditions to be added to the SQL query.
+        top: only return the 'top' groups (plus 'others').
+        fan_out: also group by this column (see '_query_metric').
         """
-        d = {}
-        for item in self.query("wall_clock",
-                               [group_by, "ge_slots"],
-                               conditions=conditions):
-            index, slots, values = item
-            wall_clock = utils.to_hours(values)
-            try:
-                d[index] += wall_clock * slots
-            except KeyError:
-                d[index] = wall_clock * slots
-        return d
+        return self._get_hours("wall_clock", group_by,
+                               conditions=conditions, top=top,
+                               fan_out=fan_out)
+
+    def _efficiency_parameter(self, conditions, top):
+        """Returns the aggregates needed to compute the efficiency.
+
+        The ratio cannot be merged, so if the time window is split, several
+        clusters are queried or the 'others' sums are needed, the raw CPU
+        and WALLCLOCK sums are used.
+        """
+        if top or len(self._get_tasks(conditions)) > 1:
+            return ["cpu_time", "wall_clock"]
+        return "efficiency"
+
+    def get_efficiency(self, group_by, conditions=None, top=None,
+                       fan_out=None):
+        """Retrieves the efficiency (in %) grouped by 'ge_group'.
+
+        The ratio between the CPU and WALLCLOCK sums is computed by the
+        database, so a single query is needed. If the results have to be
+        merged (split time window, several clusters) or only the 'top'
+        groups (by CPU time) are requested, the ratio is computed from the
+        sums instead.
+        conditions: extra conditions to be added to the SQL query.
+        fan_out: also group by this column (see '_query_metric').
+        """
+        parameter = self._efficiency_parameter(conditions, top)
+        res, keys = self._query_metric(parameter, group_by,
+                                       conditions=conditions, top=top,
+                                       fan_out=fan_out)
+        if parameter != "efficiency":
+            d = self._efficiency(keys, res.sums[0], res.sums[1])
+        else:
+            d = result.MetricResult(itertools.izip(keys, res.sums[0]))
+        return self._approximate(d)
+
+    def _approximate(self, d):
+        """Sets the 'sample_rate' of the result if sampling (no errors).
+
+        Timelines are returned as 'collector.Approximate'.
+        """
+        rate = self._sample_rate()
+        if not rate:
+            return d
+        if isinstance(d, result.MetricResult):
+            d.sample_rate = rate
+            return d
+        return collector.Approximate(d, sample_rate=rate)
+
+    def _new_sketch(self):
+        return sketch.Sketch(accuracy=CONF.gecollector.sketch_accuracy)
+
+    def _bucket_sql(self, distribution, target=None):
+        """Returns the bucket column of a distribution for the target."""
+        target = target or CONF.gecollector
+        value = self.DISTRIBUTIONS[distribution][target.driver]
+        return self._new_sketch().bucket_sql(value)
 
-    def get_efficiency(self, group_by, conditions=None):
-        """Retrieves the CPU time grouped by 'ge_group'.
+    def get_sketches(self, distribution, group_by, conditions=None,
+                     fan_out=None):
+        """Returns the sketch of the distribution of a value by group.
 
+        The database counts the jobs falling in each of the buckets of
+        the sketches, so no job rows are transferred; the counts of split
+        time windows and clusters are merged as any other sum.
+        distribution: one of the DISTRIBUTIONS.
         conditions: extra conditions to be added to the SQL query.
+        fan_out: also group by this column, keying the sketches by
+                 (fan_out value, group_by value).
         """
+        columns = [group_by]
+        if fan_out:
+            columns.append(fan_out)
+        res = self.query("jobs",
+                         columns + [functools.partial(self._bucket_sql,
+                                                      distribution)],
+                         conditions=conditions)
+        keys = res.keys[0]
+        if fan_out:
+            keys = zip(res.keys[1], res.keys[0])
         d = {}
-        d_cpu = self.get_cpu_time(group_by,
-                                  conditions=conditions)
-        d_wall = self.get_wall_clock(group_by,
-                                     conditions=conditions)
-        if len(d_cpu.keys()) != len(d_wall.keys()):
-            raise exception.CannotComputeEfficiency()
-        for k, v in d_cpu.iteritems():
-            try:
-                d[k] = round(((d_cpu[k]/d_wall[k])*100), 2)
-            except ZeroDivisionError:
-                d[k] = 0
+        for key, index, count in itertools.izip(keys, res.keys[-1],
+                                                res.sums[0]):
+            if key not in d:
+                d[key] = self._new_sketch()
+            d[key].add_bucket(index, int(count))
         return d
+
+    def _get_percentile(self, distribution, group_by, conditions=None,
+                        percentile=None, fan_out=None):
+        if percentile is None:
+            percentile = 50
+        d = self.get_sketches(distribution, group_by, conditions=conditions,
+                              fan_out=fan_out)
+        return self._approximate(result.MetricResult(
+            (k, utils.to_hours(s.quantile(percentile / 100.0),
+                               ndigits=None))
+            for k, s in d.iteritems()))
+
+    def get_wait_time(self, group_by, conditions=None, top=None,
+                      percentile=None, fan_out=None):
+        """Retrieves the percentile of the queue wait time in hours.
+
+        conditions: extra conditions to be added to the SQL query.
+        top: not supported, percentiles cannot be folded into 'others'.
+        percentile: percentile to return (0-100, the median by default).
+        fan_out: also group by this column (see 'get_sketches').
+        """
+        return self._get_percentile("wait_time", group_by,
+                                    conditions=conditions,
+                                    percentile=percentile,
+                                    fan_out=fan_out)
+
+    def get_runtime(self, group_by, conditions=None, top=None,
+                    percentile=None, fan_out=None):
+        """Retrieves the percentile of the job runtime in hours.
+
+        conditions: extra conditions to be added to the SQL query.
+        top: not supported, percentiles cannot be folded into 'others'.
+        percentile: percentile to return (0-100, the median by default).
+        fan_out: also group by this column (see 'get_sketches').
+        """
+        return self._get_percentile("runtime", group_by,
+                                    conditions=conditions,
+                                    percentile=percentile,
+                                    fan_out=fan_out)
+
+    def _running_conditions(self, conditions):
+        """Turns the time window into the one of the jobs running in it.
+
+        Returns the (start, end) of the window, in epoch seconds, and the
+        conditions selecting the jobs that overlap it.
+        """
+        conditions = dict(conditions or {})
+        start = conditions.pop("ge_start_time", None)
+        end = conditions.pop("ge_end_time", None)
+        if not (start and end):
+            raise exception.UnboundedTimeWindow(metric="occupancy")
+        conditions["ge_end_time_after"] = start
+        conditions["ge_start_time_before"] = end
+        return (utils.to_timestamp(start), utils.to_timestamp(end),
+                conditions)
+
+    def _build_timeline_query(self, group_by, conditions, fan_out=None):
+        """Builds the SQL command streaming the jobs ordered by start."""
+        cond = self._format_conditions(**conditions)[0]
+        columns = [fan_out, group_by] if fan_out else [group_by]
+        return ("SELECT %s,ge_start_time,ge_end_time,ge_slots FROM ge_jobs "
+                "%s ORDER BY ge_start_time" % (",".join(columns), cond))
+
+    def _fetch_intervals(self, curs):
+        """Yields the (key, start, end, slots) rows of a timeline query.
+
+        If the query has a fan-out column, the keys are (fan_out value,
+        group_by value) tuples.
+        """
+        while True:
+            rows = curs.fetchmany(CONF.gecollector.fetch_size)
+            if not rows:
+                break
+            for row in rows:
+                key = row[0] if len(row) == 4 else tuple(row[:-3])
+                start, end, slots = row[-3:]
+                yield (key, utils.to_timestamp(start),
+                       utils.to_timestamp(end), slots)
+
+    def get_occupancy(self, group_by, conditions=None, top=None,
+                      resolution=None, fan_out=None):
+        """Retrieves the busy slots over time, grouped by 'ge_group'.
+
+        The jobs running in the time window are streamed once, ordered by
+        start time, and swept to compute the average number of busy slots
+        in each bucket of 'resolution' (hour by default). Each of the
+        clusters is queried in a single pass, without splitting the time
+        window, on the hosts chosen as for the rest of the queries.
+        Returns a list of (bucket start, busy slots) by group.
+        conditions: extra conditions to be added to the SQL query, the
+                    time window (start and end time) is mandatory.
+        top: not supported, timelines cannot be folded into 'others'.
+        fan_out: also group by this column, keying the timelines by
+                 (fan_out value, group_by value).
+        """
+        step = self.RESOLUTIONS[resolution or "hour"]
+        start, end, running = self._running_conditions(conditions)
+        cmd = self._build_timeline_query(group_by, running, fan_out=fan_out)
+
+        def _breakdown(name, key):
+            if fan_out:
+                return (key[0], "%s/%s" % (name, key[1]))
+            return "%s/%s" % (name, key)
+
+        def _sweep(conn, target):
+            # MySQL rows are streamed from the server instead of being
+            # stored in the client before the sweep
+            if target.driver == "mysql":
+                curs = conn.cursor(MySQLdb.cursors.SSCursor)
+            else:
+                curs = conn.cursor()
+            with contextlib.closing(curs):
+                logger.debug("MySQL command: `%s`" % cmd)
+                curs.execute(cmd)
+                return self._occupancy(self._fetch_intervals(curs), start,
+                                       end, step)
+
+        def _run(name, target, chunk):
+            d = self._on_hosts(target, conditions,
+                               lambda conn: _sweep(conn, target))
+            if name and CONF.gecollector.cluster_breakdown:
+                d = dict((_breakdown(name, k), v) for k, v in d.iteritems())
+            return d
+
+        tasks = [(name, target, running)
+                 for name, target in self._get_targets()]
+        timelines = {}
+        for d in self._map_tasks(_run, tasks):
+            for k, timeline in d.iteritems():
+                if k not in timelines:
+                    timelines[k] = timeline
+                else:
+                    timelines[k] = [(label, v + w) for (label, v), (_, w)
+                                    in itertools.izip(timelines[k],
+                                                      timeline)]
+        rate = self._sample_rate()
+        if rate:
+            for k, timeline in timelines.iteritems():
+                timelines[k] = [(label, v * rate) for label, v in timeline]
+        return self._approximate(timelines)
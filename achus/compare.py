@@ -0,0 +1,235 @@
+import datetime
+import json
+import logging
+
+from oslo.config import cfg
+
+from achus import checkpoint
+import achus.collector
+from achus import exception
+from achus import utils
+
+opts = [
+    cfg.StrOpt('period_store',
+               default=None,
+               help='Directory where the results of the collector calls '
+                    'over closed time windows (e.g. the past periods of '
+                    'the comparison metrics) are kept, so that they are '
+                    'only queried once (if not set, nothing is kept).'),
+    cfg.IntOpt('period_close_delay',
+               default=3600,
+               help='Seconds after the end of a time window before it is '
+                    'taken as closed, so that the accounting of its last '
+                    'jobs is loaded before its results are kept in '
+                    'period_store (and before achus-materialize runs).'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts)
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+PERIODS = ["day", "week", "month", "year"]
+
+# Labels of the periods, from their start
+PERIOD_LABELS = {
+    "day": "%Y-%m-%d",
+    "week": "%Y-%m-%d",
+    "month": "%Y-%m",
+    "year": "%Y",
+}
+
+# Values derived from the periods compared, from (current, other) values
+DERIVATIONS = {
+    "delta": lambda current, other: current - other,
+    "growth": lambda current, other: (100.0 * (current - other) / other
+                                      if other else 0.0),
+}
+
+# Metrics whose values are not numbers, so they cannot be compared
+TIMELINE_METRICS = ["occupancy"]
+
+
+class PeriodStore(checkpoint.Checkpoint):
+    """Results of the collector calls over closed time windows.
+
+    The jobs of a time window that ended do not change, so the result of
+    a call is kept, keyed by the collector and its source (e.g. the
+    databases it queries, see BaseCollector.source), the metric and the
+    arguments of the call, and returned to any later call with the same
+    ones (from any report). Results of open windows, or of a sample of
+    the jobs, are never kept. Windows ended less than
+    'period_close_delay' seconds ago are still open, as their last jobs
+    may not be loaded yet.
+    """
+
+    @classmethod
+    def from_conf(cls):
+        """Returns the store under 'period_store', or None if not set."""
+        if not CONF.period_store:
+            return None
+        return cls(CONF.period_store)
+
+    def _name(self, collector, metric, group_by, kwargs):
+        window = [utils.format_time(utils.parse_time(kwargs[k]))
+                  if kwargs.get(k) else None
+                  for k in ("start_time", "end_time")]
+        args = dict((k, v) for k, v in kwargs.iteritems()
+                    if k not in ("start_time", "end_time"))
+        return json.dumps([collector.__class__.__name__, collector.source(),
+                           metric, group_by, args] + window,
+                          sort_keys=True, default=str)
+
+    def is_closed(self, end_time, now=None):
+        """Whether a window ending at 'end_time' is closed at 'now'."""
+        delay = datetime.timedelta(seconds=CONF.period_close_delay)
+        return (utils.parse_time(end_time) + delay <=
+                (now or datetime.datetime.now()))
+
+    def collect(self, collector, metric, group_by, now=None, **kwargs):
+        """Same as 'collector.get', through the store if the window closed.
+
+        'now' (defaults to the current time) decides whether the window
+        is closed.
+        """
+        end_time = kwargs.get("end_time")
+        if not end_time or not self.is_closed(end_time, now):
+            return collector.get(metric, group_by, **kwargs)
+
+        name = self._name(collector, metric, group_by, kwargs)
+        result = self.get("period", name)
+        if result is not None:
+            logger.debug("Result of '%s' from %s to %s read from the store"
+                         % (metric, kwargs.get("start_time"), end_time))
+            return result
+        result = collector.get(metric, group_by, **kwargs)
+        if not getattr(result, "sample_rate", None):
+            self.save("period", name, result)
+        return result
+
+
+class Comparison(object):
+    """Period over period comparison of a metric.
+
+    Defined by the 'compare' field of a metric:
+
+        compare:
+            period: month           # day, week, month (default) or year
+            with: [previous, last_year]
+            derive: growth          # delta, growth (%) or nothing
+            end_time: "2014-01-01"  # the current period is the one
+                                    # before it (defaults to the
+                                    # metric's, or now)
+
+    Each period is gathered through the collector on its own, and the
+    ones already closed are kept in the 'PeriodStore', so that once they
+    are stored only the current period is queried.
+
+    The result holds, for each key, a list of (period, value) pairs in
+    chronological order, or of ("vs <period>", value) pairs with the
+    values derived from the current period and each of the others.
+    """
+
+    def __init__(self, title, definition, now=None):
+        self.title = title
+        compare = definition["compare"] or {}
+        if definition.get("metric") in TIMELINE_METRICS:
+            self._invalid("'%s' is not a numeric metric"
+                          % definition["metric"])
+
+        self.period = compare.get("period", "month")
+        if self.period not in PERIODS:
+            self._invalid("unknown period '%s'" % self.period)
+
+        self.compare_with = compare.get("with", ["previous"])
+        if isinstance(self.compare_with, basestring):
+            self.compare_with = [self.compare_with]
+        for other in self.compare_with:
+            if other not in ("previous", "last_year"):
+                self._invalid("unknown period to compare with '%s'" % other)
+
+        self.derive = compare.get("derive")
+        if self.derive is not None and self.derive not in DERIVATIONS:
+            self._invalid("unknown derivation '%s'" % self.derive)
+
+        self.end_time = compare.get("end_time", definition.get("end_time"))
+        self.now = now
+
+    def _invalid(self, reason):
+        raise exception.InvalidComparison(metric=self.title, reason=reason)
+
+    def _now(self):
+        return self.now or datetime.datetime.now()
+
+    def _shift(self, start, other):
+        if other == "previous":
+            return utils.shift_period(start, self.period, -1)
+        # Same period one year before, whole weeks back for weeks so
+        # that they still start on Monday
+        if self.period == "week":
+            return utils.shift_period(start, "week", -52)
+        return utils.shift_period(start, "year", -1)
+
+    def periods(self):
+        """Returns the (label, start, end) of the periods, current first."""
+        if self.end_time:
+            reference = (utils.parse_time(self.end_time) -
+                         datetime.timedelta(seconds=1))
+        else:
+            reference = self._now()
+        current = utils.period_start(reference, self.period)
+        starts = [current] + [self._shift(current, other)
+                              for other in self.compare_with]
+        return [(start.strftime(PERIOD_LABELS[self.period]), start,
+                 utils.shift_period(start, self.period, 1))
+                for start in starts]
+
+    def _get_period(self, store, collector, metric, group_by, start, end,
+                    kwargs):
+        kwargs = dict(kwargs, start_time=utils.format_time(start),
+                      end_time=utils.format_time(end))
+        if store is None:
+            return collector.get(metric, group_by, **kwargs)
+        return store.collect(collector, metric, group_by, now=self._now(),
+                             **kwargs)
+
+    def get(self, collector, metric, group_by, **kwargs):
+        """Gathers the periods through 'collector.get' and compares them.
+
+        The time window in 'kwargs', if any, is replaced by the one of
+        each of the periods.
+        """
+        kwargs.pop("start_time", None)
+        kwargs.pop("end_time", None)
+        store = PeriodStore.from_conf()
+        results = [(label, start,
+                    self._get_period(store, collector, metric, group_by,
+                                     start, end, kwargs))
+                   for label, start, end in self.periods()]
+        return self._compare(results)
+
+    def _compare(self, results):
+        keys = set()
+        for _, _, result in results:
+            keys.update(result.iterkeys())
+
+        current, others = results[0][2], results[1:]
+        compared = {}
+        for key in keys:
+            if self.derive is None:
+                compared[key] = [(label, result.get(key, 0.0))
+                                 for label, _, result in sorted(
+                                     results, key=lambda r: r[1])]
+                continue
+            derive = DERIVATIONS[self.derive]
+            compared[key] = [("vs %s" % label,
+                              derive(current.get(key, 0.0),
+                                     result.get(key, 0.0)))
+                             for label, _, result in others]
+
+        sample_rate = getattr(current, "sample_rate", None)
+        if sample_rate:
+            return achus.collector.Approximate(compared,
+                                               sample_rate=sample_rate)
+        return compared
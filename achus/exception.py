@@ -42,6 +42,32 @@ class CannotComputeEfficiency(CollectorException):
     msg_fmt = "Cannot compute efficiency: Groups do not match!"
 
 
+class UnknownWindowChunk(CollectorException):
+    msg_fmt = "Unknown time window chunk '%(chunk)s'."
+
+
+class UnboundedTimeWindow(CollectorException):
+    msg_fmt = "Metric '%(metric)s' needs both start_time and end_time."
+
+
+class QueryTimeout(CollectorException):
+    msg_fmt = "Query exceeded its time budget of %(timeout)s seconds."
+
+
+class QueryTooExpensive(CollectorException):
+    msg_fmt = ("Query would examine about %(rows)s rows (maximum allowed "
+               "%(max_rows)s): %(cmd)s")
+
+
+class UnsupportedMetric(CollectorException):
+    msg_fmt = "Metric '%(metric)s' is not supported by %(collector)s."
+
+
+class CubeWindowExceeded(CollectorException):
+    msg_fmt = ("Time window %(start)s - %(end)s is not inside the one of "
+               "the cube (%(cube_start)s - %(cube_end)s).")
+
+
 class UnknownChartType(AchusException):
     msg_fmt = "Unknown chart type '%(chart)s'."
 
@@ -74,5 +100,33 @@ class AggregateNotFound(InvalidReportDefinition):
     msg_fmt = "Cannot find aggregate '%(aggregate)s' for metric '%(metric)s'."
 
 
-class MySQLBackendException(AchusException):
+class InvalidComparison(InvalidReportDefinition):
+    msg_fmt = "Invalid comparison in metric '%(metric)s': %(reason)s."
+
+
+class BackendException(AchusException):
+    msg_fmt = "An unknown exception occurred in the database backend."
+
+
+class MySQLBackendException(BackendException):
+    pass
+
+
+class MySQLBackendUnavailable(MySQLBackendException):
+    pass
+
+
+class SQLiteBackendException(BackendException):
     pass
+
+
+class MissingRunDir(AchusException):
+    msg_fmt = "Cannot resume the report run, 'run_dir' is not set."
+
+
+class MissingPeriodStore(AchusException):
+    msg_fmt = "Cannot materialize the reports, 'period_store' is not set."
+
+
+class ReportNotFound(AchusException):
+    msg_fmt = "Unknown report '%(report)s'."
@@ -0,0 +1,128 @@
+import collections
+
+from oslo.config import cfg
+
+import achus.collector.gridengine
+
+opts = [
+    cfg.IntOpt('explain_max_unindexed_rows',
+               default=10000,
+               help='Estimated rows a table may be read without an index '
+                    '(e.g. with a full table scan) before it is counted as '
+                    'a problem by --explain, exiting with an error. '
+                    'Filesorts and temporary tables are only reported.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts)
+
+# Execution plan of a statement: EXPLAIN rows, estimated rows examined,
+# optimizer cost (None if the server does not report it) and cluster the
+# statement is run on (None if there is a single database)
+Plan = collections.namedtuple("Plan", ["cmd", "rows", "estimated_rows",
+                                       "cost", "cluster"])
+Plan.__new__.__defaults__ = (None,)
+
+
+def get_statements(report):
+    """Returns the SQL statements that the report definition would run.
+
+    The statements are returned as (cluster name, database options, cmd),
+    each of them built for the database it would be run on. Statements
+    repeated across metrics are only returned once, in the order they
+    would be first run.
+    """
+    statements = []
+    for title, conf, collector, calls in report.get_collector_calls():
+        if not isinstance(collector, achus.collector.gridengine.GECollector):
+            print("Skipping metric '%s': collector '%s' is not SQL based"
+                  % (title, conf["collector"]))
+            continue
+        for name, target, target_collector in collector.by_target():
+            for group_by, kwargs in calls:
+                for cmd in target_collector.statements(conf["metric"],
+                                                       group_by, **kwargs):
+                    if (name, target, cmd) not in statements:
+                        statements.append((name, target, cmd))
+    return statements
+
+
+def get_plans(report, collector=None):
+    """Runs EXPLAIN on the statements of the report definition.
+
+    Each of the statements is explained on the database it would be run
+    on. Only MySQL plans are available, the statements of other databases
+    are skipped.
+    """
+    collector = collector or achus.collector.gridengine.GECollector()
+    plans = []
+    for name, target, cmd in get_statements(report):
+        if target.driver != "mysql":
+            print("Skipping statement on cluster '%s': EXPLAIN is only "
+                  "available on MySQL" % name)
+            continue
+        rows = collector.explain(cmd, target)
+        estimated_rows = 1
+        for row in rows:
+            # Rows examined for each row of the previous tables
+            estimated_rows *= row.get("rows") or 1
+        plans.append(Plan(cmd, rows, estimated_rows,
+                          collector.explain_cost(cmd, target), name))
+    return plans
+
+
+def _is_problem(row):
+    """Whether too many rows of the table are read without an index."""
+    return (row.get("key") is None and
+            (row.get("rows") or 0) > CONF.explain_max_unindexed_rows)
+
+
+def _warnings(row):
+    extra = row.get("Extra") or ""
+    warnings = []
+    if row.get("type") == "ALL":
+        warnings.append("full table scan")
+    elif row.get("key") is None and row.get("rows"):
+        warnings.append("no index")
+    if "Using filesort" in extra:
+        warnings.append("filesort")
+    if "Using temporary" in extra:
+        warnings.append("temporary table")
+    return warnings
+
+
+def print_plans(plans):
+    """Prints the execution plans, returning the number of problems found.
+
+    Full table scans, reads without an index, filesorts and temporary
+    tables are pointed out, but only the tables read without an index
+    beyond 'explain_max_unindexed_rows' are counted as problems.
+    """
+    problems = 0
+    total_rows = 0
+    total_cost = 0.0
+    for plan in plans:
+        if plan.cluster:
+            print("[%s] %s" % (plan.cluster, plan.cmd))
+        else:
+            print(plan.cmd)
+        for row in plan.rows:
+            warnings = _warnings(row)
+            if _is_problem(row):
+                problems += 1
+            print("  table=%s type=%s key=%s rows=%s extra=%s%s"
+                  % (row.get("table"), row.get("type"), row.get("key"),
+                     row.get("rows"), row.get("Extra") or "",
+                     " [%s]" % ", ".join(warnings) if warnings else ""))
+        print("  estimated rows=%s cost=%s"
+              % (plan.estimated_rows,
+                 "unknown" if plan.cost is None else plan.cost))
+        total_rows += plan.estimated_rows
+        total_cost += plan.cost or 0.0
+
+    print("%s statements, estimated rows=%s cost=%s"
+          % (len(plans), total_rows, total_cost))
+    if problems:
+        print("Found %s potential problems, consider running "
+              "'achus-db create-indexes'." % problems)
+    return problems
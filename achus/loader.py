@@ -0,0 +1,183 @@
+import datetime
+import logging
+import os
+import time
+
+from oslo.config import cfg
+
+import achus.collector.gridengine
+from achus import utils
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+opts = [
+    cfg.StrOpt('accounting_file',
+               default='/opt/sge/default/common/accounting',
+               help='GridEngine accounting file to load.'),
+    cfg.StrOpt('offset_file',
+               default=None,
+               help='File where the position up to which the accounting '
+                    'file has been loaded is saved (defaults to the '
+                    'accounting file plus ".offset").'),
+    cfg.IntOpt('batch_size',
+               default=5000,
+               help='Number of records sent in each INSERT.'),
+    cfg.IntOpt('transaction_size',
+               default=100000,
+               help='Number of records loaded in each transaction (the '
+                    'offset is saved after each of them).'),
+    cfg.BoolOpt('follow',
+                default=False,
+                help='Keep waiting for new records once the end of the '
+                     'accounting file is reached.'),
+    cfg.IntOpt('poll_interval',
+               default=10,
+               help='Seconds between checks for new records when '
+                    'following the accounting file.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts, group="load")
+
+# Fields of the accounting file records, see accounting(5)
+FIELDS = [
+    "qname", "hostname", "group", "owner", "job_name", "job_number",
+    "account", "priority", "submission_time", "start_time", "end_time",
+    "failed", "exit_status", "ru_wallclock", "ru_utime", "ru_stime",
+    "ru_maxrss", "ru_ixrss", "ru_ismrss", "ru_idrss", "ru_isrss",
+    "ru_minflt", "ru_majflt", "ru_nswap", "ru_inblock", "ru_oublock",
+    "ru_msgsnd", "ru_msgrcv", "ru_nsignals", "ru_nvcsw", "ru_nivcsw",
+    "project", "department", "granted_pe", "slots", "task_number", "cpu",
+    "mem", "io", "category", "iow", "pe_taskid", "maxvmem", "arid",
+    "ar_submission_time",
+]
+
+# Records must have at least up to the 'cpu' field (older versions of
+# GridEngine lack the last ones)
+MIN_FIELDS = FIELDS.index("cpu") + 1
+
+TIME_FIELDS = ["submission_time", "start_time", "end_time",
+               "ar_submission_time"]
+_TIME_INDEXES = [FIELDS.index(f) for f in TIME_FIELDS]
+
+COLUMNS = ["ge_%s" % f for f in FIELDS]
+
+
+def _format_timestamp(value):
+    if not value or value == "0":
+        return None
+    return utils.format_time(datetime.datetime.fromtimestamp(int(value)))
+
+
+def parse_record(line):
+    """Parses a line of the accounting file into a row of COLUMNS.
+
+    Returns None for comments and malformed records.
+    """
+    if line.startswith("#"):
+        return None
+    row = line.rstrip("\n").split(":")
+    if len(row) < MIN_FIELDS:
+        return None
+    row = row[:len(FIELDS)] + [None] * (len(FIELDS) - len(row))
+    try:
+        for i in _TIME_INDEXES:
+            row[i] = _format_timestamp(row[i])
+    except ValueError:
+        return None
+    return row
+
+
+class AccountingLoader(object):
+    """Loads the GridEngine accounting file into the ge_jobs table.
+
+    The file is read from the position saved in 'offset_file' (from the
+    start if the file was rotated or truncated) and the records are
+    inserted in large transactions, saving the position after each of
+    them. Records already loaded are ignored by the database (see
+    GECollector.UNIQUE_INDEXES), so loading a record twice is harmless.
+    """
+
+    def __init__(self, collector=None, accounting_file=None,
+                 offset_file=None):
+        self.collector = (collector or
+                          achus.collector.gridengine.GECollector())
+        self.accounting_file = accounting_file or CONF.load.accounting_file
+        self.offset_file = (offset_file or CONF.load.offset_file or
+                            "%s.offset" % self.accounting_file)
+
+    def _read_offset(self):
+        """Returns the (inode, offset) saved, (None, 0) if none."""
+        try:
+            with open(self.offset_file) as f:
+                inode, offset = f.read().split()
+            return int(inode), int(offset)
+        except (IOError, ValueError):
+            return None, 0
+
+    def _write_offset(self, inode, offset):
+        tmp = "%s.tmp" % self.offset_file
+        with open(tmp, "w") as f:
+            f.write("%s %s\n" % (inode, offset))
+        os.rename(tmp, self.offset_file)
+
+    def _flush(self, rows, inode, offset):
+        inserted = self.collector.insert_jobs(COLUMNS, rows,
+                                              batch_size=CONF.load.batch_size)
+        self._write_offset(inode, offset)
+        logger.info("Loaded %s records (%s new), offset %s"
+                    % (len(rows), inserted, offset))
+        return inserted
+
+    def load(self):
+        """Loads the records added since the last run.
+
+        Only complete lines are loaded, a partially written last record
+        is left for the next run. Returns the number of (read, inserted)
+        records.
+        """
+        saved_inode, saved_offset = self._read_offset()
+        offset = saved_offset
+        read = inserted = 0
+        with open(self.accounting_file, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if saved_inode != stat.st_ino or stat.st_size < offset:
+                logger.info("Loading '%s' from the start"
+                            % self.accounting_file)
+                offset = 0
+            f.seek(offset)
+
+            rows = []
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                offset += len(line)
+                row = parse_record(line)
+                if row is None:
+                    if not line.startswith("#"):
+                        logger.warning("Skipping malformed record: %s"
+                                       % line.rstrip())
+                    continue
+                rows.append(row)
+                if len(rows) >= CONF.load.transaction_size:
+                    inserted += self._flush(rows, stat.st_ino, offset)
+                    read += len(rows)
+                    rows = []
+
+            if rows or (stat.st_ino, offset) != (saved_inode, saved_offset):
+                inserted += self._flush(rows, stat.st_ino, offset)
+                read += len(rows)
+        return read, inserted
+
+    def run(self):
+        """Loads the new records, forever if 'follow' is set."""
+        while True:
+            start = time.time()
+            read, inserted = self.load()
+            if read:
+                logger.info("%s records read (%s new) in %.2f seconds"
+                            % (read, inserted, time.time() - start))
+            if not CONF.load.follow:
+                return
+            time.sleep(CONF.load.poll_interval)
@@ -0,0 +1,142 @@
+import datetime
+import logging
+import os
+import time
+
+from oslo.config import cfg
+
+from achus import compare
+from achus import exception
+from achus import reporter
+from achus import utils
+
+opts = [
+    cfg.StrOpt('period',
+               default='month',
+               help='Period whose reports are materialized once closed '
+                    '(day, week, month or year).'),
+    cfg.BoolOpt('render',
+                default=False,
+                help='Render the reports too, into output_dir, besides '
+                     'gathering their metrics.'),
+    cfg.StrOpt('output_dir',
+               default='.',
+               help='Directory where the rendered reports are written, as '
+                    '<name>-<period><extension of output_file>.'),
+    cfg.IntOpt('niceness',
+               default=19,
+               help='Niceness increment of the scheduler process, so that '
+                    'it does not compete with the on-demand reports.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts, group="materialize")
+CONF.import_opt('period_store', 'achus.compare')
+CONF.import_opt('period_close_delay', 'achus.compare')
+CONF.import_opt('report_definition', 'achus.reporter')
+CONF.import_opt('report_definitions', 'achus.service', group="serve")
+CONF.import_opt('output_file', 'achus.renderer', group="renderer")
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class Materializer(object):
+    """Precomputes the reports of each period once it closes.
+
+    Every report definition registered (the 'report_definitions' of the
+    service, or 'report_definition') is run over the period just closed,
+    so that the results of its collector calls land in 'period_store'
+    and the on-demand runs for that period (achus-report, achus-serve)
+    are served from it instead of querying the database. The reports
+    are gathered one metric at a time, to keep the load low.
+    """
+
+    def __init__(self, report_definitions=None, available_collectors=None):
+        if not CONF.period_store:
+            raise exception.MissingPeriodStore()
+        self.report_definitions = (report_definitions or
+                                   CONF.serve.report_definitions or
+                                   {"default": CONF.report_definition})
+        self.available_collectors = available_collectors
+        self.period = CONF.materialize.period
+        self.delay = datetime.timedelta(seconds=CONF.period_close_delay)
+
+    def last_closed(self, now=None):
+        """Returns the (label, start, end) of the last period closed."""
+        now = now or datetime.datetime.now()
+        end = utils.period_start(now - self.delay, self.period)
+        start = utils.shift_period(end, self.period, -1)
+        return (start.strftime(compare.PERIOD_LABELS[self.period]),
+                start, end)
+
+    def next_run(self, now=None):
+        """Returns when the period running at 'now' is materialized."""
+        now = now or datetime.datetime.now()
+        start = utils.period_start(now - self.delay, self.period)
+        return utils.shift_period(start, self.period, 1) + self.delay
+
+    def _output_file(self, name, label):
+        ext = os.path.splitext(CONF.renderer.output_file)[1]
+        return os.path.join(CONF.materialize.output_dir,
+                            "%s-%s%s" % (name, label, ext))
+
+    def _precompute(self, rep, store):
+        for title, conf, collector, calls in rep.get_collector_calls():
+            logger.info("Materializing metric '%s'" % title)
+            for group_by, kwargs in calls:
+                if "compare" in conf:
+                    comparison = compare.Comparison(title, conf)
+                    comparison.get(collector, conf["metric"], group_by,
+                                   **kwargs)
+                else:
+                    store.collect(collector, conf["metric"], group_by,
+                                  **kwargs)
+
+    def materialize(self, label, start, end):
+        """Materializes the reports of a period, returning the failed ones.
+
+        A report failing does not stop the rest from being materialized.
+        """
+        store = compare.PeriodStore(CONF.period_store)
+        failed = []
+        for name, path in sorted(self.report_definitions.iteritems()):
+            logger.info("Materializing report '%s' for %s" % (name, label))
+            filename = self._output_file(name, label)
+            try:
+                # Some renderers write to the output file while appending
+                # the metrics
+                if CONF.materialize.render:
+                    CONF.set_override("output_file", filename,
+                                      group="renderer")
+                rep = reporter.Report(
+                    report_definition=path,
+                    available_collectors=self.available_collectors,
+                    start_time=utils.format_time(start),
+                    end_time=utils.format_time(end),
+                    checkpointed=False)
+                if CONF.materialize.render:
+                    rep.collect()
+                    rep.generate()
+                else:
+                    self._precompute(rep, store)
+            except Exception:
+                logger.exception("Cannot materialize report '%s'" % name)
+                failed.append(name)
+            finally:
+                if CONF.materialize.render:
+                    CONF.clear_override("output_file", group="renderer")
+        return failed
+
+    def run_forever(self):
+        """Materializes every period as soon as it closes.
+
+        That is, 'period_close_delay' seconds after its end.
+        """
+        while True:
+            next_run = self.next_run()
+            logger.info("Next period materialized at %s" % next_run)
+            while datetime.datetime.now() < next_run:
+                wait = next_run - datetime.datetime.now()
+                time.sleep(max(wait.total_seconds(), 1))
+            self.materialize(*self.last_closed())
@@ -0,0 +1,51 @@
+import contextlib
+import logging
+import Queue
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool(object):
+    """Keeps up to 'size' idle DB-API connections for reuse.
+
+    Connections are created on demand by calling 'factory'. Connections
+    that raised an error while in use are discarded instead of being
+    returned to the pool.
+    """
+
+    def __init__(self, factory, size):
+        self.factory = factory
+        self.idle = Queue.LifoQueue(size)
+
+    def get(self):
+        try:
+            return self.idle.get_nowait()
+        except Queue.Empty:
+            logger.debug("Opening a new pooled connection")
+            return self.factory()
+
+    def put(self, conn):
+        # Do not keep transactions (and their snapshots) open
+        conn.rollback()
+        try:
+            self.idle.put_nowait(conn)
+        except Queue.Full:
+            conn.close()
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self.get()
+        try:
+            yield conn
+        except Exception:
+            conn.close()
+            raise
+        self.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Queue.Empty:
+                break
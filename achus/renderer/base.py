@@ -13,8 +13,40 @@ class Renderer(object):
     """
     __metaclass__ = abc.ABCMeta
 
+    # Fields of the metric definitions used to render the metrics
+    RENDER_FIELDS = ["chart", "top"]
+
     def __init__(self):
         self.metrics = []
+        # achus.checkpoint.Checkpoint where the renderers able to do so
+        # keep the pages already rendered, if any
+        self.checkpoint = None
+        # File written by the renderers that write while the metrics are
+        # appended (see achus.renderer.export)
+        self.path = CONF.renderer.output_file
+
+    def _definition(self, metric_definition):
+        """Copies the RENDER_FIELDS of a metric definition.
+
+        The renderers keeping the metrics until rendered keep this copy
+        instead of the whole (mutable) definition.
+        """
+        return dict((k, metric_definition[k]) for k in self.RENDER_FIELDS
+                    if k in metric_definition)
+
+    def _title(self, title, metric):
+        """Title of a metric, marked if its values are approximate."""
+        sample_rate = getattr(metric, "sample_rate", None)
+        if sample_rate:
+            return "%s (approximate, 1 in %s jobs)" % (title, sample_rate)
+        return title
+
+    def _label(self, key, metric):
+        """Label of a metric key, with its error bound if known."""
+        error = (getattr(metric, "errors", None) or {}).get(key)
+        if error is not None:
+            return "%s (+/-%s)" % (key, round(error, 2))
+        return key
 
     @abc.abstractmethod
     def append_metric(self, title, metric, metric_definition):
@@ -6,6 +6,7 @@ from oslo.config import cfg
 
 from achus import exception
 import achus.renderer.base
+from achus import utils
 
 CONF = cfg.CONF
 CONF.import_opt('output_file', 'achus.renderer', group="renderer")
@@ -25,9 +26,15 @@ class Chart(achus.renderer.base.Renderer):
         super(Chart, self).__init__()
 
         self.chart_types = {
-            "pie": pygal.Pie(),
-            "horizontal_bar": pygal.HorizontalBar()
+            "pie": pygal.Pie,
+            "horizontal_bar": pygal.HorizontalBar,
+            "line": pygal.Line,
+            "bar": pygal.Bar,
         }
+        # Chart types plotting timelines, lists of (label, value) pairs
+        self.timeline_charts = ["line", "bar"]
+        # Configuration template shared by all the charts
+        self.config = pygal.Config()
 
     def append_metric(self, title, metric, metric_definition):
         if "chart" not in metric_definition:
@@ -36,15 +43,29 @@ class Chart(achus.renderer.base.Renderer):
 
         if metric_definition["chart"] not in self.chart_types:
             raise exception.UnknownChartType(chart=metric_definition["chart"])
-        self.metrics.append((title, metric, metric_definition))
+        self.metrics.append((title, metric,
+                             self._definition(metric_definition)))
+
+    def _new_chart(self, chart_type, title):
+        """Builds a new chart from the configuration template."""
+        config = self.config.copy()
+        config.title = title
+        return self.chart_types[chart_type](config)
 
     def _generate_charts(self):
         for chart_title, metric, metric_definition in self.metrics:
-            chart_type = metric_definition["chart"]
-            chart = self.chart_types[chart_type]
-            chart.title = chart_title
-            for k, v in metric.iteritems():
-                chart.add(k, v)
+            chart = self._new_chart(metric_definition["chart"],
+                                    self._title(chart_title, metric))
+            if metric_definition["chart"] in self.timeline_charts:
+                for k, timeline in sorted(metric.iteritems()):
+                    chart.x_labels = [label for label, _ in timeline]
+                    chart.add(k, [round(v, 2) for _, v in timeline])
+                yield chart
+                continue
+
+            values = utils.fold_top(metric, metric_definition.get("top"))
+            for k, v in values.iteritems():
+                chart.add(self._label(k, metric), round(v, 2))
             yield chart
 
     def render(self):
@@ -0,0 +1,107 @@
+import csv
+import json
+import logging
+import os
+import shutil
+
+from oslo.config import cfg
+
+import achus.renderer.base
+
+CONF = cfg.CONF
+CONF.import_opt('output_file', 'achus.renderer', group="renderer")
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class Export(achus.renderer.base.Renderer):
+    """Base class of the renderers exporting the raw metric values.
+
+    Unlike the chart renderers, the metrics are not kept: each of them is
+    written to 'path' as soon as it is appended (that is, as soon
+    as it is collected), one row per key (and time, for timelines), so
+    memory use does not depend on the size of the report and the file
+    can be read while the report is still running.
+    """
+
+    COLUMNS = ["metric", "key", "time", "value"]
+
+    def __init__(self):
+        super(Export, self).__init__()
+        self.output = None
+        self.finished = False
+
+    def _rows(self, title, metric):
+        for key, value in sorted(metric.iteritems()):
+            if isinstance(value, list):
+                # Timeline, list of (time, value) pairs
+                for label, v in value:
+                    yield (title, key, label, v)
+            else:
+                yield (title, key, None, value)
+
+    def _open(self):
+        self.output = open(self.path, "wb")
+
+    def _write(self, rows):
+        raise NotImplementedError
+
+    def _sync(self):
+        """Makes the rows written so far available to the readers."""
+        self.output.flush()
+
+    def _close(self):
+        self.output.close()
+
+    def append_metric(self, title, metric, metric_definition):
+        if self.output is None:
+            self._open()
+        self._write(self._rows(title, metric))
+        self._sync()
+        logger.debug("Metric '%s' exported to '%s'" % (title, self.path))
+
+    def finish(self):
+        """Completes the output file, no more metrics can be appended."""
+        if self.finished:
+            return
+        if self.output is None:
+            self._open()
+        self._close()
+        self.finished = True
+
+    def render(self):
+        """Completes the export and yields the output file contents."""
+        self.finish()
+        with open(self.path, "rb") as f:
+            for block in iter(lambda: f.read(65536), ""):
+                yield block
+
+    def render_to_file(self, filename=CONF.renderer.output_file):
+        """Completes the export, copying it into filename if needed."""
+        self.finish()
+        if os.path.abspath(filename) != os.path.abspath(self.path):
+            shutil.copyfile(self.path, filename)
+        logger.debug("Export created under '%s'" % filename)
+
+
+class CSVExport(Export):
+    """Exports the metrics as CSV, with a header row."""
+
+    def _open(self):
+        super(CSVExport, self)._open()
+        self.writer = csv.writer(self.output)
+        self.writer.writerow(self.COLUMNS)
+
+    def _write(self, rows):
+        self.writer.writerows([v.encode("utf-8") if isinstance(v, unicode)
+                               else v for v in row] for row in rows)
+
+
+class NDJSONExport(Export):
+    """Exports the metrics as newline delimited JSON objects."""
+
+    def _write(self, rows):
+        for row in rows:
+            self.output.write(json.dumps(dict(zip(self.COLUMNS, row))))
+            self.output.write("\n")
@@ -0,0 +1,65 @@
+from oslo.config import cfg
+import pyarrow
+import pyarrow.parquet
+
+import achus.renderer.export
+
+opts = [
+    cfg.IntOpt('row_group_size',
+               default=65536,
+               help='Number of rows of each row group of the Parquet '
+                    'exports.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts, group="renderer")
+
+
+def _text(value):
+    if isinstance(value, unicode):
+        return value
+    return str(value).decode("utf-8")
+
+
+class ParquetExport(achus.renderer.export.Export):
+    """Exports the metrics as a Parquet file.
+
+    Rows are buffered and written as a row group every 'row_group_size'
+    rows. The file can only be read once the export is finished.
+    """
+
+    SCHEMA = pyarrow.schema([
+        pyarrow.field("metric", pyarrow.string()),
+        pyarrow.field("key", pyarrow.string()),
+        pyarrow.field("time", pyarrow.string()),
+        pyarrow.field("value", pyarrow.float64()),
+    ])
+
+    def _open(self):
+        self.output = pyarrow.parquet.ParquetWriter(self.path, self.SCHEMA)
+        self.buffer = [[] for _ in self.COLUMNS]
+
+    def _flush(self):
+        if not self.buffer[0]:
+            return
+        arrays = [pyarrow.array(col, type=field.type)
+                  for col, field in zip(self.buffer, self.SCHEMA)]
+        self.output.write_table(pyarrow.Table.from_arrays(
+            arrays, names=self.COLUMNS))
+        self.buffer = [[] for _ in self.COLUMNS]
+
+    def _write(self, rows):
+        for metric, key, label, value in rows:
+            for col, v in zip(self.buffer, (_text(metric), _text(key),
+                                            label, float(value))):
+                col.append(v)
+            if len(self.buffer[0]) >= CONF.renderer.row_group_size:
+                self._flush()
+
+    def _sync(self):
+        # Row groups are only written once full
+        pass
+
+    def _close(self):
+        self._flush()
+        self.output.close()
@@ -1,3 +1,4 @@
+import itertools
 import logging
 import StringIO
 
@@ -21,6 +22,8 @@ class PDFChart(achus.renderer.base.Renderer):
 
     The metrics added using the append_metric method
     will be rendered into a PDF report containing charts.
+    If 'checkpoint' is set, the page of each chart is saved once
+    converted, and taken from there if it was already.
     """
 
     def __init__(self):
@@ -32,8 +35,17 @@ class PDFChart(achus.renderer.base.Renderer):
 
     def _generate_pdf(self):
         pdf_charts = []
-        for chart in self.chart.render():
-            pdf_charts.append(cairosvg.svg2pdf(bytestring=chart))
+        charts = self.chart._generate_charts()
+        for (title, _, _), chart in itertools.izip(self.chart.metrics,
+                                                   charts):
+            pdf = None
+            if self.checkpoint:
+                pdf = self.checkpoint.get_page(title)
+            if pdf is None:
+                pdf = cairosvg.svg2pdf(bytestring=chart.render())
+                if self.checkpoint:
+                    self.checkpoint.save_page(title, pdf)
+            pdf_charts.append(pdf)
 
         output = PyPDF2.PdfFileWriter()
         for pdf in pdf_charts:
@@ -0,0 +1,259 @@
+import logging
+import math
+import StringIO
+
+import cairo
+from oslo.config import cfg
+import pygal.style
+
+from achus import exception
+import achus.renderer.base
+from achus import utils
+
+CONF = cfg.CONF
+CONF.import_opt('output_file', 'achus.renderer', group="renderer")
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+def _hex_to_rgb(color):
+    color = color.lstrip("#")
+    return tuple(int(color[i:i + 2], 16) / 255.0 for i in (0, 2, 4))
+
+
+class VectorPDFChart(achus.renderer.base.Renderer):
+    """Generates PDF report containing charts, drawn directly with cairo.
+
+    Unlike PDFChart, the charts are not rendered to SVG and converted
+    afterwards: every metric is drawn as a page of a single PDF surface,
+    so the whole report is produced in one pass.
+    """
+
+    WIDTH = 800
+    HEIGHT = 600
+    MARGIN = 40
+    FONT = "Sans"
+    COLORS = [_hex_to_rgb(c) for c in pygal.style.DefaultStyle.colors]
+    BACKGROUND = (1, 1, 1)
+    FOREGROUND = _hex_to_rgb("#333333")
+    # Labels drawn at most along the x axis of the timelines
+    MAX_X_LABELS = 4
+
+    def __init__(self):
+        super(VectorPDFChart, self).__init__()
+
+        self.chart_types = {
+            "pie": self._draw_pie,
+            "horizontal_bar": self._draw_horizontal_bar,
+            "line": self._draw_line,
+            "bar": self._draw_bar,
+        }
+        # Chart types plotting timelines, lists of (label, value) pairs
+        self.timeline_charts = ["line", "bar"]
+
+    def append_metric(self, title, metric, metric_definition):
+        if "chart" not in metric_definition:
+            logging.debug("Not charting metric %s (no chart definition found)")
+            return
+
+        if metric_definition["chart"] not in self.chart_types:
+            raise exception.UnknownChartType(chart=metric_definition["chart"])
+        self.metrics.append((title, metric,
+                             self._definition(metric_definition)))
+
+    def _text(self, ctx, x, y, text, size=12, align="left"):
+        ctx.set_font_size(size)
+        if isinstance(text, unicode):
+            text = text.encode("utf-8")
+        else:
+            text = str(text)
+        if align == "right":
+            x -= ctx.text_extents(text)[4]
+        elif align == "center":
+            x -= ctx.text_extents(text)[4] / 2
+        ctx.move_to(x, y)
+        ctx.show_text(text)
+
+    def _draw_legend(self, ctx, labels, x, y):
+        for i, label in enumerate(labels):
+            ctx.set_source_rgb(*self.COLORS[i % len(self.COLORS)])
+            ctx.rectangle(x, y + i * 18 - 10, 12, 12)
+            ctx.fill()
+            ctx.set_source_rgb(*self.FOREGROUND)
+            self._text(ctx, x + 18, y + i * 18, label, size=11)
+
+    def _no_data(self, ctx):
+        self._text(ctx, self.WIDTH / 2, self.HEIGHT / 2, "No data",
+                   size=20, align="center")
+
+    def _draw_pie(self, ctx, items):
+        total = sum(v for _, v in items if v > 0)
+        if not total:
+            self._no_data(ctx)
+            return
+
+        self._draw_legend(ctx, ["%s: %s" % (k, v) for k, v in items],
+                          self.MARGIN, self.MARGIN * 2)
+
+        radius = (self.HEIGHT - self.MARGIN * 4) / 2.0
+        xc = self.WIDTH - self.MARGIN - radius
+        yc = self.MARGIN * 2 + radius
+        angle = -math.pi / 2
+        for i, (_, v) in enumerate(items):
+            if v <= 0:
+                continue
+            end = angle + 2 * math.pi * v / total
+            ctx.set_source_rgb(*self.COLORS[i % len(self.COLORS)])
+            ctx.move_to(xc, yc)
+            ctx.arc(xc, yc, radius, angle, end)
+            ctx.close_path()
+            ctx.fill_preserve()
+            ctx.set_source_rgb(*self.BACKGROUND)
+            ctx.stroke()
+            angle = end
+
+    def _draw_horizontal_bar(self, ctx, items):
+        top = self.MARGIN * 2
+        label_width = self.WIDTH / 4
+        width = self.WIDTH - label_width - self.MARGIN * 3
+        height = (self.HEIGHT - top - self.MARGIN) / float(max(len(items), 1))
+        maximum = max([v for _, v in items] + [0]) or 1
+
+        for i, (k, v) in enumerate(items):
+            y = top + i * height
+            ctx.set_source_rgb(*self.FOREGROUND)
+            self._text(ctx, self.MARGIN + label_width - 6,
+                       y + height / 2 + 4, k, size=11, align="right")
+            bar = max(v, 0) * width / maximum
+            ctx.set_source_rgb(*self.COLORS[i % len(self.COLORS)])
+            ctx.rectangle(self.MARGIN + label_width, y + height * 0.1,
+                          bar, height * 0.8)
+            ctx.fill()
+            ctx.set_source_rgb(*self.FOREGROUND)
+            self._text(ctx, self.MARGIN + label_width + bar + 6,
+                       y + height / 2 + 4, v, size=11)
+
+    def _plot_area(self, ctx, timelines):
+        """Draws the legend and the axes of a timelines chart.
+
+        Returns the left and width of the plot area and a function giving
+        the y coordinate of a value, or None if there is nothing to plot.
+        """
+        values = [v for _, timeline in timelines for _, v in timeline]
+        if not values:
+            self._no_data(ctx)
+            return None
+
+        self._draw_legend(ctx, [k for k, _ in timelines], self.MARGIN,
+                          self.MARGIN * 2)
+        left = self.MARGIN * 2 + self.WIDTH / 4
+        width = self.WIDTH - left - self.MARGIN * 2
+        top = self.MARGIN * 2
+        bottom = self.HEIGHT - self.MARGIN * 2
+        low = min(values + [0])
+        high = max(values + [0])
+        if high == low:
+            high = low + 1
+
+        def _y(v):
+            return bottom - (v - low) * (bottom - top) / float(high - low)
+
+        ctx.set_source_rgb(*self.FOREGROUND)
+        ctx.set_line_width(1)
+        ctx.move_to(left, top)
+        ctx.line_to(left, bottom)
+        ctx.move_to(left, _y(0))
+        ctx.line_to(left + width, _y(0))
+        ctx.stroke()
+        for v in sorted(set([low, 0, high])):
+            self._text(ctx, left - 6, _y(v) + 4, round(v, 2), size=11,
+                       align="right")
+        return left, width, _y
+
+    def _draw_x_labels(self, ctx, labels, xs):
+        """Draws up to MAX_X_LABELS of the labels, evenly spaced."""
+        ctx.set_source_rgb(*self.FOREGROUND)
+        step = int(math.ceil(len(labels) / float(self.MAX_X_LABELS))) or 1
+        for label, x in zip(labels, xs)[::step]:
+            self._text(ctx, x, self.HEIGHT - self.MARGIN * 2 + 16, label,
+                       size=10, align="center")
+
+    def _draw_line(self, ctx, timelines):
+        plot = self._plot_area(ctx, timelines)
+        if plot is None:
+            return
+
+        left, width, y = plot
+        labels = [label for label, _ in timelines[0][1]]
+        step = width / float(max(len(labels) - 1, 1))
+        self._draw_x_labels(ctx, labels,
+                            [left + j * step for j in range(len(labels))])
+        ctx.set_line_width(2)
+        for i, (_, timeline) in enumerate(timelines):
+            ctx.set_source_rgb(*self.COLORS[i % len(self.COLORS)])
+            for j, (_, v) in enumerate(timeline):
+                if j:
+                    ctx.line_to(left + j * step, y(v))
+                else:
+                    ctx.move_to(left, y(v))
+            ctx.stroke()
+
+    def _draw_bar(self, ctx, timelines):
+        plot = self._plot_area(ctx, timelines)
+        if plot is None:
+            return
+
+        left, width, y = plot
+        labels = [label for label, _ in timelines[0][1]]
+        group = width / float(max(len(labels), 1))
+        bar = group * 0.8 / len(timelines)
+        self._draw_x_labels(ctx, labels, [left + (j + 0.5) * group
+                                          for j in range(len(labels))])
+        for i, (_, timeline) in enumerate(timelines):
+            ctx.set_source_rgb(*self.COLORS[i % len(self.COLORS)])
+            for j, (_, v) in enumerate(timeline):
+                ctx.rectangle(left + j * group + group * 0.1 + i * bar,
+                              min(y(v), y(0)), bar, abs(y(v) - y(0)))
+            ctx.fill()
+
+    def _draw(self, surface):
+        """Draws every metric as a page of the given surface."""
+        ctx = cairo.Context(surface)
+        ctx.select_font_face(self.FONT,
+                             cairo.FONT_SLANT_NORMAL,
+                             cairo.FONT_WEIGHT_NORMAL)
+        for title, metric, metric_definition in self.metrics:
+            ctx.set_source_rgb(*self.BACKGROUND)
+            ctx.paint()
+            ctx.set_source_rgb(*self.FOREGROUND)
+            self._text(ctx, self.WIDTH / 2, self.MARGIN,
+                       self._title(title, metric), size=18, align="center")
+
+            if metric_definition["chart"] in self.timeline_charts:
+                items = [(self._label(k, metric),
+                          [(label, round(v, 2)) for label, v in timeline])
+                         for k, timeline in sorted(metric.iteritems())]
+            else:
+                values = utils.fold_top(metric,
+                                        metric_definition.get("top"))
+                items = [(self._label(k, metric), round(v, 2))
+                         for k, v in values.iteritems()]
+            self.chart_types[metric_definition["chart"]](ctx, items)
+            surface.show_page()
+        surface.finish()
+
+    def render(self):
+        """Generates the PDF report.
+
+        This method is a generator that yields the contents of the PDF
+        file, with a page for each of the metrics stored.
+        """
+        output_stream = StringIO.StringIO()
+        self._draw(cairo.PDFSurface(output_stream, self.WIDTH, self.HEIGHT))
+        yield output_stream.getvalue()
+
+    def render_to_file(self, filename=CONF.renderer.output_file):
+        """Write the PDF report into filename."""
+        self._draw(cairo.PDFSurface(filename, self.WIDTH, self.HEIGHT))
+        logger.debug("Result PDF created under '%s'" % filename)
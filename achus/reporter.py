@@ -1,13 +1,21 @@
+import collections
 import logging
+import multiprocessing
+import multiprocessing.pool
+import os
+import time
 
 from oslo.config import cfg
 import yaml
 
+from achus import checkpoint
+from achus import compare
 import achus.collector
 from achus import exception
 import achus.renderer
 import achus.renderer.chart
 import achus.renderer.pdf
+import achus.result
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -16,29 +24,115 @@ opts = [
     cfg.StrOpt('report_definition',
                default='etc/report.yaml',
                help='Report definition location.'),
+    cfg.IntOpt('collect_workers',
+               default=1,
+               help='Number of collector calls run at the same time.'),
+    cfg.IntOpt('collect_timeout',
+               default=0,
+               help='Seconds the whole collection may take (0 disables '
+                    'it). Metrics not gathered in time are failed.'),
+    cfg.BoolOpt('partial_results',
+                default=False,
+                help='Render the metrics that could be gathered when some '
+                     'of them fail, instead of failing the whole report.'),
+    cfg.StrOpt('fan_out',
+               default=None,
+               help='Render a document for each of the values of this '
+                    'field (e.g. group) instead of a single report. The '
+                    'metrics are gathered once, grouped by it as well, '
+                    'and split afterwards.'),
+    cfg.IntOpt('fan_out_workers',
+               default=4,
+               help='Number of processes rendering the fan-out '
+                    'documents.'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(opts)
+CONF.import_opt('output_file', 'achus.renderer', group="renderer")
+
+
+def _render_document(args):
+    """Renders one of the fan-out documents, in a worker process."""
+    filename, metrics, document_checkpoint = args
+    # Some renderers write to the output file while appending the metrics
+    CONF.set_override("output_file", filename, group="renderer")
+    renderer = achus.renderer.Renderer()
+    renderer.checkpoint = document_checkpoint
+    for title, metric, metric_definition in metrics:
+        renderer.append_metric(title, metric, metric_definition)
+    renderer.render_to_file(filename)
+    return filename
 
 
 class Report(object):
     """Main class, triggers reports based on the input given."""
 
-    def __init__(self):
+    def __init__(self, report_definition=None, report=None,
+                 available_collectors=None, resume=False, start_time=None,
+                 end_time=None, checkpointed=True, output_file=None):
+        """Loads the report.
+
+        report_definition: YAML report definition location (defaults to
+                           the 'report_definition' option).
+        report: already loaded report definition, not read from the YAML.
+        available_collectors: collector classes, discovered if not given.
+        resume: skip the metrics and pages already done by a previous run
+                of the same definition (see 'run_dir').
+        start_time, end_time: override the time window of all the metrics.
+        checkpointed: keep the run under 'run_dir', if set. The run
+                      directory is only created (or cleared, unless
+                      resuming) once the report is collected or
+                      generated, so loading a definition never touches it.
+        output_file: file the report is rendered to (defaults to the
+                     'output_file' option).
+        """
         self.collector_handler = achus.collector.CollectorHandler()
-        self.available_collectors = self.collector_handler.get_all_classes()
+        if available_collectors is None:
+            available_collectors = self.collector_handler.get_all_classes()
+        self.available_collectors = available_collectors
 
+        self.output_file = output_file or CONF.renderer.output_file
         self.renderer = achus.renderer.Renderer()
+        self.renderer.path = self.output_file
 
-        report = self._report_from_yaml(CONF.report_definition)
-        logger.debug("Loaded '%s' with content: %s"
-                     % (CONF.report_definition, report))
+        self.report_definition = report_definition or CONF.report_definition
+        if report is None:
+            report = self._report_from_yaml(self.report_definition)
+            logger.debug("Loaded '%s' with content: %s"
+                         % (self.report_definition, report))
         self.metric = report["metric"]
         self.aggregate = report["aggregate"]
+        for conf in self.metric.itervalues():
+            if start_time:
+                conf["start_time"] = start_time
+            if end_time:
+                conf["end_time"] = end_time
+        # (title, error) of the metrics that could not be gathered
+        self.failures = []
+        # Metrics of each of the fan-out documents, by fan-out value
+        self.fan_out = CONF.fan_out
+        self.documents = {}
+
+        self.checkpoint = None
+        self.checkpointed = checkpointed and bool(CONF.run_dir)
+        self.resume = resume
+        if resume and not self.checkpointed:
+            raise exception.MissingRunDir()
+
+    def _open_checkpoint(self):
+        """Opens the checkpoint of the run, the first time it is needed."""
+        if not self.checkpointed or self.checkpoint is not None:
+            return
+        self.checkpoint = checkpoint.Checkpoint.for_report(
+            {"metric": self.metric,
+             "aggregate": self.aggregate,
+             "fan_out": self.fan_out},
+            resume=self.resume)
+        self.renderer.checkpoint = self.checkpoint
 
     def _report_from_yaml(self, report_file):
-        with open(CONF.report_definition, "rb") as f:
+        with open(report_file, "rb") as f:
             yaml_data = yaml.safe_load(f)
 
         for i in ("aggregate", "metric"):
@@ -58,6 +152,9 @@ class Report(object):
                 raise exception.AggregateNotFound(
                     metric=name, aggregate=metric["aggregate"])
 
+            if "compare" in metric:
+                compare.Comparison(name, metric)
+
         return yaml_data
 
     def _get_collector_kwargs(self, d):
@@ -65,6 +162,7 @@ class Report(object):
         COLLECTOR_KWARGS = [
             "group", "project",
             "start_time", "end_time",
+            "top", "percentile", "resolution",
         ]
         d_kwargs = {}
         for k in d.keys():
@@ -91,12 +189,14 @@ class Report(object):
 
         return good_collectors
 
-    def collect(self):
-        """Gathers metric data."""
+    def get_collector_calls(self):
+        """Yields the collector calls needed to gather each metric.
+
+        Each item is a (title, conf, collector, calls) tuple, where 'calls'
+        is a list of (group_by, kwargs) to be passed to the collector.
+        """
         collectors = self._get_collectors()
         for title, conf in self.metric.iteritems():
-            logger.info("Gathering data from metric '%s'" % title)
-
             collector_name = conf["collector"]
             metric_name = conf["metric"]
 
@@ -107,18 +207,202 @@ class Report(object):
             group_by_list = self.aggregate[conf["aggregate"]].keys() or []
             logger.debug("Aggregate's group_by parameters: %s" % group_by_list)
 
+            calls = []
             for group_by in group_by_list:
                 # Add group_by to the condition list
                 d = {group_by: self.aggregate[conf["aggregate"]][group_by]}
                 conf.update(d)
                 kwargs = self._get_collector_kwargs(conf)
-                logger.debug("Passing kwargs to the collector: %s"
-                             % kwargs)
-                metric = collector.get(conf["metric"], group_by, **kwargs)
-                logger.debug("Result from collector: '%s'" % metric)
+                if self.fan_out:
+                    kwargs["fan_out"] = self.fan_out
+                calls.append((group_by, kwargs))
+            yield title, conf, collector, calls
+
+    def collect(self):
+        """Gathers metric data.
+
+        All the collector calls are issued through 'get_async' (up to
+        'collect_workers' running at the same time) and then gathered in
+        the order of the report definition.
+
+        If 'collect_timeout' is set, the metrics not gathered by then are
+        failed with QueryTimeout. Failed metrics abort the collection,
+        unless 'partial_results' is set: then they are logged, stored in
+        'failures' and left out of the report.
+
+        If 'fan_out' is set, the metrics are gathered grouped by it too,
+        and split into the 'documents' rendered by 'generate'.
+
+        If 'run_dir' is set, every metric gathered is saved as soon as it
+        is complete, and the ones saved by a resumed run are not gathered
+        again.
+
+        Metrics with a 'compare' field gather each of the periods compared
+        instead (see 'compare.Comparison').
+
+        If 'period_store' is set, the calls over closed time windows are
+        served from it, if already there (see 'compare.PeriodStore').
+        """
+        deadline = None
+        if CONF.collect_timeout:
+            deadline = time.time() + CONF.collect_timeout
+        timed_out = False
 
+        self._open_checkpoint()
+        store = compare.PeriodStore.from_conf()
+        pool = multiprocessing.pool.ThreadPool(CONF.collect_workers)
+        try:
+            pending = []
+            for title, conf, collector, calls in self.get_collector_calls():
+                if self.checkpoint:
+                    metric = self.checkpoint.get_metric(title)
+                    if metric is not None:
+                        logger.info("Metric '%s' already gathered" % title)
+                        pending.append((title, conf, [], metric))
+                        continue
+
+                logger.info("Gathering data from metric '%s'" % title)
+
+                comparison = None
+                if "compare" in conf:
+                    comparison = compare.Comparison(title, conf)
+
+                results = []
+                for group_by, kwargs in calls:
+                    logger.debug("Passing kwargs to the collector: %s"
+                                 % kwargs)
+                    if comparison:
+                        results.append(pool.apply_async(
+                            comparison.get,
+                            (collector, conf["metric"], group_by),
+                            kwargs))
+                        continue
+                    if store:
+                        results.append(pool.apply_async(
+                            store.collect,
+                            (collector, conf["metric"], group_by),
+                            kwargs))
+                        continue
+                    results.append(collector.get_async(pool,
+                                                       conf["metric"],
+                                                       group_by,
+                                                       **kwargs))
+                pending.append((title, conf, results, None))
+
+            for title, conf, results, metric in pending:
+                try:
+                    for result in results:
+                        if deadline is None:
+                            metric = result.get()
+                        else:
+                            metric = result.get(max(deadline - time.time(),
+                                                    0))
+                        logger.debug("Result from collector: '%s'" % metric)
+                except multiprocessing.TimeoutError:
+                    timed_out = True
+                    e = exception.QueryTimeout(timeout=CONF.collect_timeout)
+                    if not CONF.partial_results:
+                        raise e
+                    self._fail(title, e)
+                    continue
+                except exception.AchusException as e:
+                    if not CONF.partial_results:
+                        raise
+                    self._fail(title, e)
+                    continue
+
+                if results and self.checkpoint:
+                    self.checkpoint.save_metric(title, metric)
+                self._append_metric(title, metric, conf)
+        finally:
+            if timed_out:
+                # Do not wait for the calls still running, their queries
+                # are cancelled by the collectors' own time budgets.
+                pool.terminate()
+            else:
+                pool.close()
+                pool.join()
+
+    def _append_metric(self, title, metric, conf):
+        if not self.fan_out:
             self.renderer.append_metric(title, metric, conf)
+            return
+
+        if isinstance(metric, achus.result.MetricResult):
+            for fan, values in metric.split().iteritems():
+                document = self.documents.setdefault(
+                    fan, collections.OrderedDict())
+                document[title] = (values, conf)
+            return
+
+        approximate = isinstance(metric, achus.collector.Approximate)
+        for (fan, key), value in metric.iteritems():
+            document = self.documents.setdefault(fan,
+                                                 collections.OrderedDict())
+            if title not in document:
+                values = {}
+                if approximate:
+                    values = achus.collector.Approximate(
+                        {}, sample_rate=metric.sample_rate)
+                document[title] = (values, conf)
+            values = document[title][0]
+            values[key] = value
+            if approximate and (fan, key) in metric.errors:
+                values.errors[key] = metric.errors[(fan, key)]
+
+    def _document_file(self, fan):
+        """Output file of a fan-out document, e.g. 'report-biomed.pdf'."""
+        root, ext = os.path.splitext(self.output_file)
+        name = unicode(fan).replace(os.sep, "_").encode("utf-8")
+        return "%s-%s%s" % (root, name, ext)
+
+    def _fail(self, title, error):
+        logger.error("Cannot gather metric '%s': %s" % (title, error))
+        self.failures.append((title, str(error)))
 
     def generate(self):
-        """Triggers the report rendering."""
-        self.renderer.render_to_file()
+        """Triggers the report rendering, returning the files written.
+
+        The fan-out documents are rendered in parallel by up to
+        'fan_out_workers' processes.
+
+        If 'run_dir' is set, a run with all the metrics gathered is marked
+        as done once rendered, so resuming it again does nothing as long
+        as its files exist.
+        """
+        self._open_checkpoint()
+        if self.checkpoint and self.checkpoint.is_done():
+            logger.info("Report already generated")
+            return self.checkpoint.get("run", "done")
+
+        if self.fan_out:
+            filenames = self._generate_documents()
+        else:
+            self.renderer.render_to_file(self.output_file)
+            filenames = [self.output_file]
+
+        if self.checkpoint and not self.failures:
+            self.checkpoint.done(filenames)
+        return filenames
+
+    def _generate_documents(self):
+        jobs = []
+        for fan, document in sorted(self.documents.iteritems()):
+            metrics = [(title, metric, conf)
+                       for title, (metric, conf) in document.iteritems()]
+            document_checkpoint = None
+            if self.checkpoint:
+                document_checkpoint = self.checkpoint.child(unicode(fan))
+            jobs.append((self._document_file(fan), metrics,
+                         document_checkpoint))
+        if not jobs:
+            return []
+
+        pool = multiprocessing.Pool(min(CONF.fan_out_workers, len(jobs)))
+        try:
+            filenames = pool.map(_render_document, jobs)
+        finally:
+            pool.close()
+            pool.join()
+        logger.info("Rendered %s fan-out documents" % len(filenames))
+        return filenames
@@ -0,0 +1,199 @@
+import array
+import collections
+import itertools
+
+
+def intern_key(key):
+    """Returns the shared copy of a metric key.
+
+    Results keyed by the same groups, projects, etc. then share the key
+    strings instead of holding a copy each. Only str keys (and the str
+    parts of tuple keys) are interned, through 'intern', so that they are
+    released with the last result using them; other keys are kept as
+    they are.
+    """
+    if type(key) is str:
+        return intern(key)
+    if isinstance(key, tuple):
+        return tuple(intern_key(k) for k in key)
+    return key
+
+
+class MetricResult(object):
+    """Numeric metric values by key.
+
+    A mapping (values can be set or added up, but not removed) storing
+    the keys in a list and the values in an 'array("d")', with an index
+    from each key to its position, so each entry costs a key reference
+    and a double instead of a dict entry and a float object. It is
+    registered as a 'collections.Mapping' but does not inherit from it,
+    as its Python 2 version has no '__slots__'.
+
+    Results estimated from a sample of the jobs hold its 'sample_rate'
+    and, if they can be estimated, the error bounds of the values in
+    'errors' (another MetricResult).
+    """
+
+    __slots__ = ("_keys", "_values", "_index", "errors", "sample_rate")
+
+    def __init__(self, items=(), errors=None, sample_rate=None):
+        """Builds a result from a mapping or (key, value) pairs."""
+        self._keys = []
+        self._values = array.array("d")
+        self._index = {}
+        self.errors = errors
+        self.sample_rate = sample_rate
+        if isinstance(items, collections.Mapping):
+            items = items.iteritems()
+        for key, value in items:
+            self[key] = value
+
+    @classmethod
+    def from_columns(cls, keys, values, **kwargs):
+        """Builds a result adding up the values sharing the same key.
+
+        'keys' and 'values' are columns of the same length, as returned
+        by the backend queries.
+        """
+        result = cls(**kwargs)
+        for key, value in itertools.izip(keys, values):
+            result.add(key, value)
+        return result
+
+    def __getitem__(self, key):
+        return self._values[self._index[key]]
+
+    def __setitem__(self, key, value):
+        i = self._index.get(key)
+        if i is None:
+            self._append(key, value)
+        else:
+            self._values[i] = value
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __eq__(self, other):
+        if not isinstance(other, collections.Mapping):
+            return NotImplemented
+        return dict(self.iteritems()) == dict(other.items())
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, dict(self.iteritems()))
+
+    def __getstate__(self):
+        return (self._keys, self._values.tolist(), self.errors,
+                self.sample_rate)
+
+    def __setstate__(self, state):
+        keys, values, errors, sample_rate = state
+        self.__init__(itertools.izip(keys, values), errors=errors,
+                      sample_rate=sample_rate)
+
+    def _append(self, key, value):
+        key = intern_key(key)
+        self._index[key] = len(self._keys)
+        self._keys.append(key)
+        self._values.append(value)
+
+    def get(self, key, default=None):
+        i = self._index.get(key)
+        if i is None:
+            return default
+        return self._values[i]
+
+    def iterkeys(self):
+        return iter(self._keys)
+
+    def itervalues(self):
+        return iter(self._values)
+
+    def iteritems(self):
+        return itertools.izip(self._keys, self._values)
+
+    def keys(self):
+        return list(self._keys)
+
+    def values(self):
+        return self._values.tolist()
+
+    def items(self):
+        return zip(self._keys, self._values)
+
+    def add(self, key, value):
+        """Adds 'value' to the one of 'key' (0 if missing)."""
+        i = self._index.get(key)
+        if i is None:
+            self._append(key, value)
+        else:
+            self._values[i] += value
+
+    def total(self):
+        return sum(self._values)
+
+    def merge(self, other):
+        """Returns a new result adding up the values of both by key."""
+        result = self.__class__(self.iteritems(),
+                                sample_rate=self.sample_rate)
+        for key, value in other.iteritems():
+            result.add(key, value)
+        return result
+
+    def scaled(self, factor):
+        """Returns a new result with all the values multiplied by 'factor'."""
+        result = self.__class__(errors=self.errors,
+                                sample_rate=self.sample_rate)
+        result._keys = list(self._keys)
+        result._index = dict(self._index)
+        result._values = array.array("d", (v * factor for v in self._values))
+        return result
+
+    def apply(self, func):
+        """Returns a new result with 'func' applied to all the values."""
+        return self.__class__(((k, func(v)) for k, v in self.iteritems()),
+                              errors=self.errors,
+                              sample_rate=self.sample_rate)
+
+    def ratio(self, other, factor=1):
+        """Returns a new result with the ratio of the values by key.
+
+        The values are multiplied by 'factor' (e.g. 100 for %). Keys with
+        no (or a 0) value in 'other' get a 0 ratio.
+        """
+        result = self.__class__(sample_rate=self.sample_rate)
+        get = other.get
+        for key, value in self.iteritems():
+            divisor = get(key)
+            result._append(key, factor * value / divisor if divisor else 0.0)
+        return result
+
+    def split(self):
+        """Splits a result keyed by (fan-out value, key) pairs.
+
+        Returns a result keyed by key for each of the fan-out values.
+        """
+        results = {}
+        for (fan, key), value in self.iteritems():
+            if fan not in results:
+                results[fan] = self.__class__(sample_rate=self.sample_rate)
+                if self.errors is not None:
+                    results[fan].errors = self.__class__()
+            results[fan][key] = value
+            if self.errors is not None and (fan, key) in self.errors:
+                results[fan].errors[key] = self.errors[(fan, key)]
+        return results
+
+
+collections.Mapping.register(MetricResult)
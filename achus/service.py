@@ -0,0 +1,213 @@
+import BaseHTTPServer
+import collections
+import copy
+import json
+import logging
+import mimetypes
+import os
+import SocketServer
+import tempfile
+import threading
+import time
+import urlparse
+
+from oslo.config import cfg
+
+import achus.collector
+from achus import exception
+from achus import reporter
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+opts = [
+    cfg.StrOpt('host',
+               default='127.0.0.1',
+               help='Address the report service listens on.'),
+    cfg.IntOpt('port',
+               default=8080,
+               help='Port the report service listens on.'),
+    cfg.DictOpt('report_definitions',
+                default={},
+                help='Reports served, as name:path pairs (if empty, the '
+                     'report_definition option is served as "default").'),
+    cfg.IntOpt('cache_ttl',
+               default=300,
+               help='Seconds a rendered report is served from the cache.'),
+    cfg.IntOpt('stats_window',
+               default=1000,
+               help='Number of requests taken into account in the latency '
+                    'stats.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts, group="serve")
+CONF.import_opt('report_definition', 'achus.reporter')
+CONF.import_opt('output_file', 'achus.renderer', group="renderer")
+
+
+class ReportService(object):
+    """Renders reports on demand, keeping the expensive state warm.
+
+    The collector classes are discovered once, the report definitions are
+    only parsed again when the files change and the rendered reports are
+    cached for 'cache_ttl' seconds. Database connections are reused when
+    the collectors' connection pools are enabled.
+    """
+
+    def __init__(self):
+        handler = achus.collector.CollectorHandler()
+        self.available_collectors = handler.get_all_classes()
+        self.report_definitions = (CONF.serve.report_definitions or
+                                   {"default": CONF.report_definition})
+        self.content_type = (mimetypes.guess_type(
+                             CONF.renderer.output_file)[0] or
+                             "application/octet-stream")
+
+        self.lock = threading.Lock()
+        self.reports = {}
+        self.cache = {}
+        self.latencies = collections.deque(maxlen=CONF.serve.stats_window)
+        self.counters = collections.Counter()
+
+    def _get_definition(self, name):
+        """Returns the (mtime, report) of a definition, parsed if needed."""
+        try:
+            path = self.report_definitions[name]
+        except KeyError:
+            raise exception.ReportNotFound(report=name)
+
+        mtime = os.path.getmtime(path)
+        with self.lock:
+            cached = self.reports.get(name)
+        if cached and cached[0] == mtime:
+            return cached
+
+        rep = reporter.Report(report_definition=path,
+                              available_collectors=self.available_collectors,
+                              checkpointed=False)
+        cached = (mtime, {"metric": rep.metric, "aggregate": rep.aggregate})
+        with self.lock:
+            self.reports[name] = cached
+        return cached
+
+    def render(self, name, start_time=None, end_time=None):
+        """Renders a report, optionally overriding its time window.
+
+        Returns the report contents, from the cache if still fresh.
+        """
+        mtime, definition = self._get_definition(name)
+        key = (name, mtime, start_time, end_time)
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached and time.time() - cached[0] < CONF.serve.cache_ttl:
+                self.counters["cache_hits"] += 1
+                return cached[1]
+
+        # Each request is rendered to its own file, as the exports write
+        # to it while the metrics are collected
+        fd, path = tempfile.mkstemp(
+            suffix=os.path.splitext(CONF.renderer.output_file)[1])
+        os.close(fd)
+        try:
+            rep = reporter.Report(
+                report_definition=self.report_definitions[name],
+                report=copy.deepcopy(definition),
+                available_collectors=self.available_collectors,
+                start_time=start_time, end_time=end_time,
+                checkpointed=False, output_file=path)
+            rep.collect()
+            body = "".join(rep.renderer.render())
+        finally:
+            os.unlink(path)
+
+        now = time.time()
+        with self.lock:
+            for k, (timestamp, _) in self.cache.items():
+                if now - timestamp >= CONF.serve.cache_ttl:
+                    del self.cache[k]
+            self.cache[key] = (now, body)
+        return body
+
+    def record(self, latency, error=False):
+        """Records the latency (in seconds) of a request."""
+        with self.lock:
+            self.latencies.append(latency)
+            self.counters["requests"] += 1
+            if error:
+                self.counters["errors"] += 1
+
+    def get_stats(self):
+        """Returns the request counters and latency percentiles."""
+        with self.lock:
+            latencies = sorted(self.latencies)
+            stats = dict(self.counters)
+
+        for i in ("requests", "errors", "cache_hits"):
+            stats.setdefault(i, 0)
+        if latencies:
+            n = len(latencies)
+            stats.update({
+                "latency_mean": sum(latencies) / n,
+                "latency_p50": latencies[n // 2],
+                "latency_p95": latencies[min(n - 1, int(n * 0.95))],
+                "latency_max": latencies[-1],
+            })
+        return stats
+
+
+class ReportRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves '/report?name=...[&start_time=...][&end_time=...]' and
+    '/stats'.
+    """
+
+    def _send(self, code, content_type, body):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        service = self.server.service
+        url = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(url.query))
+
+        if url.path == "/stats":
+            self._send(200, "application/json",
+                       json.dumps(service.get_stats()))
+            return
+        elif url.path != "/report":
+            self._send(404, "text/plain", "Not found")
+            return
+
+        start = time.time()
+        error = True
+        try:
+            body = service.render(params.get("name", "default"),
+                                  start_time=params.get("start_time"),
+                                  end_time=params.get("end_time"))
+            error = False
+        except exception.ReportNotFound as e:
+            self._send(404, "text/plain", str(e))
+        except Exception as e:
+            logger.exception("Cannot render report")
+            self._send(500, "text/plain", str(e))
+        else:
+            self._send(200, service.content_type, body)
+        finally:
+            service.record(time.time() - start, error=error)
+
+    def log_message(self, fmt, *args):
+        logger.info("%s - %s" % (self.address_string(), fmt % args))
+
+
+class ReportServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """HTTP server handling each request in its own thread."""
+    daemon_threads = True
+
+    def __init__(self, service, address=None):
+        address = address or (CONF.serve.host, CONF.serve.port)
+        BaseHTTPServer.HTTPServer.__init__(self, address,
+                                           ReportRequestHandler)
+        self.service = service
@@ -0,0 +1,88 @@
+import math
+
+
+class Sketch(object):
+    """Mergeable quantile sketch with relative accuracy (DDSketch).
+
+    Positive values are counted in logarithmic buckets: bucket 'i' holds
+    the values in (gamma**(i-1), gamma**i], where
+    gamma = (1 + accuracy) / (1 - accuracy), so any quantile is returned
+    with a relative error of at most 'accuracy'. Values <= 0 are counted
+    apart. Since only bucket counts are kept, sketches of different time
+    windows (or clusters) are merged by adding up their counts, and the
+    buckets can be computed by the database itself (see 'bucket_sql').
+    """
+
+    def __init__(self, accuracy=0.01, buckets=None, zero_count=0):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = dict(buckets or {})
+        self.zero_count = zero_count
+
+    @property
+    def count(self):
+        return self.zero_count + sum(self.buckets.itervalues())
+
+    def bucket(self, value):
+        """Returns the index of the bucket holding a positive value."""
+        return int(math.ceil(math.log(value) / self.log_gamma))
+
+    def bucket_sql(self, value):
+        """Returns the SQL expression computing the bucket of 'value'.
+
+        It is NULL for values <= 0.
+        """
+        return ("CASE WHEN %s>0 THEN CEIL(LN(%s)/%.17g) END"
+                % (value, value, self.log_gamma))
+
+    def add(self, value, count=1):
+        if value > 0:
+            self.add_bucket(self.bucket(value), count)
+        else:
+            self.zero_count += count
+
+    def add_bucket(self, index, count):
+        """Adds 'count' values to a bucket (None for values <= 0)."""
+        if index is None:
+            self.zero_count += count
+        else:
+            index = int(index)
+            self.buckets[index] = self.buckets.get(index, 0) + count
+
+    def merge(self, other):
+        """Adds the counts of another sketch (of the same accuracy)."""
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches of different accuracy")
+        self.zero_count += other.zero_count
+        for index, count in other.buckets.iteritems():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        return self
+
+    def quantile(self, q):
+        """Returns the 'q' (0 <= q <= 1) quantile, None if empty."""
+        count = self.count
+        if not count:
+            return None
+        rank = q * (count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                break
+        # Value with the lowest relative error within the bucket
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def to_dict(self):
+        """Returns the sketch as a JSON serializable dict."""
+        return {"accuracy": self.accuracy,
+                "zero_count": self.zero_count,
+                "buckets": [[i, c] for i, c in sorted(self.buckets.items())]}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(accuracy=d["accuracy"],
+                   buckets=dict((int(i), c) for i, c in d["buckets"]),
+                   zero_count=d["zero_count"])
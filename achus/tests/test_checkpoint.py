@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+
+from oslo.config import cfg
+
+from achus import checkpoint
+from achus import test
+
+CONF = cfg.CONF
+
+
+class CheckpointTest(test.TestCase):
+    def setUp(self):
+        super(CheckpointTest, self).setUp()
+
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        CONF.set_override("run_dir", self.dir)
+        self.addCleanup(CONF.clear_override, "run_dir")
+        self.definition = {"metric": {"foo": {"metric": "cpu"}},
+                           "aggregate": {"bar": {"group": ["baz"]}}}
+
+    def test_save_and_get(self):
+        c = checkpoint.Checkpoint.for_report(self.definition)
+        self.assertIsNone(c.get_metric(u"f\xf3o"))
+        c.save_metric(u"f\xf3o", {("a", "b"): 1.5})
+        self.assertEqual({("a", "b"): 1.5}, c.get_metric(u"f\xf3o"))
+        self.assertIsNone(c.get_page(u"f\xf3o"))
+        self.assertEqual([], [f for f in os.listdir(c.path)
+                              if f.endswith(".tmp")])
+
+    def test_resume(self):
+        c = checkpoint.Checkpoint.for_report(self.definition)
+        c.save_metric("foo", {"a": 1})
+        c.child("doc").save_page("foo", "page")
+
+        c = checkpoint.Checkpoint.for_report(self.definition, resume=True)
+        self.assertEqual({"a": 1}, c.get_metric("foo"))
+        self.assertEqual("page", c.child("doc").get_page("foo"))
+
+        c = checkpoint.Checkpoint.for_report(self.definition)
+        self.assertIsNone(c.get_metric("foo"))
+        self.assertIsNone(c.child("doc").get_page("foo"))
+
+    def test_keyed_by_definition(self):
+        c = checkpoint.Checkpoint.for_report(self.definition)
+        c.save_metric("foo", {"a": 1})
+        self.definition["aggregate"]["bar"]["group"].append("qux")
+        other = checkpoint.Checkpoint.for_report(self.definition,
+                                                 resume=True)
+        self.assertNotEqual(c.path, other.path)
+        self.assertIsNone(other.get_metric("foo"))
+
+    def test_done(self):
+        c = checkpoint.Checkpoint.for_report(self.definition)
+        self.assertFalse(c.is_done())
+        filename = os.path.join(self.dir, "report.pdf")
+        open(filename, "w").close()
+        c.done([filename])
+        self.assertTrue(c.is_done())
+        os.unlink(filename)
+        self.assertFalse(c.is_done())
+
+    def test_discard(self):
+        for c in (checkpoint.Checkpoint.for_report(self.definition),
+                  checkpoint.MemoryCheckpoint()):
+            c.save_page("foo", "page")
+            c.save_page("bar", "page")
+            c.discard("page", "foo")
+            c.discard("page", "baz")
+            self.assertIsNone(c.get_page("foo"))
+            self.assertEqual("page", c.get_page("bar"))
@@ -1,9 +1,11 @@
+import array
+
 from achus import collector
 from achus import exception
 from achus import test
 from achus.tests import fixtures
 
-ALL_COLLECTORS = ['GECollector']
+ALL_COLLECTORS = ['CubeCollector', 'GECollector']
 
 
 class CollectorTest(test.TestCase):
@@ -90,6 +92,44 @@ class CollectorTest(test.TestCase):
                                   self.collector._format_wildcard("prj",
                                                                   value))
 
+    def test_sum_by_key(self):
+        keys = ("foo", "bar", "foo", "leftover")
+        values = array.array("d", [1, 2, 3, 4])
+        self.assertEqual({"foo": 4, "bar": 2, "leftover": 4},
+                         self.collector._sum_by_key(keys, values))
+
+    def test_occupancy(self):
+        rows = [
+            # Started before the window, 2 slots until 90
+            ("foo", -50, 90, 2),
+            ("bar", 0, 100, 1),
+            ("foo", 30, 60, 1),
+            # Ends after the window
+            ("foo", 150, 400, 4),
+            ("bar", 300, 350, 1),
+        ]
+        d = self.collector._occupancy(rows, 0, 250, 100)
+        self.assertEqual(["bar", "foo"], sorted(d))
+        self.assertEqual([1.0, 0.0, 0.0], [v for _, v in d["bar"]])
+        # Last bucket is 50 seconds long, fully busy with 4 slots
+        self.assertEqual([(2 * 90 + 30) / 100.0, 4 * 50 / 100.0, 4.0],
+                         [v for _, v in d["foo"]])
+        self.assertEqual(3, len(set(label for label, _ in d["foo"])))
+
+    def test_efficiency(self):
+        keys = ("foo", "bar", "foo", "baz")
+        cpu = array.array("d", [1, 2, 1, 5])
+        wall_clock = array.array("d", [2, 8, 2, 0])
+        self.assertEqual({"foo": 50, "bar": 25, "baz": 0},
+                         self.collector._efficiency(keys, cpu, wall_clock))
+
+    def test_efficiency_not_aligned(self):
+        self.assertRaises(exception.CannotComputeEfficiency,
+                          self.collector._efficiency,
+                          ("foo", "bar"),
+                          array.array("d", [1, 2]),
+                          array.array("d", [1]))
+
 
 class CollectorHandlerTest(test.TestCase):
     def setUp(self):
@@ -100,4 +140,4 @@ class CollectorHandlerTest(test.TestCase):
     def test_get_all_all_collectors(self):
         ch = self.collectorhandler()
         aux = [i.__name__ for i in ch.get_all_classes()]
-        self.assertEqual(ALL_COLLECTORS, aux)
+        self.assertEqual(ALL_COLLECTORS, sorted(aux))
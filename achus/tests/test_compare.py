@@ -0,0 +1,203 @@
+import datetime
+import shutil
+import tempfile
+
+from oslo.config import cfg
+
+import achus.collector
+from achus import compare
+from achus import exception
+import achus.result
+from achus import test
+
+CONF = cfg.CONF
+
+
+class FakeCollector(achus.collector.BaseCollector):
+    def __init__(self):
+        super(FakeCollector, self).__init__()
+        self.calls = []
+
+    def get(self, metric, group_by, **kw):
+        self.calls.append((kw["start_time"], kw.get("end_time")))
+        # Each group used the month number of hours
+        month = int(kw["start_time"][5:7])
+        return achus.result.MetricResult({"foo": month, "bar": 2 * month})
+
+
+class PeriodStoreTest(test.TestCase):
+    def setUp(self):
+        super(PeriodStoreTest, self).setUp()
+
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.store = compare.PeriodStore(self.dir)
+        self.now = datetime.datetime(2013, 3, 14, 10, 30)
+
+    def test_from_conf(self):
+        self.assertIsNone(compare.PeriodStore.from_conf())
+        CONF.set_override("period_store", self.dir)
+        self.addCleanup(CONF.clear_override, "period_store")
+        self.assertEqual(self.dir, compare.PeriodStore.from_conf().path)
+
+    def test_closed_window(self):
+        collector = FakeCollector()
+        for start, end in (("2013-02-01", "2013-03-01"),
+                           ("2013-02-01 00:00", "2013-03-01 00:00:00")):
+            self.assertEqual({"foo": 2, "bar": 4},
+                             self.store.collect(collector, "cpu", "group",
+                                                now=self.now,
+                                                start_time=start,
+                                                end_time=end))
+        self.assertEqual(1, len(collector.calls))
+
+        # Other arguments are other calls
+        self.store.collect(collector, "cpu", "group", now=self.now,
+                           start_time="2013-02-01", end_time="2013-03-01",
+                           group=["foo"])
+        self.assertEqual(2, len(collector.calls))
+
+    def test_other_source(self):
+        # Same call on another database
+        collector = FakeCollector()
+        for source in (None, "db1", "db2", "db1"):
+            collector.source = lambda: source
+            self.store.collect(collector, "cpu", "group", now=self.now,
+                               start_time="2013-02-01",
+                               end_time="2013-03-01")
+        self.assertEqual(3, len(collector.calls))
+
+    def test_recently_ended_window(self):
+        # Open until 'period_close_delay' (1 hour) passes
+        collector = FakeCollector()
+        for now in (datetime.datetime(2013, 3, 1, 0, 30),
+                    datetime.datetime(2013, 3, 1, 1),
+                    datetime.datetime(2013, 3, 1, 2)):
+            self.store.collect(collector, "cpu", "group", now=now,
+                               start_time="2013-02-01",
+                               end_time="2013-03-01")
+        self.assertEqual(2, len(collector.calls))
+
+    def test_open_window(self):
+        collector = FakeCollector()
+        for i in range(2):
+            self.store.collect(collector, "cpu", "group", now=self.now,
+                               start_time="2013-03-01",
+                               end_time="2013-04-01")
+            self.store.collect(collector, "cpu", "group", now=self.now,
+                               start_time="2013-03-01")
+        self.assertEqual(4, len(collector.calls))
+
+
+class ComparisonTest(test.TestCase):
+    def setUp(self):
+        super(ComparisonTest, self).setUp()
+
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.now = datetime.datetime(2013, 3, 14, 10, 30)
+
+    def _comparison(self, **kwargs):
+        return compare.Comparison("cpu", {"metric": "cpu",
+                                          "compare": kwargs},
+                                  now=self.now)
+
+    def test_periods(self):
+        c = self._comparison(period="month", **{"with": ["previous",
+                                                         "last_year"]})
+        self.assertEqual(
+            [("2013-03", datetime.datetime(2013, 3, 1),
+              datetime.datetime(2013, 4, 1)),
+             ("2013-02", datetime.datetime(2013, 2, 1),
+              datetime.datetime(2013, 3, 1)),
+             ("2012-03", datetime.datetime(2012, 3, 1),
+              datetime.datetime(2012, 4, 1))],
+            c.periods())
+
+    def test_periods_end_time(self):
+        c = self._comparison(period="week", end_time="2013-03-11")
+        self.assertEqual(
+            [("2013-03-04", datetime.datetime(2013, 3, 4),
+              datetime.datetime(2013, 3, 11)),
+             ("2013-02-25", datetime.datetime(2013, 2, 25),
+              datetime.datetime(2013, 3, 4))],
+            c.periods())
+
+    def test_invalid(self):
+        self.assertRaises(exception.InvalidComparison,
+                          self._comparison, period="fortnight")
+        self.assertRaises(exception.InvalidComparison,
+                          self._comparison, derive="ratio")
+        self.assertRaises(exception.InvalidComparison,
+                          self._comparison, **{"with": "tomorrow"})
+        self.assertRaises(exception.InvalidComparison,
+                          compare.Comparison, "occupancy",
+                          {"metric": "occupancy", "compare": None})
+
+    def test_get(self):
+        c = self._comparison(**{"with": ["previous", "last_year"]})
+        collector = FakeCollector()
+        self.assertEqual(
+            {"foo": [("2012-03", 3.0), ("2013-02", 2.0), ("2013-03", 3.0)],
+             "bar": [("2012-03", 6.0), ("2013-02", 4.0), ("2013-03", 6.0)]},
+            c.get(collector, "cpu", "group", group=["foo", "bar"],
+                  start_time="2000-01-01", end_time="2000-02-01"))
+        self.assertEqual([("2013-03-01 00:00:00", "2013-04-01 00:00:00"),
+                          ("2013-02-01 00:00:00", "2013-03-01 00:00:00"),
+                          ("2012-03-01 00:00:00", "2012-04-01 00:00:00")],
+                         collector.calls)
+
+    def test_derive(self):
+        c = self._comparison(derive="delta")
+        self.assertEqual({"foo": [("vs 2013-02", 1.0)],
+                          "bar": [("vs 2013-02", 2.0)]},
+                         c.get(FakeCollector(), "cpu", "group"))
+        c = self._comparison(derive="growth")
+        self.assertEqual({"foo": [("vs 2013-02", 50.0)],
+                          "bar": [("vs 2013-02", 50.0)]},
+                         c.get(FakeCollector(), "cpu", "group"))
+
+    def test_period_store(self):
+        CONF.set_override("period_store", self.dir)
+        self.addCleanup(CONF.clear_override, "period_store")
+        c = self._comparison(**{"with": ["previous", "last_year"]})
+        expected = c.get(FakeCollector(), "cpu", "group", group=["foo"])
+
+        # Only the open period is queried again
+        collector = FakeCollector()
+        self.assertEqual(expected,
+                         c.get(collector, "cpu", "group", group=["foo"]))
+        self.assertEqual([("2013-03-01 00:00:00", "2013-04-01 00:00:00")],
+                         collector.calls)
+
+        # Stored by the arguments of the calls
+        collector = FakeCollector()
+        c.get(collector, "cpu", "group", group=["bar"])
+        self.assertEqual(3, len(collector.calls))
+
+        # Once closed, the last period is stored too
+        c.now = datetime.datetime(2013, 4, 1, 1)
+        collector = FakeCollector()
+        c.get(collector, "cpu", "group", group=["foo"])
+        c.get(collector, "cpu", "group", group=["foo"])
+        self.assertEqual([("2013-04-01 00:00:00", "2013-05-01 00:00:00"),
+                          ("2013-03-01 00:00:00", "2013-04-01 00:00:00"),
+                          ("2012-04-01 00:00:00", "2012-05-01 00:00:00"),
+                          ("2013-04-01 00:00:00", "2013-05-01 00:00:00")],
+                         collector.calls)
+
+    def test_sampled_periods_not_stored(self):
+        class SampledCollector(FakeCollector):
+            def get(self, metric, group_by, **kw):
+                result = super(SampledCollector, self).get(metric, group_by,
+                                                           **kw)
+                result.sample_rate = 10
+                return result
+        CONF.set_override("period_store", self.dir)
+        self.addCleanup(CONF.clear_override, "period_store")
+        c = self._comparison()
+        collector = SampledCollector()
+        result = c.get(collector, "cpu", "group")
+        c.get(collector, "cpu", "group")
+        self.assertEqual(4, len(collector.calls))
+        self.assertEqual(10, result.sample_rate)
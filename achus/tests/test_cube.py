@@ -0,0 +1,141 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import mock
+from oslo.config import cfg
+
+import achus.collector.cube
+import achus.collector.gridengine
+from achus import exception
+from achus import test
+
+CONF = cfg.CONF
+
+JOBS = [
+    ("foo", "prj1", 1, 3600.0, 3600.0, "2013-01-01 00:00:00",
+     "2013-01-01 01:00:00", "2013-01-01 02:00:00"),
+    ("foo", "prj2", 2, 3600.0, 3600.0, "2013-01-01 00:00:00",
+     "2013-01-02 01:00:00", "2013-01-02 02:00:00"),
+    ("foobar", "prj1", 1, 1800.0, 3600.0, "2013-01-01 00:00:00",
+     "2013-01-02 01:00:00", "2013-01-02 02:00:00"),
+    ("bar", "prj2", 4, 7200.0, 3600.0, "2013-01-01 00:00:00",
+     "2013-01-03 01:00:00", "2013-01-03 02:00:00"),
+    ("baz", "prj3", 1, 600.0, 3600.0, "2013-01-01 00:00:00",
+     "2013-01-03 01:00:00", "2013-01-03 02:00:00"),
+]
+
+
+class CubeCollectorTest(test.TestCase):
+    def setUp(self):
+        super(CubeCollectorTest, self).setUp()
+
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        dbname = os.path.join(self.dir, "ge.db")
+        conn = sqlite3.connect(dbname)
+        conn.execute("CREATE TABLE ge_jobs (ge_group TEXT, ge_project TEXT, "
+                     "ge_slots INTEGER, ge_cpu REAL, ge_ru_wallclock REAL, "
+                     "ge_submission_time TEXT, ge_start_time TEXT, "
+                     "ge_end_time TEXT)")
+        conn.executemany("INSERT INTO ge_jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         JOBS)
+        conn.commit()
+        conn.close()
+        for k, v in (("driver", "sqlite"), ("dbname", dbname)):
+            CONF.set_override(k, v, group="gecollector")
+            self.addCleanup(CONF.clear_override, k, group="gecollector")
+        self.addCleanup(achus.collector.cube._CUBES.__delslice__, 0, 100)
+
+        self.collector = achus.collector.cube.CubeCollector()
+        self.ge_collector = achus.collector.gridengine.GECollector()
+        self.window = {"start_time": "2013-01-01", "end_time": "2013-01-04"}
+
+    def _assert_same(self, metric, group_by, **kwargs):
+        kwargs.update(self.window)
+        expected = self.ge_collector.get(metric, group_by, **kwargs)
+        result = self.collector.get(metric, group_by, **kwargs)
+        self.assertEqual(sorted(expected), sorted(result))
+        for k, v in expected.iteritems():
+            self.assertAlmostEqual(v, result[k])
+
+    def test_same_as_sql(self):
+        for metric in ("cpu", "wallclock", "efficiency"):
+            self._assert_same(metric, "group", group=["foo", "bar"])
+            self._assert_same(metric, "group", group=["foo*", "!baz"])
+            self._assert_same(metric, "project", project=["prj1", "prj2"])
+            self._assert_same(metric, "group", group=["*o*"], top=1)
+            self._assert_same(metric, "project", group=["*o*"],
+                              fan_out="group")
+            self._assert_same(metric, "project", project=["prj1", "prj2"],
+                              fan_out="group", top=1)
+
+    def test_proportion(self):
+        result = self.collector.get("cpu", "group", group=["foo", "**"],
+                                    **self.window)
+        self.assertEqual(["foo", "leftover"], sorted(result))
+        self.assertEqual(2, result["foo"])
+        self.assertAlmostEqual((1800 + 7200 + 600) / 3600.0,
+                               result["leftover"])
+
+    def test_single_query(self):
+        with mock.patch.object(achus.collector.gridengine.GECollector,
+                               "query",
+                               wraps=self.ge_collector.query) as mock_query:
+            self.collector.get("cpu", "group", group=["foo"], **self.window)
+            result = self.collector.get("cpu", "project",
+                                        project=["prj1", "prj2"],
+                                        start_time="2013-01-02",
+                                        end_time="2013-01-03")
+        self.assertEqual(1, mock_query.call_count)
+        self.assertEqual({"prj1": 0.5, "prj2": 1}, result)
+
+    def test_cube_file(self):
+        path = os.path.join(self.dir, "cube")
+        CONF.set_override("cube_file", path, group="cube")
+        self.addCleanup(CONF.clear_override, "cube_file", group="cube")
+        cpu = self.collector.get("cpu", "group", group=["foo"], **self.window)
+        self.assertTrue(os.path.exists(path))
+
+        del achus.collector.cube._CUBES[:]
+        with mock.patch.object(achus.collector.cube.Cube, "build") as build:
+            self.assertEqual(cpu, self.collector.get("cpu", "group",
+                                                     group=["foo"],
+                                                     **self.window))
+        self.assertFalse(build.called)
+
+    def test_cube_window(self):
+        for k, v in (("start_time", "2013-01-01"),
+                     ("end_time", "2013-01-03")):
+            CONF.set_override(k, v, group="cube")
+            self.addCleanup(CONF.clear_override, k, group="cube")
+        self.assertEqual({"prj1": 1.5},
+                         self.collector.get("cpu", "project",
+                                            project=["prj1"],
+                                            start_time="2013-01-01",
+                                            end_time="2013-01-03"))
+        self.assertRaises(exception.CubeWindowExceeded,
+                          self.collector.get, "cpu", "group", group=["foo"],
+                          **self.window)
+
+    def test_unsupported_metrics(self):
+        for metric in ("wait_time", "runtime", "occupancy"):
+            self.assertRaises(exception.UnsupportedMetric,
+                              self.collector.get, metric, "group",
+                              group=["foo"], **self.window)
+
+    def test_never_sampled(self):
+        expected = self.collector.get("cpu", "group", group=["foo"],
+                                      **self.window)
+        del achus.collector.cube._CUBES[:]
+        CONF.set_override("sample_rate", 10, group="gecollector")
+        self.addCleanup(CONF.clear_override, "sample_rate",
+                        group="gecollector")
+        self.assertEqual(expected, self.collector.get("cpu", "group",
+                                                      group=["foo"],
+                                                      **self.window))
+
+    def test_unbounded_window(self):
+        self.assertRaises(exception.UnboundedTimeWindow,
+                          self.collector.get, "cpu", "group", group=["foo"])
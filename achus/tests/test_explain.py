@@ -0,0 +1,82 @@
+import mock
+from oslo.config import cfg
+
+import achus.collector.gridengine
+from achus import explain
+from achus import test
+
+CONF = cfg.CONF
+
+
+class ExplainTest(test.TestCase):
+    def setUp(self):
+        super(ExplainTest, self).setUp()
+
+        self.collector = achus.collector.gridengine.GECollector()
+        self.report = mock.Mock()
+        self.report.get_collector_calls.return_value = [
+            ("foo", {"metric": "cpu", "collector": "GECollector"},
+             self.collector, [("group", {}), ("project", {})]),
+            ("bar", {"metric": "cpu", "collector": "FakeCollector"},
+             object(), [("group", {})]),
+        ]
+
+    def test_get_statements(self):
+        with mock.patch.object(self.collector, "statements",
+                               side_effect=[["SELECT 1", "SELECT 2"],
+                                            ["SELECT 2", "SELECT 3"]]):
+            statements = explain.get_statements(self.report)
+        self.assertEqual(["SELECT 1", "SELECT 2", "SELECT 3"],
+                         [cmd for name, target, cmd in statements])
+        for name, target, cmd in statements:
+            self.assertEqual((None, CONF.gecollector), (name, target))
+
+    def test_get_plans_clusters(self):
+        for name, driver in (("cluster_a", "mysql"), ("cluster_b", "sqlite")):
+            CONF.register_opts(achus.collector.gridengine.db_opts,
+                               group=name)
+            CONF.set_override("driver", driver, group=name)
+            self.addCleanup(CONF.clear_override, "driver", group=name)
+        CONF.set_override("clusters", ["cluster_a", "cluster_b"],
+                          group="gecollector")
+        self.addCleanup(CONF.clear_override, "clusters",
+                        group="gecollector")
+        with mock.patch.object(self.collector, "explain",
+                               return_value=[]) as mock_explain:
+            with mock.patch.object(self.collector, "explain_cost",
+                                   return_value=None):
+                plans = explain.get_plans(self.report,
+                                          collector=self.collector)
+        # The statements of the SQLite cluster are not explained
+        self.assertEqual(["cluster_a", "cluster_a"],
+                         [plan.cluster for plan in plans])
+        for args, kwargs in mock_explain.call_args_list:
+            self.assertEqual(CONF.cluster_a, args[1])
+        self.assertEqual(0, explain.print_plans(plans))
+
+    def test_get_plans(self):
+        rows = [{"table": "ge_jobs", "type": "range", "rows": 100,
+                 "key": "achus_end_time", "Extra": "Using where"},
+                {"table": "t", "type": "ref", "rows": 3,
+                 "key": "k", "Extra": None}]
+        with mock.patch.object(self.collector, "statements",
+                               return_value=["SELECT 1"]):
+            with mock.patch.object(self.collector, "explain",
+                                   return_value=rows):
+                with mock.patch.object(self.collector, "explain_cost",
+                                       return_value=42.0):
+                    plans = explain.get_plans(self.report,
+                                              collector=self.collector)
+        self.assertEqual([explain.Plan("SELECT 1", rows, 300, 42.0)], plans)
+        self.assertEqual(0, explain.print_plans(plans))
+
+    def test_print_plans_problems(self):
+        rows = [{"table": "ge_jobs", "type": "ALL", "rows": 100,
+                 "key": None, "Extra": "Using temporary; Using filesort"},
+                {"table": "t", "type": "ref", "rows": 100000,
+                 "key": "k", "Extra": "Using temporary; Using filesort"}]
+        plans = [explain.Plan("SELECT 1", rows, 100, None)]
+        self.assertEqual(0, explain.print_plans(plans))
+        CONF.set_override("explain_max_unindexed_rows", 50)
+        self.addCleanup(CONF.clear_override, "explain_max_unindexed_rows")
+        self.assertEqual(1, explain.print_plans(plans))
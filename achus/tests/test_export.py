@@ -0,0 +1,105 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+import types
+
+from oslo.config import cfg
+
+import achus.renderer.export
+import achus.result
+from achus import test
+
+CONF = cfg.CONF
+
+
+class ExportTest(object):
+    def setUp(self):
+        super(ExportTest, self).setUp()
+
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, "export")
+        CONF.set_override("output_file", self.path, group="renderer")
+        self.addCleanup(CONF.clear_override, "output_file", group="renderer")
+        self.renderer = self.renderer_class()
+
+    def _append(self):
+        self.renderer.append_metric("cpu", {u"f\xf3o": 1.5, "bar": 2},
+                                    {"chart": "pie"})
+        self.renderer.append_metric(
+            "occupancy",
+            {"foo": [("2013-01-01 00:00:00", 1.0),
+                     ("2013-01-01 01:00:00", 2.0)]},
+            {"chart": "line"})
+
+    def test_render_is_generator(self):
+        self.assertIsInstance(self.renderer.render(), types.GeneratorType)
+
+    def test_written_on_append(self):
+        self.renderer.append_metric("cpu", {"foo": 1}, {})
+        with open(self.path) as f:
+            self.assertIn("foo", f.read())
+
+    def test_own_path(self):
+        path = os.path.join(self.dir, "own")
+        self.renderer.path = path
+        self._append()
+        self.assertEqual(self.expected,
+                         self._parse("".join(self.renderer.render())
+                                     .splitlines(True)))
+        self.assertTrue(os.path.exists(path))
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_metric_result(self):
+        values = {u"f\xf3o": 1.5, "bar": 2.5}
+        self.renderer.append_metric("cpu", achus.result.MetricResult(values),
+                                    {})
+        self.renderer.finish()
+        path = os.path.join(self.dir, "dict")
+        CONF.set_override("output_file", path, group="renderer")
+        renderer = self.renderer_class()
+        renderer.append_metric("cpu", values, {})
+        renderer.finish()
+        with open(self.path) as f, open(path) as g:
+            self.assertEqual(g.read(), f.read())
+
+    def test_render_to_file(self):
+        self._append()
+        filename = os.path.join(self.dir, "copy")
+        self.assertIsNone(self.renderer.render_to_file(filename))
+        with open(filename) as f:
+            self.assertEqual(self.expected, self._parse(f))
+        self.assertEqual(self.expected,
+                         self._parse("".join(self.renderer.render())
+                                     .splitlines(True)))
+
+
+class CSVExportTest(ExportTest, test.TestCase):
+    renderer_class = achus.renderer.export.CSVExport
+    expected = [
+        ["metric", "key", "time", "value"],
+        ["cpu", "bar", "", "2"],
+        ["cpu", "f\xc3\xb3o", "", "1.5"],
+        ["occupancy", "foo", "2013-01-01 00:00:00", "1.0"],
+        ["occupancy", "foo", "2013-01-01 01:00:00", "2.0"],
+    ]
+
+    def _parse(self, lines):
+        return list(csv.reader(lines))
+
+
+class NDJSONExportTest(ExportTest, test.TestCase):
+    renderer_class = achus.renderer.export.NDJSONExport
+    expected = [
+        {"metric": "cpu", "key": "bar", "time": None, "value": 2},
+        {"metric": "cpu", "key": u"f\xf3o", "time": None, "value": 1.5},
+        {"metric": "occupancy", "key": "foo",
+         "time": "2013-01-01 00:00:00", "value": 1.0},
+        {"metric": "occupancy", "key": "foo",
+         "time": "2013-01-01 01:00:00", "value": 2.0},
+    ]
+
+    def _parse(self, lines):
+        return [json.loads(line) for line in lines]
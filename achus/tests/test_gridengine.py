@@ -0,0 +1,661 @@
+import array
+import contextlib
+import os
+import sqlite3
+import tempfile
+import threading
+
+import _mysql_exceptions
+import mock
+from oslo.config import cfg
+
+import achus.collector.gridengine
+from achus import exception
+from achus import test
+
+CONF = cfg.CONF
+
+
+class GECollectorTest(test.TestCase):
+    def setUp(self):
+        super(GECollectorTest, self).setUp()
+
+        self.collector = achus.collector.gridengine.GECollector()
+
+    def _create_sqlite_db(self, jobs, group="gecollector"):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, path)
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE ge_jobs (ge_group TEXT, ge_project TEXT, "
+                     "ge_slots INTEGER, ge_cpu REAL, ge_ru_wallclock REAL, "
+                     "ge_submission_time TEXT, ge_start_time TEXT, "
+                     "ge_end_time TEXT, ge_job_number INTEGER)")
+        # The job number is optional
+        conn.executemany("INSERT INTO ge_jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, "
+                         "?)", [tuple(job) + (None,) * (9 - len(job))
+                                for job in jobs])
+        conn.commit()
+        conn.close()
+
+        CONF.register_opts(achus.collector.gridengine.db_opts, group=group)
+        CONF.set_override("driver", "sqlite", group=group)
+        self.addCleanup(CONF.clear_override, "driver", group=group)
+        CONF.set_override("dbname", path, group=group)
+        self.addCleanup(CONF.clear_override, "dbname", group=group)
+
+    def test_sqlite_backend(self):
+        self._create_sqlite_db([
+            ("foo", "prj", 2, 3600.0, 3600.0,
+             "2013-01-01 00:00:00", "2013-01-01 01:00:00",
+             "2013-01-01 02:00:00"),
+            ("foo", "prj", 1, 1800.0, 3600.0,
+             "2013-01-01 00:00:00", "2013-01-01 01:00:00",
+             "2013-01-01 02:00:00"),
+            ("bar", "prj", 1, 3600.0, 3600.0,
+             "2013-01-01 00:00:00", "2013-01-01 01:00:00",
+             "2013-01-01 02:00:00"),
+            ("foo", "prj", 1, 3600.0, 3600.0,
+             "2013-03-01 00:00:00", "2013-03-01 01:00:00",
+             "2013-03-01 02:00:00"),
+        ])
+        kwargs = {"group": ["foo", "bar"],
+                  "start_time": "2013-01-01 00:00",
+                  "end_time": "2013-02-01 00:00"}
+        self.assertEqual({"foo": 1.5, "bar": 1},
+                         self.collector.get("cpu", "group", **kwargs))
+        self.assertEqual({"foo": 3, "bar": 1},
+                         self.collector.get("wallclock", "group", **kwargs))
+        self.assertEqual({"foo": 50, "bar": 100},
+                         self.collector.get("efficiency", "group", **kwargs))
+        self.assertEqual({}, self.collector.get(
+            "cpu", "group", end_time_after="2013-01-01 02:00:00", **kwargs))
+
+    def test_sqlite_distributions(self):
+        self._create_sqlite_db([
+            ("foo", "prj", 1, 3600.0, 3600.0 * (i + 1),
+             "2013-01-01 00:00:00", "2013-01-01 0%s:00:00" % i,
+             "2013-01-01 10:00:00")
+            for i in range(5)
+        ] + [
+            ("bar", "prj", 1, 3600.0, 7200.0,
+             "2013-01-01 00:00:00", "2013-01-01 00:00:00",
+             "2013-01-01 10:00:00"),
+        ])
+        kwargs = {"group": ["foo", "bar"]}
+        runtime = self.collector.get("runtime", "group", **kwargs)
+        self.assertAlmostEqual(3, runtime["foo"], delta=0.03)
+        self.assertAlmostEqual(2, runtime["bar"], delta=0.02)
+        wait_time = self.collector.get("wait_time", "group", percentile=100,
+                                       **kwargs)
+        self.assertAlmostEqual(4, wait_time["foo"], delta=0.04)
+        self.assertEqual(0, wait_time["bar"])
+
+        CONF.set_override("window_chunk", "day", group="gecollector")
+        self.addCleanup(CONF.clear_override, "window_chunk",
+                        group="gecollector")
+        sketches = self.collector.get_sketches(
+            "runtime", "ge_group",
+            conditions={"ge_group": ["foo"],
+                        "ge_start_time": "2012-12-30",
+                        "ge_end_time": "2013-01-03"})
+        self.assertEqual(["foo"], sketches.keys())
+        self.assertEqual(5, sketches["foo"].count)
+
+    def test_sqlite_occupancy(self):
+        self._create_sqlite_db([
+            ("foo", "prj", 2, 3600.0, 3600.0,
+             "2012-12-31 00:00:00", "2012-12-31 23:30:00",
+             "2013-01-01 00:30:00"),
+            ("foo", "prj", 1, 3600.0, 3600.0,
+             "2013-01-01 00:00:00", "2013-01-01 00:00:00",
+             "2013-01-01 02:00:00"),
+            ("bar", "prj", 4, 3600.0, 3600.0,
+             "2013-01-01 00:00:00", "2013-01-01 01:00:00",
+             "2013-01-01 05:00:00"),
+            ("bar", "prj", 4, 3600.0, 3600.0,
+             "2013-01-01 00:00:00", "2013-01-01 03:00:00",
+             "2013-01-01 04:00:00"),
+        ])
+        kwargs = {"group": ["foo", "bar"],
+                  "start_time": "2013-01-01 00:00",
+                  "end_time": "2013-01-01 02:00"}
+        d = self.collector.get("occupancy", "group", **kwargs)
+        self.assertEqual([("2013-01-01 00:00:00", 2.0),
+                          ("2013-01-01 01:00:00", 1.0)], d["foo"])
+        self.assertEqual([("2013-01-01 00:00:00", 0.0),
+                          ("2013-01-01 01:00:00", 4.0)], d["bar"])
+
+        d = self.collector.get("occupancy", "group", resolution="minute",
+                               **kwargs)
+        self.assertEqual(120, len(d["foo"]))
+
+        del kwargs["end_time"]
+        self.assertRaises(exception.UnboundedTimeWindow,
+                          self.collector.get, "occupancy", "group", **kwargs)
+
+    def test_occupancy_server_side_cursor(self):
+        conn = mock.MagicMock()
+        curs = conn.cursor.return_value
+        curs.fetchmany.return_value = []
+
+        @contextlib.contextmanager
+        def _connection(target, host):
+            yield conn
+
+        with mock.patch.object(self.collector, "_connection",
+                               side_effect=_connection):
+            self.collector.get("occupancy", "group",
+                               start_time="2013-01-01 00:00",
+                               end_time="2013-01-01 02:00")
+        conn.cursor.assert_called_once_with(
+            achus.collector.gridengine.MySQLdb.cursors.SSCursor)
+        self.assertTrue(curs.close.called)
+
+    def test_occupancy_failover(self):
+        self._set_replicas(["replica1"])
+        hosts = []
+
+        @contextlib.contextmanager
+        def _connection(target, host):
+            hosts.append(host)
+            if host[0] != "primary":
+                raise _mysql_exceptions.OperationalError(2006, "gone away")
+            conn = mock.MagicMock()
+            conn.cursor.return_value.fetchmany.return_value = []
+            yield conn
+
+        with mock.patch.object(self.collector, "_connection",
+                               side_effect=_connection):
+            self.collector.get("occupancy", "group",
+                               start_time="2013-01-01 00:00",
+                               end_time="2013-01-01 02:00")
+        self.assertEqual([("replica1", 3306), ("primary", 3306)], hosts)
+
+    def test_sqlite_fan_out(self):
+        self._create_sqlite_db([
+            ("foo", "prj1", 1, 3600.0, 3600.0,
+             "2013-01-01 00:00:00", "2013-01-01 01:00:00",
+             "2013-01-01 02:00:00"),
+            ("foo", "prj2", 1, 1800.0, 3600.0,
+             "2013-01-01 00:00:00", "2013-01-01 01:00:00",
+             "2013-01-01 02:00:00"),
+            ("foo", "prj3", 1, 900.0, 3600.0,
+             "2013-01-01 00:00:00", "2013-01-01 01:00:00",
+             "2013-01-01 02:00:00"),
+            ("bar", "prj1", 2, 3600.0, 3600.0,
+             "2013-01-01 00:00:00", "2013-01-01 01:00:00",
+             "2013-01-01 02:00:00"),
+        ])
+        kwargs = {"project": ["prj1", "prj2", "prj3"], "fan_out": "group"}
+        self.assertEqual({("foo", "prj1"): 1, ("foo", "prj2"): 0.5,
+                          ("foo", "prj3"): 0.25, ("bar", "prj1"): 1},
+                         self.collector.get("cpu", "project", **kwargs))
+        self.assertEqual({("foo", "prj1"): 1, ("foo", "others"): 0.75,
+                          ("bar", "prj1"): 1},
+                         self.collector.get("cpu", "project", top=1,
+                                            **kwargs))
+        self.assertEqual({("foo", "prj1"): 100, ("foo", "prj2"): 50,
+                          ("bar", "prj1"): 50},
+                         self.collector.get("efficiency", "project",
+                                            project=["prj1", "prj2"],
+                                            fan_out="group"))
+        runtime = self.collector.get("runtime", "project", **kwargs)
+        self.assertEqual(sorted(runtime), [("bar", "prj1"), ("foo", "prj1"),
+                                           ("foo", "prj2"), ("foo", "prj3")])
+        d = self.collector.get("occupancy", "project",
+                               start_time="2013-01-01 01:00",
+                               end_time="2013-01-01 02:00", **kwargs)
+        self.assertEqual([("2013-01-01 01:00:00", 2.0)], d[("bar", "prj1")])
+
+    def test_sqlite_sampling(self):
+        self._create_sqlite_db([
+            ("foo" if i / 10 % 2 else "bar", "prj", 1, 3600.0 * (i % 3),
+             3600.0, "2013-01-01 00:00:00", "2013-01-01 01:00:00",
+             "2013-01-01 02:00:00", i)
+            for i in range(1000)
+        ])
+        exact = self.collector.get("cpu", "group", group=["foo", "bar"])
+        self.assertIsNone(exact.sample_rate)
+
+        CONF.set_override("sample_rate", 10, group="gecollector")
+        self.addCleanup(CONF.clear_override, "sample_rate",
+                        group="gecollector")
+        d = self.collector.get("cpu", "group", group=["foo", "bar"])
+        self.assertEqual(10, d.sample_rate)
+        self.assertEqual(sorted(exact), sorted(d))
+        for k, v in d.iteritems():
+            self.assertTrue(d.errors[k] > 0)
+            self.assertAlmostEqual(exact[k], v, delta=d.errors[k])
+        # 1 in 10 jobs are counted, 10 times each
+        self.assertEqual(1000, self.collector.query(
+            "jobs", ["ge_project"]).sums[0][0])
+
+        d = self.collector.get("efficiency", "group", group=["foo", "bar"])
+        self.assertEqual(10, d.sample_rate)
+        self.assertIsNone(d.errors)
+        d = self.collector.get("cpu", "group", group=["bar"], top=1,
+                               fan_out="project")
+        self.assertEqual(["bar"], [k for _, k in d])
+        self.assertIn(("prj", "bar"), d.errors)
+        self.assertIn("MOD(ge_job_number,10)=0",
+                      self.collector.statements("cpu", "group",
+                                                group=["bar"])[0])
+
+    def test_sqlite_backend_pool(self):
+        self._create_sqlite_db([
+            ("foo", "prj", 1, 3600.0, 3600.0,
+             "2013-01-01 00:00:00", "2013-01-01 01:00:00",
+             "2013-01-01 02:00:00"),
+        ])
+        CONF.set_override("pool_size", 2, group="gecollector")
+        self.addCleanup(CONF.clear_override, "pool_size",
+                        group="gecollector")
+        for _ in range(3):
+            self.assertEqual({"foo": 1},
+                             self.collector.get("cpu", "group",
+                                                group=["foo"]))
+
+    def test_sqlite_backend_error(self):
+        self._create_sqlite_db([])
+        conn = sqlite3.connect(CONF.gecollector.dbname)
+        conn.execute("DROP TABLE ge_jobs")
+        conn.close()
+        self.assertRaises(exception.SQLiteBackendException,
+                          self.collector.get, "cpu", "group", group=["foo"])
+        self.assertRaises(exception.SQLiteBackendException,
+                          self.collector.get, "occupancy", "group",
+                          start_time="2013-01-01 00:00",
+                          end_time="2013-01-02 00:00")
+
+    def _create_clusters(self):
+        self._create_sqlite_db([
+            ("foo", "prj", 1, 3600.0, 3600.0,
+             "2013-01-01 00:00:00", "2013-01-01 01:00:00",
+             "2013-01-01 02:00:00"),
+            ("bar", "prj", 1, 1800.0, 3600.0,
+             "2013-01-01 00:00:00", "2013-01-01 01:00:00",
+             "2013-01-01 02:00:00"),
+        ], group="cluster_a")
+        self._create_sqlite_db([
+            ("foo", "prj", 2, 3600.0, 3600.0,
+             "2013-01-01 00:00:00", "2013-01-01 01:00:00",
+             "2013-01-01 02:00:00"),
+        ], group="cluster_b")
+        CONF.set_override("clusters", ["cluster_a", "cluster_b"],
+                          group="gecollector")
+        self.addCleanup(CONF.clear_override, "clusters",
+                        group="gecollector")
+
+    def test_clusters(self):
+        self._create_clusters()
+        kwargs = {"group": ["foo", "bar"]}
+        self.assertEqual({"foo": 2, "bar": 0.5},
+                         self.collector.get("cpu", "group", **kwargs))
+        self.assertEqual({"foo": 3, "bar": 1},
+                         self.collector.get("wallclock", "group", **kwargs))
+        efficiency = self.collector.get("efficiency", "group", **kwargs)
+        self.assertAlmostEqual(66.666, efficiency["foo"], places=2)
+        self.assertEqual(50, efficiency["bar"])
+
+    def test_clusters_breakdown(self):
+        self._create_clusters()
+        CONF.set_override("cluster_breakdown", True, group="gecollector")
+        self.addCleanup(CONF.clear_override, "cluster_breakdown",
+                        group="gecollector")
+        self.assertEqual({"cluster_a/foo": 1,
+                          "cluster_a/bar": 0.5,
+                          "cluster_b/foo": 1},
+                         self.collector.get("cpu", "group",
+                                            group=["foo", "bar"]))
+
+    def test_clusters_driver(self):
+        # The clusters are SQLite ones, while 'gecollector' is MySQL
+        self._create_clusters()
+        for k, v in (("max_estimated_rows", 1), ("query_timeout", 30)):
+            CONF.set_override(k, v, group="gecollector")
+            self.addCleanup(CONF.clear_override, k, group="gecollector")
+        self.assertEqual({"foo": 2, "bar": 0.5},
+                         self.collector.get("cpu", "group",
+                                            group=["foo", "bar"]))
+        for cmd in self.collector.statements("cpu", "group",
+                                             group=["foo", "bar"]):
+            self.assertNotIn("MAX_EXECUTION_TIME", cmd)
+        # The buckets are computed with the SQLite functions
+        wait_time = self.collector.get("wait_time", "group",
+                                       group=["foo", "bar"], percentile=50)
+        self.assertEqual(["bar", "foo"], sorted(wait_time))
+        self.assertAlmostEqual(1, wait_time["foo"], places=1)
+
+    def test_by_target(self):
+        self._create_clusters()
+        targets = self.collector.by_target()
+        self.assertEqual(["cluster_a", "cluster_b"],
+                         [name for name, target, c in targets])
+        name, target, collector = targets[0]
+        self.assertEqual({"foo": 1, "bar": 0.5},
+                         collector.get("cpu", "group", group=["foo", "bar"]))
+        for cmd in collector.statements("wait_time", "group",
+                                        group=["foo"]):
+            self.assertIn("strftime", cmd)
+        self.assertEqual({"foo": 2, "bar": 0.5},
+                         self.collector.get("cpu", "group",
+                                            group=["foo", "bar"]))
+
+    def test_source(self):
+        source = self.collector.source()
+        self.assertEqual(source, self.collector.source())
+        for k, v in (("dbname", "other"), ("sample_rate", 10)):
+            CONF.set_override(k, v, group="gecollector")
+            self.addCleanup(CONF.clear_override, k, group="gecollector")
+            self.assertNotEqual(source, self.collector.source())
+            source = self.collector.source()
+        self._create_clusters()
+        self.assertNotEqual(source, self.collector.source())
+
+    def test_explain_target(self):
+        self._create_clusters()
+        targets = []
+
+        @contextlib.contextmanager
+        def _connection(target=None, host=None):
+            targets.append(target)
+            yield mock.MagicMock()
+
+        with mock.patch.object(self.collector, "_connection",
+                               side_effect=_connection):
+            self.collector.explain("SELECT 1", CONF.cluster_a)
+            self.collector.explain_cost("SELECT 1", CONF.cluster_a)
+        self.assertEqual([CONF.cluster_a, CONF.cluster_a], targets)
+
+    def _set_replicas(self, replicas, balancing="round-robin"):
+        for k, v in (("replicas", replicas),
+                     ("replica_balancing", balancing),
+                     ("host", "primary"),
+                     ("port", 3306)):
+            CONF.set_override(k, v, group="gecollector")
+            self.addCleanup(CONF.clear_override, k, group="gecollector")
+        self.addCleanup(achus.collector.gridengine._LATENCIES.clear)
+        self.addCleanup(achus.collector.gridengine._FAILURES.clear)
+
+    def test_get_hosts_recent(self):
+        self._set_replicas(["replica1", "replica2:3307"])
+        self.assertEqual([("primary", 3306)],
+                         self.collector._get_hosts(CONF.gecollector, {}))
+        self.assertEqual([("primary", 3306)],
+                         self.collector._get_hosts(
+                             CONF.gecollector,
+                             {"ge_end_time": "2100-01-01"}))
+
+    def test_get_hosts_round_robin(self):
+        self._set_replicas(["replica1", "replica2:3307"])
+        conditions = {"ge_end_time": "2013-01-01"}
+        first = self.collector._get_hosts(CONF.gecollector, conditions)
+        second = self.collector._get_hosts(CONF.gecollector, conditions)
+        self.assertEqual(set([("replica1", 3306), ("replica2", 3307)]),
+                         set(first[:2]))
+        self.assertEqual(first[:2], second[1::-1])
+        self.assertEqual(("primary", 3306), first[-1])
+
+    def test_get_hosts_least_latency(self):
+        self._set_replicas(["replica1", "replica2", "replica3"],
+                           balancing="least-latency")
+        self.collector._record_latency(("replica1", 3306), 2.0)
+        self.collector._record_latency(("replica2", 3306), 1.0)
+        self.collector._record_latency(("replica3", 3306))
+        self.assertEqual([("replica2", 3306),
+                          ("replica1", 3306),
+                          ("replica3", 3306),
+                          ("primary", 3306)],
+                         self.collector._get_hosts(
+                             CONF.gecollector,
+                             {"ge_end_time": "2013-01-01"}))
+
+    def test_query_failover(self):
+        self._set_replicas(["replica1", "replica2"])
+        hosts = []
+
+        @contextlib.contextmanager
+        def _connection(target, host):
+            hosts.append(host)
+            if host[0] != "primary":
+                raise _mysql_exceptions.OperationalError(2006, "gone away")
+            yield mock.Mock()
+
+        with contextlib.nested(
+                mock.patch.object(self.collector, "_connection",
+                                  side_effect=_connection),
+                mock.patch.object(self.collector, "_run_queries",
+                                  return_value="result")):
+            self.assertEqual("result",
+                             self.collector.query(
+                                 "cpu_time", ["ge_group"],
+                                 conditions={"ge_end_time": "2013-01-01"}))
+        self.assertEqual(3, len(hosts))
+        self.assertEqual(("primary", 3306), hosts[-1])
+
+    def test_query_failover_all_failed(self):
+        self._set_replicas(["replica1"])
+
+        @contextlib.contextmanager
+        def _connection(target, host):
+            raise _mysql_exceptions.OperationalError(2006, "gone away")
+            yield
+
+        with mock.patch.object(self.collector, "_connection",
+                               side_effect=_connection):
+            self.assertRaises(exception.MySQLBackendUnavailable,
+                              self.collector.query, "cpu_time", ["ge_group"],
+                              conditions={"ge_end_time": "2013-01-01"})
+
+    def test_query_no_failover(self):
+        self._set_replicas(["replica1", "replica2"])
+        hosts = []
+
+        @contextlib.contextmanager
+        def _connection(target, host):
+            hosts.append(host)
+            yield mock.Mock()
+
+        for error in (_mysql_exceptions.ProgrammingError(1064, "syntax"),
+                      _mysql_exceptions.OperationalError(1054, "column")):
+            del hosts[:]
+            with contextlib.nested(
+                    mock.patch.object(self.collector, "_connection",
+                                      side_effect=_connection),
+                    mock.patch.object(self.collector, "_run_queries",
+                                      side_effect=error),
+                    mock.patch.object(self.collector,
+                                      "_record_latency")) as (_, _, record):
+                self.assertRaises(exception.MySQLBackendException,
+                                  self.collector.query, "cpu_time",
+                                  ["ge_group"],
+                                  conditions={"ge_end_time": "2013-01-01"})
+            self.assertEqual(1, len(hosts))
+            self.assertFalse(record.called)
+
+    def test_build_queries_timeout(self):
+        CONF.set_override("query_timeout", 30, group="gecollector")
+        self.addCleanup(CONF.clear_override, "query_timeout",
+                        group="gecollector")
+        queries = self.collector._build_queries("cpu_time", ["ge_group"],
+                                                top=5)
+        for cmd in queries[0]:
+            if cmd:
+                self.assertTrue(cmd.startswith(
+                    "SELECT /*+ MAX_EXECUTION_TIME(30000) */ "))
+
+    def test_time_budget(self):
+        CONF.set_override("query_timeout", 1, group="gecollector")
+        self.addCleanup(CONF.clear_override, "query_timeout",
+                        group="gecollector")
+        CONF.set_override("driver", "sqlite", group="gecollector")
+        self.addCleanup(CONF.clear_override, "driver", group="gecollector")
+        interrupted = threading.Event()
+        conn = mock.Mock()
+        conn.interrupt.side_effect = interrupted.set
+
+        def _run():
+            with self.collector._time_budget(conn, CONF.gecollector,
+                                             ("localhost", 3306)):
+                interrupted.wait(10)
+                raise sqlite3.OperationalError("interrupted")
+
+        self.assertRaises(exception.QueryTimeout, _run)
+        self.assertTrue(conn.interrupt.called)
+
+    def test_time_budget_not_exceeded(self):
+        CONF.set_override("query_timeout", 10, group="gecollector")
+        self.addCleanup(CONF.clear_override, "query_timeout",
+                        group="gecollector")
+        conn = mock.Mock()
+
+        def _run():
+            with self.collector._time_budget(conn, CONF.gecollector,
+                                             ("localhost", 3306)):
+                raise _mysql_exceptions.OperationalError(2006, "gone away")
+
+        self.assertRaises(_mysql_exceptions.OperationalError, _run)
+
+    def test_check_cost(self):
+        CONF.set_override("max_estimated_rows", 1000, group="gecollector")
+        self.addCleanup(CONF.clear_override, "max_estimated_rows",
+                        group="gecollector")
+        curs = mock.Mock()
+        curs.description = [("id",), ("table",), ("rows",)]
+        curs.fetchall.return_value = [(1, "ge_jobs", 800), (2, None, None)]
+        self.collector._check_cost(curs, "SELECT 1")
+        curs.fetchall.return_value = [(1, "ge_jobs", 800), (2, "t", 800)]
+        self.assertRaises(exception.QueryTooExpensive,
+                          self.collector._check_cost, curs, "SELECT 1")
+
+    def test_build_queries(self):
+        queries = self.collector._build_queries(
+            "cpu_time",
+            ["ge_group"],
+            conditions={"ge_group": ["foo"]})
+        self.assertEqual(1, len(queries))
+        cmd, cmd_negate, cmd_total = queries[0]
+        self.assertTrue(cmd.startswith("SELECT ge_group,SUM(ge_cpu) "
+                                       "FROM ge_jobs WHERE "
+                                       "(ge_group IN ('foo')) AND "))
+        self.assertTrue(cmd.endswith(" GROUP BY ge_group"))
+        self.assertIsNone(cmd_negate)
+        self.assertIsNone(cmd_total)
+
+    def test_build_queries_top(self):
+        cmd, _, cmd_total = self.collector._build_queries("cpu_time",
+                                                          ["ge_group"],
+                                                          top=5)[0]
+        self.assertTrue(cmd.endswith(" GROUP BY ge_group "
+                                     "ORDER BY 2 DESC LIMIT 5"))
+        self.assertTrue(cmd_total.startswith("SELECT SUM(ge_cpu) "
+                                             "FROM ge_jobs WHERE "))
+
+    def test_build_queries_several_aggregates(self):
+        cmd = self.collector._build_queries(["cpu_time", "wall_clock"],
+                                            ["ge_group"])[0][0]
+        self.assertTrue(cmd.startswith("SELECT ge_group,SUM(ge_cpu),"
+                                       "SUM(ge_ru_wallclock*ge_slots) "))
+
+    def test_get_statements_top(self):
+        statements = self.collector.statements("efficiency",
+                                               "group",
+                                               top=3)
+        self.assertEqual(2, len(statements))
+        self.assertIn("SUM(ge_ru_wallclock*ge_slots)", statements[1])
+
+    def test_fold_top(self):
+        Columns = achus.collector.gridengine.Columns
+        res = Columns([("foo", "bar", "baz")],
+                      [array.array("d", [1, 5, 3]),
+                       array.array("d", [10, 20, 30])])
+        res = self.collector._fold_top(res, 1)
+        self.assertEqual([("bar", "others")], res.keys)
+        self.assertEqual([array.array("d", [5, 4]),
+                          array.array("d", [20, 40])], res.sums)
+
+    def test_get_statements(self):
+        for metric in ("cpu", "wallclock", "efficiency"):
+            statements = self.collector.statements(metric,
+                                                   "group",
+                                                   group=["foo"])
+            self.assertEqual(1, len(statements))
+            self.assertIn("ge_group IN ('foo')", statements[0])
+
+    def test_get_statements_occupancy(self):
+        statements = self.collector.statements("occupancy", "group",
+                                               group=["foo"],
+                                               start_time="2013-01-01",
+                                               end_time="2013-01-02",
+                                               resolution="minute")
+        self.assertEqual(1, len(statements))
+        self.assertIn("ge_start_time < '2013-01-02'", statements[0])
+        self.assertTrue(statements[0].endswith("ORDER BY ge_start_time"))
+
+    def test_get_statements_percentile(self):
+        for metric in ("cpu", "wait_time", "runtime"):
+            statements = self.collector.statements(metric, "group",
+                                                   group=["foo"],
+                                                   percentile=90)
+            self.assertEqual(1, len(statements))
+            self.assertIn("ge_group IN ('foo')", statements[0])
+
+    def test_format_conditions_time_window(self):
+        l = self.collector._format_conditions(
+            ge_start_time="2013-01-01 00:00",
+            ge_end_time="2013-02-01 00:00",
+            ge_end_time_after="2013-01-15 00:00:00")
+        self.assertEqual(1, len(l))
+        self.assertIn("ge_start_time >= '2013-01-01 00:00'", l[0])
+        self.assertIn("ge_end_time <= '2013-02-01 00:00'", l[0])
+        self.assertIn("ge_end_time > '2013-01-15 00:00:00'", l[0])
+
+    def test_split_window_disabled(self):
+        conditions = {"ge_start_time": "2013-01-01",
+                      "ge_end_time": "2013-03-01"}
+        self.assertEqual([conditions],
+                         self.collector._split_window(conditions))
+
+    def test_split_window(self):
+        CONF.set_override("window_chunk", "month", group="gecollector")
+        self.addCleanup(CONF.clear_override, "window_chunk",
+                        group="gecollector")
+        conditions = {"ge_start_time": "2013-01-15",
+                      "ge_end_time": "2013-03-01",
+                      "ge_group": ["foo"]}
+        self.assertEqual(
+            [{"ge_start_time": "2013-01-15",
+              "ge_end_time": "2013-02-01 00:00:00",
+              "ge_group": ["foo"]},
+             {"ge_start_time": "2013-01-15",
+              "ge_end_time": "2013-03-01 00:00:00",
+              "ge_end_time_after": "2013-02-01 00:00:00",
+              "ge_group": ["foo"]}],
+            self.collector._split_window(conditions))
+
+    def test_split_window_end_time_after(self):
+        CONF.set_override("window_chunk", "month", group="gecollector")
+        self.addCleanup(CONF.clear_override, "window_chunk",
+                        group="gecollector")
+        conditions = {"ge_start_time": "2013-01-15",
+                      "ge_end_time": "2013-04-01",
+                      "ge_end_time_after": "2013-02-10"}
+        self.assertEqual(
+            [{"ge_start_time": "2013-01-15",
+              "ge_end_time": "2013-03-01 00:00:00",
+              "ge_end_time_after": "2013-02-10"},
+             {"ge_start_time": "2013-01-15",
+              "ge_end_time": "2013-04-01 00:00:00",
+              "ge_end_time_after": "2013-03-01 00:00:00"}],
+            self.collector._split_window(conditions))
+
+    def test_merge_columns(self):
+        Columns = achus.collector.gridengine.Columns
+        parts = [
+            Columns([("foo", "bar"), (1, 1)], [array.array("d", [1, 2])]),
+            Columns([("bar", "foo"), (1, 2)], [array.array("d", [3, 4])]),
+        ]
+        res = self.collector._merge_columns(parts)
+        self.assertEqual([("foo", "bar", "foo"), (1, 1, 2)], res.keys)
+        self.assertEqual([array.array("d", [1, 5, 4])], res.sums)
@@ -0,0 +1,110 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from oslo.config import cfg
+
+import achus.collector.gridengine
+from achus import loader
+from achus import test
+
+CONF = cfg.CONF
+
+
+def _record(job_number, group="foo", cpu=3600, task_number=0,
+            start_time=1357002000):
+    fields = dict((f, "0") for f in loader.FIELDS)
+    fields.update({"qname": "all.q", "hostname": "node01", "group": group,
+                   "owner": "user", "job_name": "job",
+                   "job_number": str(job_number), "project": "prj",
+                   "submission_time": "1356998400",
+                   "start_time": str(start_time),
+                   "end_time": str(start_time + 3600),
+                   "ru_wallclock": "3600", "slots": "1",
+                   "task_number": str(task_number), "cpu": str(cpu),
+                   "pe_taskid": "NONE"})
+    return ":".join(fields[f] for f in loader.FIELDS) + "\n"
+
+
+class AccountingLoaderTest(test.TestCase):
+    def setUp(self):
+        super(AccountingLoaderTest, self).setUp()
+
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.accounting_file = os.path.join(self.dir, "accounting")
+        self.dbname = os.path.join(self.dir, "ge.db")
+
+        conn = sqlite3.connect(self.dbname)
+        conn.execute("CREATE TABLE ge_jobs (%s)" % ", ".join(loader.COLUMNS))
+        conn.commit()
+        conn.close()
+        for k, v in (("driver", "sqlite"), ("dbname", self.dbname)):
+            CONF.set_override(k, v, group="gecollector")
+            self.addCleanup(CONF.clear_override, k, group="gecollector")
+
+        self.collector = achus.collector.gridengine.GECollector()
+        for name, columns in self.collector.UNIQUE_INDEXES.iteritems():
+            self.collector.create_index(name, columns)
+        self.loader = loader.AccountingLoader(
+            accounting_file=self.accounting_file)
+
+    def _write(self, data, mode="a"):
+        with open(self.accounting_file, mode) as f:
+            f.write(data)
+
+    def _count(self):
+        conn = sqlite3.connect(self.dbname)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM ge_jobs").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_parse_record(self):
+        row = loader.parse_record(_record(42))
+        self.assertEqual(len(loader.COLUMNS), len(row))
+        d = dict(zip(loader.FIELDS, row))
+        self.assertEqual("42", d["job_number"])
+        self.assertEqual("foo", d["group"])
+        self.assertIsNone(d["ar_submission_time"])
+        self.assertIsNotNone(d["end_time"])
+
+    def test_parse_record_invalid(self):
+        self.assertIsNone(loader.parse_record("# comment\n"))
+        self.assertIsNone(loader.parse_record("all.q:node01:foo\n"))
+
+    def test_load(self):
+        self._write("# Version: 6.2\n" + _record(1) + _record(2))
+        self.assertEqual((2, 2), self.loader.load())
+        self.assertEqual((0, 0), self.loader.load())
+
+        # Partially written records are left for the next run
+        self._write(_record(3) + _record(4)[:10])
+        self.assertEqual((1, 1), self.loader.load())
+        self._write(_record(4)[10:])
+        self.assertEqual((1, 1), self.loader.load())
+        self.assertEqual(4, self._count())
+
+        self.assertEqual({"foo": 4},
+                         self.collector.get("cpu", "group", group=["foo"]))
+
+    def test_load_transactions(self):
+        CONF.set_override("transaction_size", 2, group="load")
+        self.addCleanup(CONF.clear_override, "transaction_size",
+                        group="load")
+        CONF.set_override("batch_size", 1, group="load")
+        self.addCleanup(CONF.clear_override, "batch_size", group="load")
+        self._write("".join(_record(i) for i in range(5)))
+        self.assertEqual((5, 5), self.loader.load())
+        self.assertEqual(5, self._count())
+
+    def test_load_duplicates(self):
+        self._write(_record(1) + _record(1, task_number=1))
+        self.assertEqual((2, 2), self.loader.load())
+
+        # Rotated file, with the records already loaded
+        os.rename(self.accounting_file, "%s.0" % self.accounting_file)
+        self._write(_record(1) + _record(1, start_time=1357009200))
+        self.assertEqual((2, 1), self.loader.load())
+        self.assertEqual(3, self._count())
@@ -0,0 +1,112 @@
+import csv
+import datetime
+import os
+import shutil
+import tempfile
+
+from oslo.config import cfg
+import yaml
+
+import achus.collector
+from achus import exception
+from achus import materialize
+from achus import reporter
+from achus import test
+
+CONF = cfg.CONF
+
+
+class FakeCollector(achus.collector.BaseCollector):
+    calls = []
+
+    def get(self, metric, group_by, **kw):
+        self.calls.append((kw["start_time"], kw["end_time"]))
+        return {kw["group"][0]: int(kw["start_time"][5:7])}
+
+
+class MaterializerTest(test.TestCase):
+    def setUp(self):
+        super(MaterializerTest, self).setUp()
+
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        for k, v in (("period_store", os.path.join(self.dir, "store")),
+                     ("report_definition",
+                      os.path.join(self.dir, "report.yaml"))):
+            CONF.set_override(k, v)
+            self.addCleanup(CONF.clear_override, k)
+        for k, v in (("renderer_class", "achus.renderer.export.CSVExport"),
+                     ("output_file", os.path.join(self.dir, "report.csv"))):
+            CONF.set_override(k, v, group="renderer")
+            self.addCleanup(CONF.clear_override, k, group="renderer")
+        CONF.set_override("output_dir", self.dir, group="materialize")
+        self.addCleanup(CONF.clear_override, "output_dir",
+                        group="materialize")
+
+        with open(CONF.report_definition, "w") as f:
+            yaml.safe_dump({"metric": {"cpu": {"collector": "FakeCollector",
+                                               "metric": "cpu",
+                                               "aggregate": "foo",
+                                               "start_time": "2000-01-01",
+                                               "end_time": "2000-02-01"}},
+                            "aggregate": {"foo": {"group": ["bar"]}}}, f)
+        FakeCollector.calls = []
+        self.materializer = materialize.Materializer(
+            available_collectors=[FakeCollector])
+        self.period = ("2013-02", datetime.datetime(2013, 2, 1),
+                       datetime.datetime(2013, 3, 1))
+
+    def test_missing_period_store(self):
+        CONF.set_override("period_store", None)
+        self.assertRaises(exception.MissingPeriodStore,
+                          materialize.Materializer)
+
+    def test_last_closed(self):
+        # The period is not closed until 'period_close_delay' (1 hour)
+        # passes
+        self.assertEqual(self.period, self.materializer.last_closed(
+            datetime.datetime(2013, 3, 14)))
+        self.assertEqual(self.period, self.materializer.last_closed(
+            datetime.datetime(2013, 4, 1, 0, 30)))
+
+    def test_next_run(self):
+        self.assertEqual(datetime.datetime(2013, 4, 1, 1),
+                         self.materializer.next_run(
+                             datetime.datetime(2013, 3, 14)))
+        self.assertEqual(datetime.datetime(2013, 5, 1, 1),
+                         self.materializer.next_run(
+                             datetime.datetime(2013, 4, 1, 1)))
+
+    def test_materialize(self):
+        self.assertEqual([], self.materializer.materialize(*self.period))
+        self.assertEqual([("2013-02-01 00:00:00", "2013-03-01 00:00:00")],
+                         FakeCollector.calls)
+        self.assertFalse(os.path.exists(os.path.join(self.dir,
+                                                     "default-2013-02.csv")))
+
+        # On-demand runs over the period are served from the store
+        rep = reporter.Report(available_collectors=[FakeCollector],
+                              start_time="2013-02-01",
+                              end_time="2013-03-01")
+        rep.collect()
+        rep.generate()
+        self.assertEqual(1, len(FakeCollector.calls))
+        with open(CONF.renderer.output_file) as f:
+            self.assertEqual(["cpu", "bar", "", "2"], list(csv.reader(f))[1])
+
+    def test_materialize_render(self):
+        CONF.set_override("render", True, group="materialize")
+        self.addCleanup(CONF.clear_override, "render", group="materialize")
+        self.assertEqual([], self.materializer.materialize(*self.period))
+        with open(os.path.join(self.dir, "default-2013-02.csv")) as f:
+            self.assertEqual([["metric", "key", "time", "value"],
+                              ["cpu", "bar", "", "2"]],
+                             list(csv.reader(f)))
+
+    def test_failed_reports(self):
+        materializer = materialize.Materializer(
+            report_definitions={"bad": os.path.join(self.dir, "missing"),
+                                "good": CONF.report_definition},
+            available_collectors=[FakeCollector])
+        self.assertEqual(["bad"], materializer.materialize(*self.period))
+        self.assertEqual(1, len(FakeCollector.calls))
@@ -0,0 +1,38 @@
+import mock
+
+from achus import pool
+from achus import test
+
+
+class ConnectionPoolTest(test.TestCase):
+    def setUp(self):
+        super(ConnectionPoolTest, self).setUp()
+
+        self.factory = mock.Mock(side_effect=lambda: mock.Mock())
+        self.pool = pool.ConnectionPool(self.factory, 1)
+
+    def test_connections_are_reused(self):
+        with self.pool.connection() as conn:
+            pass
+        conn.rollback.assert_called_once_with()
+        with self.pool.connection() as conn2:
+            self.assertIs(conn, conn2)
+        self.assertEqual(1, self.factory.call_count)
+
+    def test_extra_connections_are_closed(self):
+        with self.pool.connection() as conn:
+            with self.pool.connection() as conn2:
+                pass
+        conn.close.assert_called_once_with()
+        self.assertFalse(conn2.close.called)
+        self.assertEqual(2, self.factory.call_count)
+
+    def test_broken_connections_are_discarded(self):
+        def _fail():
+            with self.pool.connection() as conn:
+                raise ValueError()
+            return conn
+        self.assertRaises(ValueError, _fail)
+        with self.pool.connection():
+            pass
+        self.assertEqual(2, self.factory.call_count)
@@ -1,13 +1,18 @@
+import shutil
+import tempfile
 import types
 
 import mock
 from oslo.config import cfg
 import pygal
 
+import achus.checkpoint
 from achus import exception
 import achus.renderer
 import achus.renderer.chart
 import achus.renderer.pdf
+import achus.renderer.vector
+import achus.result
 from achus import test
 
 CONF = cfg.CONF
@@ -81,6 +86,56 @@ class ChartRendererTest(test.TestCase, BaseRendererTest):
             for c in self.renderer._generate_charts():
                 self.assertIsInstance(c, self.chart_types[type_name])
 
+    def test_charts_do_not_share_series(self):
+        self.renderer.append_metric("foo", {"foo": 1, "bar": 2},
+                                    {"chart": "pie"})
+        self.renderer.append_metric("bar", {"baz": 3},
+                                    {"chart": "pie"})
+
+        charts = list(self.renderer._generate_charts())
+        self.assertEqual(["foo", "bar"], [c.config.title for c in charts])
+        self.assertEqual([2, 1], [len(c.raw_series) for c in charts])
+        self.assertIsNone(self.renderer.config.title)
+
+    def test_approximate(self):
+        metric = achus.result.MetricResult({"foo": 1, "bar": 2},
+                                           errors={"foo": 0.123},
+                                           sample_rate=100)
+        self.renderer.append_metric("cpu", metric, {"chart": "pie"})
+        chart = list(self.renderer._generate_charts())[0]
+        self.assertEqual("cpu (approximate, 1 in 100 jobs)",
+                         chart.config.title)
+        self.assertEqual(["bar", "foo (+/-0.12)"],
+                         sorted(s[0] for s in chart.raw_series))
+
+    def test_line_chart(self):
+        self.renderer.append_metric(
+            "timeline",
+            {"foo": [("2013-01-01 00:00:00", 1.0),
+                     ("2013-01-01 01:00:00", 2.5)],
+             "bar": [("2013-01-01 00:00:00", 0.0),
+                     ("2013-01-01 01:00:00", 1.0)]},
+            {"chart": "line"})
+
+        charts = list(self.renderer._generate_charts())
+        self.assertIsInstance(charts[0], pygal.Line)
+        self.assertEqual(["2013-01-01 00:00:00", "2013-01-01 01:00:00"],
+                         charts[0].x_labels)
+        self.assertEqual([[0.0, 1.0], [1.0, 2.5]],
+                         [s[1] for s in charts[0].raw_series])
+        self.assertTrue(charts[0].render().startswith("<?xml"))
+
+    def test_bar_chart(self):
+        self.renderer.append_metric(
+            "comparison",
+            {"foo": [("2013-02", 1.0), ("2013-03", 2.0)]},
+            {"chart": "bar"})
+
+        charts = list(self.renderer._generate_charts())
+        self.assertIsInstance(charts[0], pygal.Bar)
+        self.assertEqual(["2013-02", "2013-03"], charts[0].x_labels)
+        self.assertEqual([[1.0, 2.0]], [s[1] for s in charts[0].raw_series])
+
     def test_known_charts_are_rendered(self):
         for type_name, type_ in self.chart_types.iteritems():
             self.renderer.append_metric(
@@ -115,3 +170,57 @@ class PDFChartRendererTest(test.TestCase, BaseRendererTest):
         metric_def = {"chart": "pie"}
         self.renderer.append_metric(title, metric, metric_def)
         self.assertEqual('%PDF-1.3', self.renderer.render().next()[:8])
+
+    @mock.patch("PyPDF2.PdfFileReader")
+    @mock.patch("cairosvg.svg2pdf")
+    def test_checkpoint_pages(self, mock_svg2pdf, mock_reader):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.renderer.checkpoint = achus.checkpoint.Checkpoint(tmpdir)
+        self.renderer.checkpoint.save_page("foo", "foo page")
+        mock_svg2pdf.return_value = "bar page"
+        self.renderer.append_metric("foo", {"foo": 1}, {"chart": "pie"})
+        self.renderer.append_metric("bar", {"bar": 1}, {"chart": "pie"})
+        with mock.patch("PyPDF2.PdfFileWriter"):
+            self.renderer._generate_pdf()
+        mock_svg2pdf.assert_called_once()
+        self.assertEqual("bar page",
+                         self.renderer.checkpoint.get_page("bar"))
+        self.assertEqual(["foo page", "bar page"],
+                         [c[0][0].getvalue()
+                          for c in mock_reader.call_args_list])
+
+
+class VectorPDFChartRendererTest(test.TestCase, BaseRendererTest):
+    def setUp(self):
+        super(VectorPDFChartRendererTest, self).setUp()
+
+        self.renderer = achus.renderer.vector.VectorPDFChart()
+
+    def test_chart_type_unknown(self):
+        self.assertRaises(exception.UnknownChartType,
+                          self.renderer.append_metric,
+                          "foo",
+                          {},
+                          {"chart": "fake chart"})
+
+    def test_chart(self):
+        self.renderer.append_metric("pie", {"foo": 1, "bar": 2},
+                                    {"chart": "pie"})
+        self.renderer.append_metric("bar", {"foo": 1, "bar": 0},
+                                    {"chart": "horizontal_bar"})
+        self.renderer.append_metric("line",
+                                    {"foo": [("2013-01-01 00:00:00", 1.0),
+                                             ("2013-01-01 01:00:00", 2.0)],
+                                     "bar": [("2013-01-01 00:00:00", 0.0),
+                                             ("2013-01-01 01:00:00", 4.0)]},
+                                    {"chart": "line"})
+        self.renderer.append_metric("compared",
+                                    {"foo": [("2013-01", 1.0),
+                                             ("2013-02", 2.0)],
+                                     "bar": [("2013-01", -1.0),
+                                             ("2013-02", 0.0)]},
+                                    {"chart": "bar"})
+        self.renderer.append_metric("empty", {}, {"chart": "pie"})
+        self.renderer.append_metric("empty line", {}, {"chart": "line"})
+        self.assertEqual('%PDF-', self.renderer.render().next()[:5])
@@ -1,11 +1,17 @@
 import copy
+import csv
+import os
+import shutil
 import StringIO
+import tempfile
+import threading
 
 import mock
 from oslo.config import cfg
 import yaml
 
 from achus import exception
+import achus.collector
 import achus.renderer.chart
 import achus.renderer.pdf
 from achus import reporter
@@ -69,6 +75,263 @@ class ReporterTest(test.TestCase):
 
         self.assertIn("FakeCollector", rep._get_collectors())
 
+    @mock.patch.object(reporter.Report, "_report_from_yaml")
+    def test_get_collector_calls(self, mock_yaml):
+        class FakeCollector(object):
+            pass
+        rep = reporter.Report()
+        rep.available_collectors = [FakeCollector]
+        rep.metric = {"foometric": {"collector": "FakeCollector",
+                                    "metric": "cpu",
+                                    "aggregate": "foo",
+                                    "start_time": "2013-01-01 00:00"}}
+        rep.aggregate = {"foo": {"group": ["bar"]}}
+
+        calls = list(rep.get_collector_calls())
+        self.assertEqual(1, len(calls))
+        title, conf, collector, collector_calls = calls[0]
+        self.assertEqual("foometric", title)
+        self.assertIsInstance(collector, FakeCollector)
+        self.assertEqual([("group", {"group": ["bar"],
+                                     "start_time": "2013-01-01 00:00"})],
+                         collector_calls)
+
+    @mock.patch.object(reporter.Report, "_report_from_yaml")
+    def test_collect(self, mock_yaml):
+        class FakeCollector(achus.collector.BaseCollector):
+            def get(self, metric, group_by, **kw):
+                return {"%s-%s" % (metric, group_by): kw["group"][0]}
+        CONF.set_override("collect_workers", 4)
+        self.addCleanup(CONF.clear_override, "collect_workers")
+        rep = reporter.Report()
+        rep.available_collectors = [FakeCollector]
+        rep.metric = dict(("foometric%s" % i,
+                           {"collector": "FakeCollector",
+                            "metric": "cpu",
+                            "aggregate": "foo%s" % i})
+                          for i in range(10))
+        rep.aggregate = dict(("foo%s" % i, {"group": ["bar%s" % i]})
+                             for i in range(10))
+
+        with mock.patch.object(rep.renderer,
+                               "append_metric") as mock_method:
+            rep.collect()
+        self.assertEqual(10, mock_method.call_count)
+        for i in range(10):
+            mock_method.assert_any_call("foometric%s" % i,
+                                        {"cpu-group": "bar%s" % i},
+                                        rep.metric["foometric%s" % i])
+
+    def _failing_report(self, error):
+        class FakeCollector(achus.collector.BaseCollector):
+            def get(self, metric, group_by, **kw):
+                if kw["group"][0] == "bad":
+                    error()
+                return {"foo": 1}
+        rep = reporter.Report()
+        rep.available_collectors = [FakeCollector]
+        rep.metric = {"good": {"collector": "FakeCollector",
+                               "metric": "cpu",
+                               "aggregate": "good"},
+                      "bad": {"collector": "FakeCollector",
+                              "metric": "cpu",
+                              "aggregate": "bad"}}
+        rep.aggregate = {"good": {"group": ["good"]},
+                         "bad": {"group": ["bad"]}}
+        return rep
+
+    @mock.patch.object(reporter.Report, "_report_from_yaml")
+    def test_collect_failure(self, mock_yaml):
+        def _error():
+            raise exception.QueryTimeout(timeout=1)
+        rep = self._failing_report(_error)
+        self.assertRaises(exception.QueryTimeout, rep.collect)
+
+    @mock.patch.object(reporter.Report, "_report_from_yaml")
+    def test_collect_partial_results(self, mock_yaml):
+        def _error():
+            raise exception.QueryTimeout(timeout=1)
+        CONF.set_override("partial_results", True)
+        self.addCleanup(CONF.clear_override, "partial_results")
+        rep = self._failing_report(_error)
+        with mock.patch.object(rep.renderer,
+                               "append_metric") as mock_method:
+            rep.collect()
+        mock_method.assert_called_once_with("good", {"foo": 1},
+                                            rep.metric["good"])
+        self.assertEqual(["bad"], [title for title, _ in rep.failures])
+
+    @mock.patch.object(reporter.Report, "_report_from_yaml")
+    def test_collect_timeout(self, mock_yaml):
+        event = threading.Event()
+        self.addCleanup(event.set)
+        CONF.set_override("partial_results", True)
+        self.addCleanup(CONF.clear_override, "partial_results")
+        CONF.set_override("collect_timeout", 1)
+        self.addCleanup(CONF.clear_override, "collect_timeout")
+        CONF.set_override("collect_workers", 2)
+        self.addCleanup(CONF.clear_override, "collect_workers")
+        rep = self._failing_report(lambda: event.wait(10))
+        with mock.patch.object(rep.renderer,
+                               "append_metric") as mock_method:
+            rep.collect()
+        mock_method.assert_called_once_with("good", {"foo": 1},
+                                            rep.metric["good"])
+        self.assertEqual("bad", rep.failures[0][0])
+        self.assertIn("time budget", rep.failures[0][1])
+
+    @mock.patch.object(reporter.Report, "_report_from_yaml")
+    def test_fan_out(self, mock_yaml):
+        class FakeCollector(achus.collector.BaseCollector):
+            def get(self, metric, group_by, **kw):
+                return {("foo", "prj1"): 1, ("foo", "prj2"): 2,
+                        ("bar", "prj1"): 3}
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        for k, v in (("renderer_class", "achus.renderer.export.CSVExport"),
+                     ("output_file", os.path.join(tmpdir, "report.csv"))):
+            CONF.set_override(k, v, group="renderer")
+            self.addCleanup(CONF.clear_override, k, group="renderer")
+        CONF.set_override("fan_out", "group")
+        self.addCleanup(CONF.clear_override, "fan_out")
+        rep = reporter.Report()
+        rep.available_collectors = [FakeCollector]
+        rep.metric = {"cpu": {"collector": "FakeCollector",
+                              "metric": "cpu",
+                              "aggregate": "foo"}}
+        rep.aggregate = {"foo": {"project": ["prj1", "prj2"]}}
+
+        calls = list(rep.get_collector_calls())
+        self.assertEqual("group", calls[0][3][0][1]["fan_out"])
+        rep.collect()
+        self.assertEqual(["bar", "foo"], sorted(rep.documents))
+        filenames = rep.generate()
+        self.assertEqual([os.path.join(tmpdir, "report-bar.csv"),
+                          os.path.join(tmpdir, "report-foo.csv")],
+                         filenames)
+        with open(filenames[1]) as f:
+            self.assertEqual([["metric", "key", "time", "value"],
+                              ["cpu", "prj1", "", "1"],
+                              ["cpu", "prj2", "", "2"]],
+                             list(csv.reader(f)))
+        self.assertFalse(os.path.exists(os.path.join(tmpdir, "report.csv")))
+
+    def test_compare(self):
+        class FakeCollector(achus.collector.BaseCollector):
+            def get(self, metric, group_by, **kw):
+                return {kw["group"][0]: int(kw["start_time"][5:7])}
+        definition = {"metric": {"cpu": {"collector": "FakeCollector",
+                                         "metric": "cpu",
+                                         "aggregate": "foo",
+                                         "chart": "bar",
+                                         "compare": {
+                                             "period": "month",
+                                             "end_time": "2013-03-01"}}},
+                      "aggregate": {"foo": {"group": ["bar"]}}}
+        rep = reporter.Report(report=definition,
+                              available_collectors=[FakeCollector])
+        with mock.patch.object(rep.renderer,
+                               "append_metric") as mock_method:
+            rep.collect()
+        mock_method.assert_called_once_with(
+            "cpu", {"bar": [("2013-01", 1), ("2013-02", 2)]}, mock.ANY)
+
+    def test_report_from_yaml_bad_comparison(self):
+        self.report_def["metric"]["foo"]["compare"] = {"period": "hour"}
+        self._mock_open_and_assert(yaml.dump(self.report_def),
+                                   self.assertRaises,
+                                   exception.InvalidComparison,
+                                   reporter.Report)
+
+    def test_resume(self):
+        calls = []
+
+        class FakeCollector(achus.collector.BaseCollector):
+            def get(self, metric, group_by, **kw):
+                calls.append(kw["group"][0])
+                if kw["group"][0] == "bad":
+                    raise exception.QueryTimeout(timeout=1)
+                return {"foo": 1}
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        for k, v in (("run_dir", tmpdir), ("partial_results", True)):
+            CONF.set_override(k, v)
+            self.addCleanup(CONF.clear_override, k)
+        definition = {"metric": {"good": {"collector": "FakeCollector",
+                                          "metric": "cpu",
+                                          "aggregate": "good"},
+                                 "bad": {"collector": "FakeCollector",
+                                         "metric": "cpu",
+                                         "aggregate": "bad"}},
+                      "aggregate": {"good": {"group": ["good"]},
+                                    "bad": {"group": ["bad"]}}}
+
+        def _run(resume):
+            rep = reporter.Report(report=copy.deepcopy(definition),
+                                  available_collectors=[FakeCollector],
+                                  resume=resume)
+            with mock.patch.object(rep.renderer, "render_to_file"):
+                with mock.patch.object(rep.renderer,
+                                       "append_metric") as mock_method:
+                    rep.collect()
+                    rep.generate()
+            return mock_method
+
+        _run(False)
+        self.assertEqual(["bad", "good"], sorted(calls))
+        del calls[:]
+        mock_method = _run(True)
+        self.assertEqual(["bad"], calls)
+        mock_method.assert_called_once_with("good", {"foo": 1}, mock.ANY)
+
+        # Once done, resuming does not gather nor render anything again
+        definition["aggregate"]["bad"]["group"] = ["good"]
+        _run(False)
+        del calls[:]
+        open(CONF.renderer.output_file, "w").close()
+        self.addCleanup(os.unlink, CONF.renderer.output_file)
+        rep = reporter.Report(report=copy.deepcopy(definition),
+                              available_collectors=[FakeCollector],
+                              resume=True)
+        with mock.patch.object(rep.renderer,
+                               "render_to_file") as mock_method:
+            rep.collect()
+            rep.generate()
+        self.assertFalse(mock_method.called)
+
+    def test_loading_keeps_run_dir(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        CONF.set_override("run_dir", tmpdir)
+        self.addCleanup(CONF.clear_override, "run_dir")
+        definition = {"metric": {"good": {"collector": "FakeCollector",
+                                          "metric": "cpu",
+                                          "aggregate": "good"}},
+                      "aggregate": {"good": {"group": ["good"]}}}
+        rep = reporter.Report(report=copy.deepcopy(definition),
+                              available_collectors=[])
+        rep._open_checkpoint()
+        rep.checkpoint.save_metric("good", {"foo": 1})
+
+        # Only loading the definition (e.g. --explain) does not clear it
+        rep = reporter.Report(report=copy.deepcopy(definition),
+                              available_collectors=[])
+        self.assertIsNone(rep.checkpoint)
+        rep = reporter.Report(report=copy.deepcopy(definition),
+                              available_collectors=[], resume=True)
+        rep._open_checkpoint()
+        self.assertEqual({"foo": 1}, rep.checkpoint.get_metric("good"))
+
+        rep = reporter.Report(report=copy.deepcopy(definition),
+                              available_collectors=[], checkpointed=False)
+        rep._open_checkpoint()
+        self.assertIsNone(rep.checkpoint)
+
+    def test_resume_without_run_dir(self):
+        self.assertRaises(exception.MissingRunDir, reporter.Report,
+                          report=copy.deepcopy(self.report_def),
+                          resume=True)
+
     def test_load_yaml_no_aggregate(self):
         del self.report_def["aggregate"]
         y = yaml.safe_dump(self.report_def)
@@ -0,0 +1,72 @@
+import array
+import collections
+import cPickle
+
+from achus import result
+from achus import test
+
+
+class MetricResultTest(test.TestCase):
+    def test_mapping(self):
+        r = result.MetricResult({"foo": 1, "bar": 2})
+        self.assertIsInstance(r, collections.Mapping)
+        self.assertEqual({"foo": 1, "bar": 2}, r)
+        self.assertEqual(r, {"foo": 1, "bar": 2})
+        self.assertNotEqual({"foo": 1}, r)
+        self.assertEqual(["foo", "bar"], r.keys())
+        self.assertEqual(2, r["bar"])
+        self.assertIn("foo", r)
+        self.assertIsNone(r.get("baz"))
+        self.assertRaises(KeyError, lambda: r["baz"])
+        self.assertRaises(AttributeError, setattr, r, "foo", 1)
+
+    def test_from_columns(self):
+        keys = ("foo", "bar", "foo", "leftover")
+        values = array.array("d", [1, 2, 3, 4])
+        r = result.MetricResult.from_columns(keys, values)
+        self.assertEqual({"foo": 4, "bar": 2, "leftover": 4}, r)
+        self.assertEqual(10, r.total())
+
+    def test_interned_keys(self):
+        key = "".join(["fo", "o"])
+        a = result.MetricResult([(key, 1), (("".join(["x", "y"]), u"z"), 2)])
+        b = result.MetricResult([("foo", 1), (("xy", u"z"), 2),
+                                 (u"b\xe1r", 3)])
+        self.assertIs(a.keys()[0], b.keys()[0])
+        self.assertIs(a.keys()[1][0], b.keys()[1][0])
+        self.assertEqual(u"b\xe1r", b.keys()[2])
+
+    def test_merge(self):
+        a = result.MetricResult({"foo": 1, "bar": 2})
+        b = result.MetricResult({"foo": 3, "baz": 4})
+        self.assertEqual({"foo": 4, "bar": 2, "baz": 4}, a.merge(b))
+        self.assertEqual({"foo": 1, "bar": 2}, a)
+
+    def test_ratio(self):
+        a = result.MetricResult({"foo": 1, "bar": 2, "baz": 5})
+        b = result.MetricResult({"foo": 2, "bar": 8, "baz": 0})
+        self.assertEqual({"foo": 50, "bar": 25, "baz": 0}, a.ratio(b, 100))
+
+    def test_scaled(self):
+        a = result.MetricResult({"foo": 3600}, sample_rate=10)
+        scaled = a.scaled(1 / 3600.0)
+        self.assertEqual({"foo": 1}, scaled)
+        self.assertEqual(10, scaled.sample_rate)
+        self.assertEqual({"foo": 3600}, a)
+
+    def test_split(self):
+        errors = result.MetricResult({("foo", "a"): 0.1})
+        r = result.MetricResult({("foo", "a"): 1, ("foo", "b"): 2,
+                                 ("bar", "a"): 3},
+                                errors=errors, sample_rate=10)
+        d = r.split()
+        self.assertEqual({"foo": {"a": 1, "b": 2}, "bar": {"a": 3}}, d)
+        self.assertEqual({"a": 0.1}, d["foo"].errors)
+        self.assertEqual(10, d["bar"].sample_rate)
+
+    def test_pickle(self):
+        r = result.MetricResult({"foo": 1}, sample_rate=10)
+        for protocol in (0, cPickle.HIGHEST_PROTOCOL):
+            loaded = cPickle.loads(cPickle.dumps(r, protocol))
+            self.assertEqual(r, loaded)
+            self.assertEqual(10, loaded.sample_rate)
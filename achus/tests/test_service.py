@@ -0,0 +1,118 @@
+import json
+import os
+import tempfile
+import threading
+import urllib2
+
+import mock
+from oslo.config import cfg
+
+from achus import exception
+from achus import service
+from achus import test
+
+CONF = cfg.CONF
+
+
+class ReportServiceTest(test.TestCase):
+    def setUp(self):
+        super(ReportServiceTest, self).setUp()
+
+        self.definition = tempfile.NamedTemporaryFile()
+        self.addCleanup(self.definition.close)
+        CONF.set_override("report_definitions",
+                          {"foo": self.definition.name},
+                          group="serve")
+        self.addCleanup(CONF.clear_override, "report_definitions",
+                        group="serve")
+
+        self.reports = []
+        patcher = mock.patch("achus.reporter.Report",
+                             side_effect=self._fake_report)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.service = service.ReportService()
+
+    def _fake_report(self, report_definition=None, report=None,
+                     available_collectors=None, start_time=None,
+                     end_time=None, checkpointed=True, output_file=None):
+        if report is None:
+            report = {"metric": {"foometric": {"start_time": "2013-01-01"}},
+                      "aggregate": {}}
+        rep = mock.Mock()
+        rep.metric = report["metric"]
+        for conf in rep.metric.itervalues():
+            if start_time:
+                conf["start_time"] = start_time
+            if end_time:
+                conf["end_time"] = end_time
+        rep.aggregate = report["aggregate"]
+        rep.output_file = output_file
+        rep.renderer.render.return_value = iter(["%PDF-"])
+        self.reports.append(rep)
+        return rep
+
+    def test_unknown_report(self):
+        self.assertRaises(exception.ReportNotFound,
+                          self.service.render,
+                          "bar")
+
+    def test_render(self):
+        self.assertEqual("%PDF-", self.service.render("foo"))
+        self.reports[-1].collect.assert_called_once_with()
+
+    def test_render_own_output_file(self):
+        self.service.render("foo")
+        self.service.render("foo", end_time="2014-01-01")
+        paths = [r.output_file for r in self.reports[-2:]]
+        self.assertNotEqual(paths[0], paths[1])
+        self.assertNotIn(CONF.renderer.output_file, paths)
+        for path in paths:
+            self.assertFalse(os.path.exists(path))
+
+    def test_render_is_cached(self):
+        self.service.render("foo")
+        self.service.render("foo")
+        self.assertEqual(1, sum(r.collect.call_count for r in self.reports))
+        self.assertEqual(1, self.service.get_stats()["cache_hits"])
+
+    def test_render_overrides_time_window(self):
+        definition = self.service._get_definition("foo")[1]
+        self.service.render("foo", end_time="2014-01-01")
+
+        self.assertEqual({"foometric": {"start_time": "2013-01-01",
+                                        "end_time": "2014-01-01"}},
+                         self.reports[-1].metric)
+        # The cached definition is not modified
+        self.assertEqual({"start_time": "2013-01-01"},
+                         definition["metric"]["foometric"])
+
+    def test_stats(self):
+        for latency in (0.1, 0.3, 0.2):
+            self.service.record(latency)
+        self.service.record(1, error=True)
+
+        stats = self.service.get_stats()
+        self.assertEqual(4, stats["requests"])
+        self.assertEqual(1, stats["errors"])
+        self.assertEqual(0.3, stats["latency_p50"])
+        self.assertEqual(1, stats["latency_max"])
+
+    def test_http_server(self):
+        server = service.ReportServer(self.service, ("127.0.0.1", 0))
+        self.addCleanup(server.server_close)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+
+        url = "http://127.0.0.1:%s" % server.server_address[1]
+        self.assertEqual("%PDF-",
+                         urllib2.urlopen(url + "/report?name=foo").read())
+        self.assertRaises(urllib2.HTTPError,
+                          urllib2.urlopen,
+                          url + "/report?name=bar")
+        stats = json.load(urllib2.urlopen(url + "/stats"))
+        self.assertEqual(2, stats["requests"])
+        self.assertEqual(1, stats["errors"])
@@ -0,0 +1,48 @@
+import random
+
+from achus import sketch
+from achus import test
+
+
+class SketchTest(test.TestCase):
+    def _assert_close(self, expected, value, accuracy=0.01):
+        self.assertTrue(abs(value - expected) <= accuracy * expected,
+                        "%s not within %s of %s" % (value, accuracy, expected))
+
+    def test_quantile(self):
+        values = [random.uniform(1, 100000) for _ in range(10000)]
+        s = sketch.Sketch()
+        for v in values:
+            s.add(v)
+        values.sort()
+        self.assertEqual(10000, s.count)
+        for q in (0, 0.5, 0.95, 1):
+            self._assert_close(values[int(q * (len(values) - 1))],
+                               s.quantile(q))
+
+    def test_quantile_zero(self):
+        s = sketch.Sketch()
+        self.assertIsNone(s.quantile(0.5))
+        s.add(0, count=3)
+        s.add(-1)
+        s.add(10)
+        self.assertEqual(0, s.quantile(0.5))
+        self._assert_close(10, s.quantile(1))
+
+    def test_merge(self):
+        a, b, c = sketch.Sketch(), sketch.Sketch(), sketch.Sketch()
+        for i in range(1, 1001):
+            (a if i % 2 else b).add(i)
+            c.add(i)
+        a.merge(b)
+        self.assertEqual(c.buckets, a.buckets)
+        self.assertRaises(ValueError, a.merge, sketch.Sketch(accuracy=0.05))
+
+    def test_dict(self):
+        s = sketch.Sketch(accuracy=0.02)
+        for i in range(100):
+            s.add(i)
+        other = sketch.Sketch.from_dict(s.to_dict())
+        self.assertEqual(s.buckets, other.buckets)
+        self.assertEqual(s.zero_count, other.zero_count)
+        self.assertEqual(s.quantile(0.9), other.quantile(0.9))
@@ -1,3 +1,4 @@
+import datetime
 import types
 
 from achus import exception
@@ -9,6 +10,64 @@ class UtilTest(test.TestCase):
     def test_seconds_to_hours_conversion(self):
         self.assertEqual(1, utils.to_hours(3600))
 
+    def test_seconds_to_hours_no_rounding(self):
+        self.assertEqual(0.01, utils.to_hours(20))
+        self.assertEqual(20 / 3600.0, utils.to_hours(20, ndigits=None))
+
+    def test_fold_top(self):
+        d = {"foo": 1, "bar": 5, "baz": 3, "bazonk": 2}
+        self.assertEqual({"bar": 5, "baz": 3, "others": 3},
+                         utils.fold_top(d, 2))
+
+    def test_fold_top_not_needed(self):
+        d = {"foo": 1, "bar": 5, "others": 3}
+        self.assertEqual(d, utils.fold_top(d, 2))
+        self.assertEqual(d, utils.fold_top(d, None))
+
+    def test_parse_time(self):
+        expected = datetime.datetime(2013, 1, 1, 10, 30)
+        self.assertEqual(expected, utils.parse_time("2013-01-01 10:30"))
+        self.assertEqual(expected, utils.parse_time("2013-01-01 10:30:00"))
+        self.assertEqual(datetime.datetime(2013, 1, 1),
+                         utils.parse_time("2013-01-01"))
+
+    def test_cannot_parse_time(self):
+        self.assertRaises(exception.AchusException,
+                          utils.parse_time,
+                          "01/01/2013")
+
+    def test_split_window_month(self):
+        start = datetime.datetime(2012, 11, 15, 12)
+        end = datetime.datetime(2013, 2, 1)
+        self.assertEqual([start,
+                          datetime.datetime(2012, 12, 1),
+                          datetime.datetime(2013, 1, 1),
+                          end],
+                         utils.split_window(start, end, "month"))
+
+    def test_split_window_smaller_than_chunk(self):
+        start = datetime.datetime(2013, 1, 2)
+        end = datetime.datetime(2013, 1, 3)
+        self.assertEqual([start, end],
+                         utils.split_window(start, end, "year"))
+
+    def test_split_window_week(self):
+        # 2013-01-02 is a Wednesday
+        start = datetime.datetime(2013, 1, 2)
+        end = datetime.datetime(2013, 1, 15)
+        self.assertEqual([start,
+                          datetime.datetime(2013, 1, 7),
+                          datetime.datetime(2013, 1, 14),
+                          end],
+                         utils.split_window(start, end, "week"))
+
+    def test_split_window_unknown_chunk(self):
+        self.assertRaises(exception.UnknownWindowChunk,
+                          utils.split_window,
+                          datetime.datetime(2013, 1, 1),
+                          datetime.datetime(2013, 2, 1),
+                          "fortnight")
+
     def test_import_class(self):
         self.assertEqual(test.TestCase,
                          utils.import_class("achus.test.TestCase"))
@@ -31,3 +90,31 @@ class UtilTest(test.TestCase):
     def test_import_module(self):
         self.assertIsInstance(utils.import_module("os.path"),
                               types.ModuleType)
+
+    def test_period_start(self):
+        # 2013-03-14 is a Thursday
+        value = datetime.datetime(2013, 3, 14, 10, 30)
+        self.assertEqual(datetime.datetime(2013, 3, 14),
+                         utils.period_start(value, "day"))
+        self.assertEqual(datetime.datetime(2013, 3, 11),
+                         utils.period_start(value, "week"))
+        self.assertEqual(datetime.datetime(2013, 3, 1),
+                         utils.period_start(value, "month"))
+        self.assertEqual(datetime.datetime(2013, 1, 1),
+                         utils.period_start(value, "year"))
+        self.assertRaises(exception.UnknownWindowChunk,
+                          utils.period_start, value, "fortnight")
+
+    def test_shift_period(self):
+        value = datetime.datetime(2012, 3, 31)
+        self.assertEqual(datetime.datetime(2012, 2, 29),
+                         utils.shift_period(value, "month", -1))
+        self.assertEqual(datetime.datetime(2011, 12, 31),
+                         utils.shift_period(value, "month", -3))
+        self.assertEqual(datetime.datetime(2013, 1, 31),
+                         utils.shift_period(value, "month", 10))
+        self.assertEqual(datetime.datetime(2012, 3, 24),
+                         utils.shift_period(value, "week", -1))
+        self.assertEqual(datetime.datetime(2011, 2, 28),
+                         utils.shift_period(datetime.datetime(2012, 2, 29),
+                                            "year", -1))
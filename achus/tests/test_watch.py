@@ -0,0 +1,126 @@
+import datetime
+import os
+import shutil
+import tempfile
+
+import mock
+from oslo.config import cfg
+import yaml
+
+import achus.collector
+import achus.result
+from achus import test
+from achus import watch
+
+CONF = cfg.CONF
+
+
+class FakeCollector(achus.collector.BaseCollector):
+    FIELD_MAPPING = {"end_time_after": "end_time_after"}
+
+    # (group, end time, CPU hours) of the jobs
+    jobs = []
+    calls = []
+
+    def get(self, metric, group_by, **kw):
+        self.calls.append((metric, kw.get("end_time_after"), kw["end_time"]))
+        result = achus.result.MetricResult()
+        for group, end, cpu in self.jobs:
+            if (end <= kw["end_time"] and
+                    end > (kw.get("end_time_after") or kw["start_time"])):
+                result.add(group, cpu if metric == "cpu" else 2 * cpu)
+        return result
+
+
+class WatcherTest(test.TestCase):
+    def setUp(self):
+        super(WatcherTest, self).setUp()
+
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        for k, v in (("renderer_class", "achus.renderer.export.CSVExport"),
+                     ("output_file", os.path.join(self.dir, "report.csv"))):
+            CONF.set_override(k, v, group="renderer")
+            self.addCleanup(CONF.clear_override, k, group="renderer")
+        self.definition = os.path.join(self.dir, "report.yaml")
+        self._define({"cpu": "cpu", "efficiency": "efficiency"})
+
+        FakeCollector.jobs = [("foo", "2013-03-02 00:00:00", 1),
+                              ("bar", "2013-03-05 00:00:00", 2)]
+        FakeCollector.calls = []
+
+    def _define(self, metrics):
+        with open(self.definition, "w") as f:
+            yaml.safe_dump({"metric": dict((title,
+                                            {"collector": "FakeCollector",
+                                             "metric": metric,
+                                             "aggregate": "foo"})
+                                           for title, metric
+                                           in metrics.iteritems()),
+                            "aggregate": {"foo": {"group": ["*"]}}}, f)
+
+    def _watcher(self):
+        return watch.Watcher(report_definition=self.definition,
+                             available_collectors=[FakeCollector])
+
+    def test_refresh(self):
+        watcher = self._watcher()
+        self.assertEqual(["cpu", "efficiency"], sorted(watcher.refresh(
+            datetime.datetime(2013, 3, 10))))
+        self.assertEqual({"foo": 1, "bar": 2}, watcher.state["metrics"]["cpu"])
+        self.assertEqual({"foo": 50, "bar": 50},
+                         watcher.state["metrics"]["efficiency"])
+        self.assertTrue(os.path.exists(CONF.renderer.output_file))
+
+        # Only the jobs ended since the last refresh are queried
+        FakeCollector.jobs.append(("foo", "2013-03-11 00:00:00", 3))
+        del FakeCollector.calls[:]
+        self.assertEqual(["cpu"], watcher.refresh(
+            datetime.datetime(2013, 3, 12)))
+        self.assertEqual({"foo": 4, "bar": 2}, watcher.state["metrics"]["cpu"])
+        self.assertEqual(set([("2013-03-09 23:55:00", "2013-03-11 23:55:00")]),
+                         set(call[1:] for call in FakeCollector.calls))
+
+    def test_only_changed_pages_rendered(self):
+        watcher = self._watcher()
+        watcher.refresh(datetime.datetime(2013, 3, 10))
+        watcher.store.save_page("cpu", "cpu page")
+        watcher.store.save_page("efficiency", "efficiency page")
+
+        FakeCollector.jobs.append(("foo", "2013-03-11 00:00:00", 3))
+        watcher.refresh(datetime.datetime(2013, 3, 12))
+        self.assertIsNone(watcher.store.get_page("cpu"))
+        self.assertEqual("efficiency page",
+                         watcher.store.get_page("efficiency"))
+
+        with mock.patch.object(watcher, "_render") as mock_method:
+            self.assertEqual([], watcher.refresh(
+                datetime.datetime(2013, 3, 13)))
+        self.assertFalse(mock_method.called)
+
+    def test_not_incremental(self):
+        self._define({"wait": "wait_time"})
+        watcher = self._watcher()
+        watcher.refresh(datetime.datetime(2013, 3, 10))
+        watcher.refresh(datetime.datetime(2013, 3, 12))
+        self.assertEqual([("wait_time", None, "2013-03-09 23:55:00"),
+                          ("wait_time", None, "2013-03-11 23:55:00")],
+                         FakeCollector.calls)
+
+    def test_new_period(self):
+        watcher = self._watcher()
+        watcher.refresh(datetime.datetime(2013, 3, 10))
+        FakeCollector.jobs.append(("foo", "2013-04-02 00:00:00", 3))
+        watcher.refresh(datetime.datetime(2013, 4, 3))
+        self.assertEqual({"foo": 3}, watcher.state["metrics"]["cpu"])
+
+    def test_state_dir(self):
+        CONF.set_override("state_dir", os.path.join(self.dir, "state"),
+                          group="watch")
+        self.addCleanup(CONF.clear_override, "state_dir", group="watch")
+        self._watcher().refresh(datetime.datetime(2013, 3, 10))
+
+        del FakeCollector.calls[:]
+        watcher = self._watcher()
+        self.assertEqual([], watcher.refresh(datetime.datetime(2013, 3, 12)))
+        self.assertEqual("2013-03-09 23:55:00", FakeCollector.calls[0][1])
@@ -1,11 +1,122 @@
+import calendar
+import datetime
+import operator
 import sys
+import time
 import traceback
 
 from achus import exception
 
+TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d")
 
-def to_hours(seconds):
-    return round((float(seconds) / 3600), 2)
+
+def to_hours(seconds, ndigits=2):
+    """Converts seconds to hours, rounding unless 'ndigits' is None."""
+    hours = float(seconds) / 3600
+    if ndigits is None:
+        return hours
+    return round(hours, ndigits)
+
+
+def fold_top(d, top, others="others"):
+    """Keeps the 'top' items of 'd' with the highest values.
+
+    The values of the rest of the items are added up under the 'others' key.
+    """
+    if not top or len(d) <= top + 1:
+        return d
+    items = sorted(d.iteritems(), key=operator.itemgetter(1), reverse=True)
+    result = dict(items[:top])
+    result[others] = (result.get(others, 0) +
+                      sum(v for _, v in items[top:]))
+    return result
+
+
+def parse_time(value):
+    """Parses a date (with optional time) as given in report definitions."""
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise exception.AchusException("Cannot parse date '%s'" % value)
+
+
+def format_time(value):
+    """Formats a datetime as expected by the SQL backends."""
+    return value.strftime(TIME_FORMATS[0])
+
+
+def to_timestamp(value):
+    """Converts a datetime (or a string, see parse_time) to local epoch."""
+    if isinstance(value, basestring):
+        value = parse_time(value)
+    return time.mktime(value.timetuple())
+
+
+def _next_boundary(value, chunk):
+    day = datetime.datetime(value.year, value.month, value.day)
+    if chunk == "day":
+        return day + datetime.timedelta(days=1)
+    elif chunk == "week":
+        return day + datetime.timedelta(days=7 - day.weekday())
+    elif chunk == "month":
+        if value.month == 12:
+            return datetime.datetime(value.year + 1, 1, 1)
+        return datetime.datetime(value.year, value.month + 1, 1)
+    elif chunk == "year":
+        return datetime.datetime(value.year + 1, 1, 1)
+    raise exception.UnknownWindowChunk(chunk=chunk)
+
+
+def split_window(start, end, chunk):
+    """Splits the [start, end] time window into calendar aligned chunks.
+
+    Returns the list of boundaries, including 'start' and 'end', so that
+    chunk 'i' spans from l[i] to l[i+1].
+    """
+    l = [start]
+    boundary = _next_boundary(start, chunk)
+    while boundary < end:
+        l.append(boundary)
+        boundary = _next_boundary(boundary, chunk)
+    l.append(end)
+    return l
+
+
+def period_start(value, period):
+    """Returns the start of the calendar period (e.g. month) of 'value'."""
+    day = datetime.datetime(value.year, value.month, value.day)
+    if period == "day":
+        return day
+    elif period == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    elif period == "month":
+        return day.replace(day=1)
+    elif period == "year":
+        return day.replace(month=1, day=1)
+    raise exception.UnknownWindowChunk(chunk=period)
+
+
+def shift_period(value, period, n):
+    """Moves 'value' by 'n' periods (backwards if negative).
+
+    Days past the end of the resulting month (e.g. the 31st, or the 29th
+    of February) are clamped to its last day.
+    """
+    if period == "day":
+        return value + datetime.timedelta(days=n)
+    elif period == "week":
+        return value + datetime.timedelta(days=7 * n)
+    elif period == "month":
+        year, month = divmod(value.year * 12 + value.month - 1 + n, 12)
+        month += 1
+    elif period == "year":
+        year, month = value.year + n, value.month
+    else:
+        raise exception.UnknownWindowChunk(chunk=period)
+    day = min(value.day, calendar.monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
 
 
 def import_class(import_str):
@@ -0,0 +1,191 @@
+import datetime
+import json
+import logging
+import time
+
+from oslo.config import cfg
+
+from achus import checkpoint
+from achus import compare
+import achus.renderer
+from achus import reporter
+from achus import utils
+
+opts = [
+    cfg.IntOpt('interval',
+               default=900,
+               help='Seconds between the refreshes of the watched report.'),
+    cfg.StrOpt('period',
+               default='month',
+               help='Period watched, the one running (day, week, month or '
+                    'year).'),
+    cfg.IntOpt('lag',
+               default=300,
+               help='Seconds the accounting of a job may take to be '
+                    'loaded once it ends. The jobs ended more recently are '
+                    'left for the next refresh.'),
+    cfg.StrOpt('state_dir',
+               default=None,
+               help='Directory where the running sums and the rendered '
+                    'pages of the watched report are kept, so that they '
+                    'survive restarts (if not set, only in memory).'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(opts, group="watch")
+CONF.import_opt('output_file', 'achus.renderer', group="renderer")
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class Watcher(object):
+    """Keeps the report of the running period up to date.
+
+    The sums of the additive metrics are kept by key, along with the
+    high-water mark of the jobs' end time they cover: every refresh only
+    queries the jobs ended since, adds them up and moves the mark. The
+    rest of the metrics (distributions, timelines, comparisons), and the
+    collectors that cannot filter by it, are gathered again in full.
+
+    Only the pages of the metrics whose values changed are rendered
+    again, the rest are taken from the ones rendered before (see
+    'checkpoint' in the renderers). Fan-out is not supported, a single
+    report is rendered.
+    """
+
+    # Sums kept for each of the additive metrics
+    INCREMENTAL_METRICS = {
+        "cpu": ["cpu"],
+        "wallclock": ["wallclock"],
+        "efficiency": ["cpu", "wallclock"],
+    }
+
+    def __init__(self, report_definition=None, available_collectors=None):
+        self.report_definition = report_definition
+        self.available_collectors = available_collectors
+        self.period = CONF.watch.period
+        self.lag = datetime.timedelta(seconds=CONF.watch.lag)
+        self.window = None
+        self.rendered = False
+
+    def _load(self, start, end):
+        """Starts watching the [start, end) window.
+
+        The state kept for it, if any, is resumed.
+        """
+        self.report = reporter.Report(
+            report_definition=self.report_definition,
+            available_collectors=self.available_collectors,
+            start_time=utils.format_time(start),
+            end_time=utils.format_time(end),
+            checkpointed=False)
+        self.window = (start, end)
+        self.rendered = False
+
+        definition = {"metric": self.report.metric,
+                      "aggregate": self.report.aggregate}
+        if CONF.watch.state_dir:
+            self.store = checkpoint.Checkpoint(CONF.watch.state_dir).child(
+                json.dumps(definition, sort_keys=True, default=str))
+        else:
+            self.store = checkpoint.MemoryCheckpoint()
+        # 'mark': end time covered by the sums, 'sums': sums of each
+        # collector call, 'metrics': last values of each metric
+        self.state = (self.store.get("watch", "state") or
+                      {"mark": None, "sums": {}, "metrics": {}})
+
+    def _is_incremental(self, conf, collector, kwargs):
+        if "compare" in conf:
+            return False
+        if conf["metric"] not in self.INCREMENTAL_METRICS:
+            return False
+        if "end_time_after" not in getattr(collector, "FIELD_MAPPING", {}):
+            return False
+        # The efficiency of the 'others' cannot be derived from the sums
+        return not (conf["metric"] == "efficiency" and kwargs.get("top"))
+
+    def _gather(self, title, i, conf, collector, group_by, kwargs, mark,
+                sums):
+        """Returns the values of a collector call up to 'mark'.
+
+        The sums of the call are replaced in 'sums', never modified.
+        """
+        kwargs = dict(kwargs, end_time=utils.format_time(mark))
+        kwargs.pop("fan_out", None)
+        if not self._is_incremental(conf, collector, kwargs):
+            if "compare" in conf:
+                return compare.Comparison(title, conf).get(
+                    collector, conf["metric"], group_by, **kwargs)
+            return collector.get(conf["metric"], group_by, **kwargs)
+
+        top = kwargs.pop("top", None)
+        if self.state["mark"]:
+            kwargs["end_time_after"] = utils.format_time(self.state["mark"])
+        call_sums = dict(sums.get((title, i), {}))
+        for metric in self.INCREMENTAL_METRICS[conf["metric"]]:
+            delta = collector.get(metric, group_by, **kwargs)
+            if metric in call_sums:
+                delta = call_sums[metric].merge(delta)
+            call_sums[metric] = delta
+        sums[(title, i)] = call_sums
+
+        if conf["metric"] == "efficiency":
+            return call_sums["cpu"].ratio(call_sums["wallclock"], 100)
+        return utils.fold_top(call_sums[conf["metric"]], top)
+
+    def _render(self, changed):
+        for title in changed:
+            self.store.discard("page", title)
+        renderer = achus.renderer.Renderer()
+        renderer.checkpoint = self.store
+        for title, conf in self.report.metric.iteritems():
+            metric = self.state["metrics"].get(title)
+            if metric is not None:
+                renderer.append_metric(title, metric, conf)
+        renderer.render_to_file(CONF.renderer.output_file)
+        self.rendered = True
+
+    def refresh(self, now=None):
+        """Brings the report up to date, returning the metrics changed.
+
+        The report is only rendered again if any of them changed. The
+        state is only updated once all the metrics are gathered, so a
+        failed refresh is simply retried by the next one.
+        """
+        now = (now or datetime.datetime.now()) - self.lag
+        start = utils.period_start(now, self.period)
+        end = utils.shift_period(start, self.period, 1)
+        if self.window != (start, end):
+            logger.info("Watching the period from %s to %s" % (start, end))
+            self._load(start, end)
+
+        sums = dict(self.state["sums"])
+        metrics = dict(self.state["metrics"])
+        changed = []
+        for title, conf, collector, calls in self.report.get_collector_calls():
+            metric = None
+            for i, (group_by, kwargs) in enumerate(calls):
+                metric = self._gather(title, i, conf, collector, group_by,
+                                      kwargs, now, sums)
+            if metric != metrics.get(title):
+                changed.append(title)
+                metrics[title] = metric
+        self.state = {"mark": now, "sums": sums, "metrics": metrics}
+        self.store.save("watch", "state", self.state)
+        logger.info("Metrics changed: %s" % (changed or "none"))
+
+        if changed or not self.rendered:
+            self._render(changed)
+        return changed
+
+    def run_forever(self):
+        """Refreshes the report every 'interval' seconds."""
+        while True:
+            started = time.time()
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Cannot refresh the report")
+            time.sleep(max(CONF.watch.interval - (time.time() - started),
+                           0))